@@ -1,59 +1,304 @@
 import curses
+import selectors
+import sys
 import threading
+import time
+from typing import Any
 
-import minimux.utils as utils
-from minimux.colour import ColourManager
+import minimux.width as width
 from minimux.config import Command, Config, Element, Panel
-from minimux.runner import Runner
+from minimux.layout import Layout
+from minimux.runner import Runner, stop_all, stop_signals
+from minimux.scheduler import Scheduler
+from minimux.screen import AnsiScreen, CursesScreen, Screen, Window
+from minimux.stats import SAMPLE_INTERVAL, Stats, StatsFile, describe
 
 __version__ = "1.3.0"
 __version_info__ = (1, 3, 0)
 __author__ = "Dominic Price"
 
+# the number of seconds to wait after the terminal is resized before
+# redrawing it
+RESIZE_DELAY = 0.1
+
 
 class MiniMux:
     def __init__(
         self,
         config: Config,
+        stats: str | None = None,
+        screen: Screen | None = None,
     ):
-        self.cm = ColourManager()
+        if screen is None:
+            screen = AnsiScreen() if config.renderer == "ansi" else CursesScreen()
+        self.screen = screen
+        self.cm = self.screen.colour_manager()
         self.config = config
-        self.lock = threading.Lock()
+        # the lock held while drawing, which the colour manager also
+        # holds while defining colours on the threads reading output
+        self.lock = self.cm.lock
+        self.stopped = threading.Event()
         self.runners: dict[str, Runner] = {}
+        self.focused = 0
+
+        # counters for the screen as a whole, optionally shown in a
+        # status line and written to a file
+        self.stats = Stats("lock_wait", "frames")
+        self.stats_file = StatsFile(stats) if stats is not None else None
+        self.next_sample = 0.0
+        self.show_stats = False
+        self.status_win: Window | None = None
+        self.status_dirty = False
+
+        # where everything is drawn, solved again when the screen size
+        # changes, and the time at which to redraw the screen after it
+        # was last resized
+        self.layout: Layout | None = None
+        self.stdscr: Window | None = None
+        self.resize_at: float | None = None
 
     def run(self):
         """The main entrypoint"""
-        curses.wrapper(self._run)
-
-    def _run(self, stdscr: "curses._CursesWindow"):
-        curses.curs_set(False)
-        curses.use_default_colors()
+        self.screen.wrapper(self._run)
 
+    def _run(self, stdscr: Window):
         self.runners = self.get_runners(self.config.content)
+        self.scheduler = Scheduler(self.runners)
+        self.focus(0)
+        with stop_signals():
+            try:
+                if self.config.engine == "selectors":
+                    self.run_selectors(stdscr)
+                else:
+                    self.run_threads(stdscr)
+            except KeyboardInterrupt:
+                # keyboard interrupts are a normal way to exit
+                pass
+            finally:
+                # stop all runners and wait for them to terminate
+                # before exiting curses mode to avoid leaving the
+                # terminal in a bad state
+                self.stopped.set()
+                stdscr.clear()
+                stop_all(
+                    list(self.runners.values()),
+                    self.config.stop_timeout,
+                    lambda: self.draw_shutdown(stdscr),
+                )
+                for runner in self.runners.values():
+                    runner.close()
+
+    def draw_shutdown(self, stdscr: Window):
+        """Draw how far each runner has got with exiting"""
+        rows, cols = stdscr.getmaxyx()
+        lines = ["Terminating..."]
         for runner in self.runners.values():
+            lines.append(f"{runner.command.label}: {runner.describe_exit()}")
+        stdscr.erase()
+        top = max(0, (rows - len(lines)) // 2)
+        for y, line in enumerate(lines[: rows - top], top):
+            try:
+                stdscr.addstr(y, 0, width.center(line, cols))
+            except curses.error:
+                # the bottom right cell is still written
+                pass
+        stdscr.refresh()
+
+    def run_threads(self, stdscr: Window):
+        """Run each runner on its own thread, with a separate thread
+        for rendering and the calling thread handling user input"""
+        for runner in self.scheduler.due():
             runner.start()
         self.init(stdscr)
+        threading.Thread(target=self.render, daemon=True).start()
+
+        while True:
+            self.handle_input(stdscr, stdscr.getch())
+
+    def run_selectors(self, stdscr: Window):
+        """Multiplex the output of all runners, user input and
+        rendering on the calling thread"""
+        sel = selectors.DefaultSelector()
 
+        def start(runners: list[Runner]):
+            for runner in runners:
+                if runner.spawn():
+                    sel.register(runner.fileno(), selectors.EVENT_READ, runner)
+
+        start(self.scheduler.due())
         try:
-            # handle user input
-            while True:
-                if stdscr.getch() == curses.KEY_RESIZE:
-                    self.init(stdscr)
-        except KeyboardInterrupt:
-            # keyboard interrupts are a normal way to exit
+            sel.register(sys.stdin.fileno(), selectors.EVENT_READ, None)
+        except PermissionError:
+            # files such as /dev/null cannot be waited on, so input is
+            # only checked for once each time round the loop
             pass
-        finally:
-            # kill all runners and wait for them to terminate
-            # before exiting curses mode to avoid leaving the
-            # terminal in a bad state
-            rows, cols = stdscr.getmaxyx()
-            wait_fns = [runner.terminate() for runner in self.runners.values()]
-            stdscr.clear()
-            stdscr.move(rows // 2, 0)
-            stdscr.addstr("Terminating...".center(cols))
-            stdscr.refresh()
-            for wait_fn in wait_fns:
-                wait_fn()
+        stdscr.nodelay(True)
+        self.init(stdscr)
+
+        interval = 1 / self.config.fps
+        next_frame = time.monotonic() + interval
+        exiting: list[Runner] = []
+        while True:
+            # the timeout also covers resizes, which do not wake select
+            timeout = max(0.0, next_frame - time.monotonic())
+            for key, _ in sel.select(timeout):
+                runner = key.data
+                if runner is None:
+                    continue
+                data = runner.read()
+                if data:
+                    runner.feed(data)
+                else:
+                    sel.unregister(key.fd)
+                    runner.finish()
+                    exiting.append(runner)
+            exiting = [runner for runner in exiting if not runner.reap()]
+            start(self.scheduler.due())
+
+            while (ch := stdscr.getch()) != -1:
+                self.handle_input(stdscr, ch)
+
+            now = time.monotonic()
+            if now >= next_frame:
+                self.paint()
+                next_frame = now + interval
+
+    def handle_input(self, stdscr: Window, ch: int):
+        if ch == curses.KEY_RESIZE:
+            # dragging the edge of a terminal resizes it many times, so
+            # wait for it to settle before redrawing
+            self.resize_at = time.monotonic() + RESIZE_DELAY
+            return
+        if not self.runners:
+            return
+
+        runner = list(self.runners.values())[self.focused]
+        runner.message = None
+        if runner.prompt is not None:
+            self.handle_prompt(runner, ch)
+            return
+
+        page = max(1, runner.buf.maxrows - 1)
+        if ch == ord("s"):
+            self.show_stats = not self.show_stats
+            self.init(stdscr)
+        elif ch == ord("\t"):
+            self.focus(self.focused + 1)
+        elif ch == curses.KEY_BTAB:
+            self.focus(self.focused - 1)
+        elif ch == curses.KEY_PPAGE:
+            runner.buf.scroll(-page)
+        elif ch == curses.KEY_NPAGE:
+            runner.buf.scroll(page)
+        elif ch == curses.KEY_UP:
+            runner.buf.scroll(-1)
+        elif ch == curses.KEY_DOWN:
+            runner.buf.scroll(1)
+        elif ch == curses.KEY_HOME:
+            runner.buf.home()
+        elif ch == curses.KEY_END:
+            runner.buf.follow()
+        elif ch == ord("/"):
+            runner.prompt = ""
+        elif ch == ord("n"):
+            runner.search(older=True)
+        elif ch == ord("N"):
+            runner.search(older=False)
+        runner.notify()
+
+    def handle_prompt(self, runner: Runner, ch: int):
+        """Edit the search query being typed into a runner's prompt"""
+        assert runner.prompt is not None
+        if ch in (ord("\n"), ord("\r"), curses.KEY_ENTER):
+            runner.query, runner.prompt = runner.prompt, None
+            runner.buf.match = None
+            runner.search()
+        elif ch == 27:
+            # escape cancels the search
+            runner.prompt = None
+        elif ch in (curses.KEY_BACKSPACE, 127, 8):
+            runner.prompt = runner.prompt[:-1]
+        elif 32 <= ch < 127:
+            runner.prompt += chr(ch)
+        runner.notify()
+
+    def focus(self, i: int):
+        """Move keyboard focus to the ith runner"""
+        if not self.runners:
+            return
+        runners = list(self.runners.values())
+        runners[self.focused].focus(False)
+        self.focused = i % len(runners)
+        runners[self.focused].focus(True)
+        self.status_dirty = self.show_stats
+
+    def render(self):
+        """Repaint any runners which have received output since the
+        last frame, at most fps times per second"""
+        interval = 1 / self.config.fps
+        while not self.stopped.wait(interval):
+            for runner in self.scheduler.due():
+                runner.start()
+            self.paint()
+
+    def paint(self):
+        """Repaint any runners which have received output since the
+        last paint"""
+        self.sample()
+        with self.stats.locked(self.lock):
+            if self.resize_at is not None:
+                if time.monotonic() < self.resize_at or self.stdscr is None:
+                    return
+                self.resize_at = None
+                self._init(self.stdscr)
+            dirty = [r for r in self.runners.values() if r.dirty]
+            if not dirty and not self.status_dirty:
+                return
+            for runner in dirty:
+                runner.drain()
+                runner.flush()
+            if self.status_dirty:
+                self.draw_status()
+            self.screen.doupdate()
+        self.stats.add("frames")
+
+    def sample(self):
+        """Sample the counters if it has been long enough since they
+        were last sampled, updating the status line and stats file"""
+        now = time.monotonic()
+        if now < self.next_sample:
+            return
+        self.next_sample = now + SAMPLE_INTERVAL
+        self.stats.sample(now)
+        for runner in self.runners.values():
+            runner.stats.sample(now)
+        self.status_dirty = self.show_stats
+        if self.stats_file is not None:
+            self.stats_file.write(self.snapshot())
+
+    def snapshot(self) -> dict[str, Any]:
+        """The counters for the screen and each runner"""
+        return {
+            **self.stats.snapshot(),
+            "runners": {
+                runner.command.filename: runner.snapshot()
+                for runner in self.runners.values()
+            },
+        }
+
+    def draw_status(self):
+        """Draw the counters of the focused runner to the status line.
+        Must be called with the lock held"""
+        self.status_dirty = False
+        if self.status_win is None or not self.runners:
+            return
+        runner = list(self.runners.values())[self.focused]
+        text = describe(runner.command.label, runner.stats)
+        text += f"  lock wait {self.stats.rates['lock_wait'] * 1000:.1f}ms/s"
+        cols = self.status_win.getmaxyx()[1]
+        self.status_win.erase()
+        self.status_win.insstr(0, 0, width.truncate(text, cols))
+        self.status_win.noutrefresh()
 
     def get_runners(self, content: Element) -> dict[str, Runner]:
         if isinstance(content, Panel):
@@ -66,176 +311,40 @@ class MiniMux:
         else:
             raise TypeError
 
-    def init(self, stdscr: "curses._CursesWindow"):
+    def init(self, stdscr: Window):
+        with self.stats.locked(self.lock):
+            self._init(stdscr)
+
+    def _init(self, stdscr: Window):
+        self.stdscr = stdscr
+        self.screen.fit()
         rows, cols = stdscr.getmaxyx()
         stdscr.clear()
 
-        start_row = 0
+        self.status_win = None
+        if self.show_stats and rows > 1:
+            rows -= 1
+            self.status_win = stdscr.subwin(1, cols, rows, 0)
+            attr = self.config.title_attr(self.cm) | curses.A_REVERSE
+            self.status_win.bkgdset(" ", attr)
+            self.status_dirty = True
+
+        if self.layout is None or (self.layout.rows, self.layout.cols) != (rows, cols):
+            self.layout = Layout.solve(self.config, rows, cols)
         if self.config.title:
             stdscr.move(0, 0)
             stdscr.addstr(
-                self.config.title.center(cols),
+                width.center(self.config.title, cols),
                 self.config.title_attr(self.cm),
             )
-            self.hsep(stdscr, 1, 0, cols)
-            start_row = 2
-
-        self.init_content(
-            stdscr,
-            self.config.content,
-            (start_row, rows),
-            (0, cols),
-        )
-        stdscr.refresh()
-
-    def init_content(
-        self,
-        stdscr: "curses._CursesWindow",
-        content: Element,
-        range_y: tuple[int, int],
-        range_x: tuple[int, int],
-    ):
-        """Recursively draw the static components for content and
-        initialise the runners for any commands"""
-        if isinstance(content, Panel):
-            self.init_panel(stdscr, content, range_y, range_x)
-        elif isinstance(content, Command):
-            self.init_command(stdscr, content, range_y, range_x)
-        else:
-            raise TypeError
-
-    def init_panel(
-        self,
-        stdscr: "curses._CursesWindow",
-        panel: Panel,
-        range_y: tuple[int, int],
-        range_x: tuple[int, int],
-    ):
-        """Recursively draw the static components for a panel and
-        initialise the runners from any commands"""
-        if len(panel.children) == 0:
-            return []
-
-        if panel.vertical:
-            o = range_y[0]
-            subh = (range_y[1] - range_y[0]) // sum(c.weight for c in panel.children)
-            i = 0
-            for child in panel.children:
-                subrange_y = (o + i * subh, o + (i + child.weight) * subh)
-                if i == len(panel.children) - 1:
-                    subrange_y = (subrange_y[0], range_y[1])
-                if i != 0:
-                    self.hsep(
-                        stdscr,
-                        subrange_y[0],
-                        range_x[0],
-                        range_x[1] - range_x[0],
-                    )
-                    subrange_y = (subrange_y[0] + 1, subrange_y[1])
-                i += child.weight
-                self.init_content(stdscr, child, subrange_y, range_x)
-        else:
-            i = 0
-            o = range_x[0]
-            subw = (range_x[1] - range_x[0]) // sum(c.weight for c in panel.children)
-            for child in panel.children:
-                subrange_x = (o + i * subw, o + (i + child.weight) * subw)
-                subrange_y = range_y
-                if i == len(panel.children) - 1:
-                    subrange_x = (subrange_x[0], range_x[1])
-                if i != 0:
-                    self.vsep(
-                        stdscr,
-                        range_y[0],
-                        subrange_x[0],
-                        range_y[1] - range_y[0],
-                    )
-                    subrange_x = (subrange_x[0] + 1, subrange_x[1])
-                self.init_content(stdscr, child, subrange_y, subrange_x)
-                i += child.weight
-
-    def init_command(
-        self,
-        stdscr: "curses._CursesWindow",
-        command: Command,
-        range_y: tuple[int, int],
-        range_x: tuple[int, int],
-    ):
-        """Draw the static components for a command initialise the
-        associated runner"""
-        if command.title is not None:
-            stdscr.move(range_y[0], range_x[0])
-            stdscr.addstr(" " * (range_x[1] - range_x[0]), command.attr(self.cm))
-            self.center(
-                stdscr,
-                command.title,
-                range_y[0],
-                range_x[0],
-                range_x[1] - range_x[0],
-                command.title_attr(self.cm),
-            )
-            range_y = (range_y[0] + 1, range_y[1])
-        self.runners[command.name].init(
-            stdscr,
-            (
-                range_y[1] - range_y[0],
-                range_x[1] - range_x[0],
-                range_y[0],
-                range_x[0],
-            ),
-        )
-
-    def center(
-        self,
-        win: "curses._CursesWindow",
-        s: str,
-        y: int,
-        x: int,
-        n: int,
-        attr: int,
-    ):
-        pad_left = (n - len(s)) // 2
-        win.move(y, x + pad_left)
-        win.addstr(s, attr)
-
-    def hsep(self, stdscr: "curses._CursesWindow", y: int, x: int, n: int):
-        """Draw a horizontal seperator line, combining with existing
-        separators to form tees and crosses"""
         attr = self.config.sep_attr(self.cm)
-        if x > 0 and utils.compare_char(stdscr.inch(y, x - 1), curses.ACS_SBSB):
-            x -= 1
-            n += 1
-        for i in range(n):
-            stdscr.move(y, x + i)
-            cross = utils.compare_char(stdscr.inch(y, x + i), curses.ACS_SBSB)
-            if cross:
-                if i == 0:
-                    stdscr.addch(curses.ACS_SSSB, attr)
-                elif i == n - 1:
-                    stdscr.addch(curses.ACS_SBSS, attr)
-                else:
-                    stdscr.addch(curses.ACS_SSSS, attr)
-            else:
-                stdscr.addch(curses.ACS_BSBS, attr)
-        stdscr.noutrefresh()
-
-    def vsep(self, stdscr: "curses._CursesWindow", y: int, x: int, n: int):
-        """Draw a vertical seperator line, combining with existing
-        separators to form tees and crosses"""
-        attr = self.config.sep_attr(self.cm)
-        if y > 0 and utils.compare_char(stdscr.inch(y - 1, x), curses.ACS_BSBS):
-            y -= 1
-            n += 1
-        for i in range(n):
-            cross = utils.compare_char(stdscr.inch(y + i, x), curses.ACS_BSBS)
-            stdscr.move(y + i, x)
-            if cross:
-                if i == 0:
-                    stdscr.addch(curses.ACS_BSSS, attr)
-                elif i == n - 1:
-                    stdscr.addch(curses.ACS_SSBS, attr)
-                else:
-                    stdscr.addch(curses.ACS_SSSS, attr)
-            else:
-                stdscr.addch(curses.ACS_SBSB, attr)
+        for (y, x), name in self.layout.separators.items():
+            stdscr.addch(y, x, self.screen.acs(name), attr)
+        for command, bounds in self.layout.panes:
+            self.runners[command.name].init(stdscr, bounds)
         stdscr.noutrefresh()
+        for runner in self.runners.values():
+            runner.flush()
+        if self.status_dirty:
+            self.draw_status()
+        self.screen.doupdate()
@@ -1,9 +1,11 @@
+import sys
 from pathlib import Path
 
 import click
 
 from minimux import MiniMux, __version__
 from minimux.config import Config, MiniMuxConfigParser
+from minimux.headless import Headless
 
 
 @click.command("minimux")
@@ -17,16 +19,56 @@ from minimux.config import Config, MiniMuxConfigParser
     ),
     default=Path("./minimux.ini"),
 )
-def main(config_file: Path):
+@click.option(
+    "--headless",
+    is_flag=True,
+    help="Stream the output of the commands instead of displaying them.",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="With --headless, write the output of each command to its own "
+    "file in this directory instead of to stdout.",
+)
+@click.option(
+    "--colour",
+    type=click.Choice(["auto", "always", "never"]),
+    default="auto",
+    help="With --headless, whether to colour the output using ANSI escape "
+    "sequences. By default only output to a terminal is coloured.",
+)
+@click.option(
+    "--stats",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write a JSON snapshot of performance counters to this file every second.",
+)
+def main(
+    config_file: Path,
+    headless: bool,
+    output: Path | None,
+    colour: str,
+    stats: str | None,
+):
     # load config
     parser = MiniMuxConfigParser()
     with open(config_file) as f:
         parser.read_file(f)
     config = Config.from_parser(parser)
 
+    if headless:
+        if colour == "auto":
+            colour = "always" if output is None and sys.stdout.isatty() else "never"
+        try:
+            exit(Headless(config, output, colour == "always", stats).run())
+        except Exception as e:
+            exit(str(e))
+
     # run
     try:
-        minimux = MiniMux(config)
+        minimux = MiniMux(config, stats)
         minimux.run()
     except Exception as e:
         exit(str(e))
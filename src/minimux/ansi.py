@@ -0,0 +1,143 @@
+import curses
+import re
+
+from minimux.buffer import RowAttr, Runs
+from minimux.colour import ColourManager
+
+# an escape sequence: a control sequence, capturing its parameters and
+# final character, an operating system command, or any other escape
+ESCAPE = re.compile(
+    r"\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)?|[ -/]*[0-~])?"
+)
+
+_PARAMS = re.compile(r"[;:]")
+
+# the attributes set and cleared by SGR parameters
+_SET = {
+    1: curses.A_BOLD,
+    2: curses.A_DIM,
+    4: curses.A_UNDERLINE,
+    5: curses.A_BLINK,
+    7: curses.A_REVERSE,
+}
+_CLEAR = {
+    22: curses.A_BOLD | curses.A_DIM,
+    24: curses.A_UNDERLINE,
+    25: curses.A_BLINK,
+    27: curses.A_REVERSE,
+}
+
+
+class SgrParser:
+    """Removes the escape sequences from lines of output, turning the
+    SGR sequences which select colours and attributes into the runs of
+    attributes used to highlight lines. Every other escape sequence,
+    such as those which move the cursor, is discarded. The attributes
+    selected carry on from one line to the next, as in a terminal"""
+
+    def __init__(self, colour_manager: ColourManager):
+        self.cm = colour_manager
+        self.fg: int | None = None
+        self.bg: int | None = None
+        self.flags = 0
+        self.attr = 0
+        self.attrs: dict[tuple[int | None, int | None, int], int] = {}
+
+    def parse_lines(self, lines: list[str]) -> tuple[list[str], list[RowAttr] | None]:
+        """The lines without escape sequences and their attributes, or
+        None for the attributes if every line has the default ones"""
+        if self.attr == 0 and "\x1b" not in "".join(lines):
+            # plain output needs no more work
+            return lines, None
+        text: list[str] = []
+        attrs: list[RowAttr] = []
+        for line in lines:
+            if "\x1b" in line:
+                line, attr = self.parse(line)
+            else:
+                attr = self.attr
+            text.append(line)
+            attrs.append(attr)
+        return text, attrs
+
+    def parse(self, line: str) -> tuple[str, RowAttr]:
+        """A line without escape sequences and its attributes"""
+        parts: list[str] = []
+        offsets: list[int] = []
+        attrs: list[int] = []
+        length = 0
+        pos = 0
+        for m in ESCAPE.finditer(line):
+            start = m.start()
+            if start > pos:
+                if not attrs or attrs[-1] != self.attr:
+                    offsets.append(length)
+                    attrs.append(self.attr)
+                parts.append(line[pos:start])
+                length += start - pos
+            pos = m.end()
+            if m.group(2) == "m":
+                self.select(m.group(1))
+        if pos < len(line):
+            if not attrs or attrs[-1] != self.attr:
+                offsets.append(length)
+                attrs.append(self.attr)
+            parts.append(line[pos:])
+
+        if not attrs:
+            return "", self.attr
+        if len(attrs) == 1:
+            return "".join(parts), attrs[0]
+        return "".join(parts), Runs(offsets, attrs)
+
+    def select(self, params: str):
+        """Apply the parameters of an SGR sequence"""
+        try:
+            codes = [int(p) if p else 0 for p in _PARAMS.split(params)]
+        except ValueError:
+            # private sequences are not SGR
+            return
+        i = 0
+        while i < len(codes):
+            code = codes[i]
+            i += 1
+            if code == 0:
+                self.fg = self.bg = None
+                self.flags = 0
+            elif code in _SET:
+                self.flags |= _SET[code]
+            elif code in _CLEAR:
+                self.flags &= ~_CLEAR[code]
+            elif 30 <= code <= 37:
+                self.fg = code - 30
+            elif 40 <= code <= 47:
+                self.bg = code - 40
+            elif 90 <= code <= 97:
+                self.fg = self.cm.indexed(code - 82)
+            elif 100 <= code <= 107:
+                self.bg = self.cm.indexed(code - 92)
+            elif code == 39:
+                self.fg = None
+            elif code == 49:
+                self.bg = None
+            elif code in (38, 48):
+                colour, i = self._colour(codes, i)
+                if code == 38:
+                    self.fg = colour
+                else:
+                    self.bg = colour
+
+        key = (self.fg, self.bg, self.flags)
+        if key not in self.attrs:
+            self.attrs[key] = self.cm.make_pair(self.fg, self.bg) | self.flags
+        self.attr = self.attrs[key]
+
+    def _colour(self, codes: list[int], i: int) -> tuple[int | None, int]:
+        """Parse an extended colour from the parameters at i, returning
+        it and the index of the parameter after it"""
+        if i < len(codes) and codes[i] == 5 and i + 1 < len(codes):
+            return self.cm.indexed(min(codes[i + 1], 255)), i + 2
+        if i < len(codes) and codes[i] == 2 and i + 3 < len(codes):
+            r, g, b = (min(c, 255) for c in codes[i + 1 : i + 4])
+            return self.cm.make_colour(r, g, b), i + 4
+        return None, len(codes)
@@ -0,0 +1,444 @@
+"""Benchmarks for ingesting, matching and rendering output.
+
+Run with `python -m minimux.bench`, optionally saving the results to a
+JSON file which later runs can be compared against to catch
+regressions."""
+
+import json
+import os
+import platform
+import random
+import re
+import selectors
+import sys
+import tempfile
+import threading
+import time
+import unittest.mock
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable
+
+import click
+
+import minimux
+from minimux.buffer import Buffer
+from minimux.colour import AnsiColourManager, ColourManager
+from minimux.config import Command, Config
+from minimux.rules import LiteralRule, RegexRule, Rule, RuleSet
+from minimux.runner import Runner
+
+# a benchmark is set up with a scale factor, and returns a function
+# which does the work being measured and returns how many items it
+# processed
+Benchmark = Callable[[int], Callable[[], int]]
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    def register(fn: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+
+_LEVELS = ["DEBUG", "INFO", "INFO", "INFO", "WARN", "ERROR"]
+_PATHS = ["/api/users", "/api/orders", "/health", "/static/app.js", "/login"]
+_WORDS = "request handled cache miss retry connection pool worker job queue".split()
+
+
+def corpus(n: int, seed: int = 0) -> list[str]:
+    """Generate lines resembling the logs of a web service, the same
+    every time for a given seed"""
+    rng = random.Random(seed)
+    lines: list[str] = []
+    for i in range(n):
+        level = rng.choice(_LEVELS)
+        ts = f"2024-05-01T12:{i // 60 % 60:02d}:{i % 60:02d}.{rng.randrange(1000):03d}Z"
+        kind = rng.random()
+        if kind < 0.4:
+            line = (
+                f"{ts} {level} GET {rng.choice(_PATHS)}/{rng.randrange(10000)} "
+                f"{rng.choice([200, 200, 200, 201, 304, 404, 500])} "
+                f"{rng.randrange(1, 900)}ms"
+            )
+        elif kind < 0.7:
+            words = " ".join(rng.choice(_WORDS) for _ in range(rng.randrange(3, 12)))
+            line = f"{ts} {level} [worker-{rng.randrange(16)}] {words}"
+        elif kind < 0.9:
+            line = (
+                f'{ts} {level} {{"user": {rng.randrange(1 << 20)}, '
+                f'"action": "{rng.choice(_WORDS)}", "ok": {rng.random() < 0.9}}}'
+            )
+        elif kind < 0.98:
+            line = f"{ts} {level} " + "x" * rng.randrange(80, 300)
+        else:
+            line = "Traceback (most recent call last):"
+        lines.append(line)
+    return lines
+
+
+def make_rules(n: int) -> dict[Rule, int]:
+    """A mix of literal and regex rules, as might be configured to
+    highlight log levels, status codes and particular requests"""
+    rules: dict[Rule, int] = {}
+    candidates: list[Rule] = [
+        LiteralRule("ERROR", False),
+        LiteralRule("warn", True),
+        RegexRule(r"\s5\d\d\s", 0),
+        LiteralRule("Traceback", False),
+        RegexRule(r"worker-1[0-5]", 0, span=True),
+    ]
+    for i in range(n):
+        if i < len(candidates):
+            rule = candidates[i]
+        elif i % 2:
+            rule = LiteralRule(f"/api/users/{i}", False)
+        else:
+            rule = RegexRule(rf"user.: {i}\d+", 0)
+        rules[rule] = i + 1
+    return rules
+
+
+def _push(rules: int) -> Benchmark:
+    def setup(scale: int) -> Callable[[], int]:
+        lines = corpus(20000 * scale)
+
+        def run() -> int:
+            buf = Buffer(120, 50, make_rules(rules), scrollback=len(lines))
+            for line in lines:
+                buf.push(line)
+            return len(lines)
+
+        return run
+
+    return setup
+
+
+benchmark("buffer_push_0_rules")(_push(0))
+benchmark("buffer_push_5_rules")(_push(5))
+benchmark("buffer_push_50_rules")(_push(50))
+
+
+@benchmark("buffer_extend_5_rules")
+def bench_extend(scale: int) -> Callable[[], int]:
+    lines = corpus(20000 * scale)
+    chunks = [lines[i : i + 1000] for i in range(0, len(lines), 1000)]
+
+    def run() -> int:
+        buf = Buffer(120, 50, make_rules(5), scrollback=len(lines))
+        for chunk in chunks:
+            buf.extend(chunk)
+        return len(lines)
+
+    return run
+
+
+def _resize(wide: bool) -> Benchmark:
+    def setup(scale: int) -> Callable[[], int]:
+        lines = corpus(100000 * scale)
+        if wide:
+            # a tenth of the lines have wide characters, which must be
+            # measured cell by cell
+            lines = [
+                line + " 処理完了" if i % 10 == 0 else line
+                for i, line in enumerate(lines)
+            ]
+        buf = Buffer(120, 50, scrollback=len(lines))
+        buf.extend(lines)
+        widths = [80, 120, 200, 40, 120]
+
+        def run() -> int:
+            # resizing is lazy, so include the work of showing the pane
+            # and scrolling back through it at the new width
+            for width in widths:
+                buf.resize(maxcols=width)
+                buf.rows()
+                buf.seek(len(lines) // 2)
+                buf.rows()
+                buf.follow()
+            return len(widths)
+
+        return run
+
+    return setup
+
+
+benchmark("buffer_resize_deep_history")(_resize(False))
+benchmark("buffer_resize_wide_chars")(_resize(True))
+
+
+def _match(rule: Rule) -> Benchmark:
+    def setup(scale: int) -> Callable[[], int]:
+        lines = corpus(50000 * scale)
+
+        def run() -> int:
+            for line in lines:
+                rule.matches(line)
+            return len(lines)
+
+        return run
+
+    return setup
+
+
+benchmark("literal_rule_match")(_match(LiteralRule("Traceback", False)))
+benchmark("literal_rule_match_ignorecase")(_match(LiteralRule("error", True)))
+benchmark("regex_rule_match")(_match(RegexRule(r"\s5\d\d\s", 0)))
+
+
+@benchmark("rule_set_match_lines")
+def bench_match_lines(scale: int) -> Callable[[], int]:
+    lines = corpus(50000 * scale)
+    chunks = [lines[i : i + 1000] for i in range(0, len(lines), 1000)]
+    ruleset = RuleSet(make_rules(50))
+
+    def run() -> int:
+        for chunk in chunks:
+            ruleset.match_lines(chunk)
+        return len(lines)
+
+    return run
+
+
+@benchmark("colour_manager_make_pair")
+def bench_make_pair(scale: int) -> Callable[[], int]:
+    colours = [
+        f"#{r:02x}{g:02x}40" for r in range(0, 256, 16) for g in range(0, 256, 16)
+    ]
+    pairs = [(fg, bg) for fg in colours[:64] for bg in ("black", "white")] * scale
+
+    def run() -> int:
+        # there is no terminal, so stand in for curses' colour functions
+        with (
+            unittest.mock.patch("curses.init_color"),
+            unittest.mock.patch("curses.init_pair"),
+            unittest.mock.patch("curses.color_pair", lambda n: n << 8),
+        ):
+            cm = ColourManager()
+            for _ in range(10):
+                for fg, bg in pairs:
+                    cm.make_pair(fg, bg)
+        return 10 * len(pairs)
+
+    return run
+
+
+class FakeWindow:
+    """Enough of a curses window to draw runners to, recording nothing
+    but the number of characters written"""
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.written = 0
+
+    def subwin(self, rows: int, cols: int, y: int, x: int) -> "FakeWindow":
+        return FakeWindow(rows, cols)
+
+    def getmaxyx(self) -> tuple[int, int]:
+        return self.rows, self.cols
+
+    def addstr(self, text: str, attr: int = 0):
+        self.written += len(text)
+
+    def insstr(self, y: int, x: int, text: str, attr: int = 0):
+        self.written += len(text)
+
+    def _noop(self, *args: Any):
+        pass
+
+    bkgdset = idlok = setscrreg = erase = scrollok = scroll = _noop
+    move = clrtoeol = noutrefresh = _noop
+
+
+_END_TO_END = """
+[main]
+panels = a, b, c
+
+[a]
+title = A
+command = {command}
+rules = error, span
+
+[b]
+title = B
+command = {command}
+rules = error, span
+
+[c]
+title = C
+command = {command}
+rules = error, span
+overflow = drop-oldest
+
+[error]
+literal = ERROR
+fg = red
+
+[span]
+regex = worker-\\d+
+span = true
+fg = #80c0ff
+"""
+
+
+@benchmark("end_to_end_render")
+def bench_end_to_end(scale: int) -> Callable[[], int]:
+    """Several synthetic child processes writing as fast as they can,
+    read and rendered to fake windows at 60 frames per second as the
+    selectors engine does. Lines dropped by a pane which cannot keep up
+    are not counted, as they were never rendered"""
+    lines = corpus(50000 * scale)
+    text = "\n".join(lines) + "\n"
+
+    def run() -> int:
+        with tempfile.TemporaryDirectory() as tmp:
+            return run_in(os.path.join(tmp, "corpus.log"))
+
+    def run_in(path: str) -> int:
+        with open(path, "w") as f:
+            f.write(text)
+        script = f"import shutil, sys; shutil.copyfileobj(open({path!r}), sys.stdout)"
+        command = f"{sys.executable} -c {json.dumps(script)}"
+        config = Config.from_file(StringIO(_END_TO_END.format(command=command)))
+        commands: list[Command] = config.content.children  # type: ignore
+
+        cm = AnsiColourManager()
+        screen = FakeWindow(60, 240)
+        runners = [Runner(c, threading.RLock(), cm) for c in commands]
+        sel = selectors.DefaultSelector()
+        for i, runner in enumerate(runners):
+            runner.init(screen, (60, 80, 0, 80 * i))  # type: ignore
+            assert runner.spawn()
+            sel.register(runner.fileno(), selectors.EVENT_READ, runner)
+
+        open_fds = len(runners)
+        next_frame = time.monotonic()
+        while open_fds:
+            for key, _ in sel.select(max(0.0, next_frame - time.monotonic())):
+                data = key.data.read()
+                if data:
+                    key.data.feed(data)
+                else:
+                    sel.unregister(key.fd)
+                    key.data.finish()
+                    open_fds -= 1
+            if time.monotonic() >= next_frame:
+                for runner in runners:
+                    runner.drain()
+                    runner.flush()
+                next_frame = time.monotonic() + 1 / 60
+        for runner in runners:
+            assert runner.proc is not None
+            runner.proc.wait()
+            runner.drain()
+            runner.flush()
+        dropped = sum(r.queue.dropped for r in runners if r.queue is not None)
+        return len(lines) * len(runners) - dropped
+
+    return run
+
+
+def run_benchmarks(
+    names: list[str], scale: int = 1, repeat: int = 3
+) -> dict[str, dict[str, float]]:
+    """Run each benchmark several times, keeping the fastest time"""
+    results: dict[str, dict[str, float]] = {}
+    for name in names:
+        run = BENCHMARKS[name](scale)
+        best = float("inf")
+        items = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = run()
+            best = min(best, time.perf_counter() - start)
+        results[name] = {"seconds": best, "items": items, "per_second": items / best}
+    return results
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    """The names of the benchmarks which are slower than the baseline
+    by more than the tolerance, as a fraction"""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["per_second"] < baseline[name]["per_second"] * (1 - tolerance)
+    ]
+
+
+@click.command("minimux.bench")
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Save the results to this JSON file.",
+)
+@click.option(
+    "--compare",
+    "baseline_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Compare against results saved by an earlier run, failing if any "
+    "benchmark is slower by more than the tolerance.",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.2,
+    help="How much slower than the baseline a benchmark may be, as a fraction.",
+)
+@click.option("--scale", type=int, default=1, help="Multiply the size of each input.")
+@click.option("--repeat", type=int, default=3, help="The number of times to run each.")
+@click.option(
+    "--filter",
+    "-k",
+    "pattern",
+    default="",
+    help="Only run benchmarks whose names match this regex.",
+)
+def main(
+    output: Path | None,
+    baseline_file: Path | None,
+    tolerance: float,
+    scale: int,
+    repeat: int,
+    pattern: str,
+):
+    names = [name for name in BENCHMARKS if re.search(pattern, name)]
+    baseline: dict[str, dict[str, float]] = {}
+    if baseline_file is not None:
+        baseline = json.loads(baseline_file.read_text())["results"]
+
+    results = run_benchmarks(names, scale, repeat)
+    for name, result in results.items():
+        line = f"{name:32} {result['seconds'] * 1000:10.1f}ms {result['per_second']:14,.0f}/s"
+        if name in baseline:
+            ratio = result["per_second"] / baseline[name]["per_second"]
+            line += f"  {ratio:6.2f}x baseline"
+        click.echo(line)
+
+    if output is not None:
+        report = {
+            "minimux": minimux.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "results": results,
+        }
+        output.write_text(json.dumps(report, indent=2))
+
+    if slower := compare(results, baseline, tolerance):
+        exit("slower than the baseline: " + ", ".join(slower))
+
+
+if __name__ == "__main__":
+    main()
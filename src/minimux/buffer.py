@@ -1,37 +1,284 @@
+import bisect
+import itertools
 import threading
-from collections import deque
-from typing import Generator
+from array import array
+from typing import Generator, Iterable, TypeAlias
 
-from minimux.rules import Rule
+import minimux.width as width
+from minimux.fenwick import Fenwick
+from minimux.ring import Ring
+from minimux.rules import Rule, RuleSet
+from minimux.spill import SpillLog
+
+
+class Runs:
+    """The attributes of a row which is not uniformly coloured, stored
+    as parallel arrays of the offset at which each run starts and the
+    attribute of the run"""
+
+    __slots__ = ("offsets", "attrs")
+
+    def __init__(self, offsets: Iterable[int], attrs: Iterable[int]):
+        self.offsets = array("I", offsets)
+        self.attrs = array("q", attrs)
+
+    @classmethod
+    def from_attrs(cls, attrs: list[int]) -> "Runs | int":
+        """Compress per-character attributes into runs, returning a
+        plain attribute if they are all the same"""
+        offsets: list[int] = []
+        values: list[int] = []
+        i = 0
+        for attr, group in itertools.groupby(attrs):
+            offsets.append(i)
+            values.append(attr)
+            i += sum(1 for _ in group)
+        if len(values) == 1:
+            return values[0]
+        return cls(offsets, values)
+
+    @classmethod
+    def from_spans(
+        cls, length: int, attr: int, spans: list[tuple[int, int, int]]
+    ) -> "Runs | int":
+        """The runs of a row of the given length and attribute, with each
+        (start, end, attr) span painted over it in turn, returning a
+        plain attribute if they are all the same"""
+        if len(spans) == 1:
+            # by far the most common case
+            start, end, a = spans[0]
+            if start >= end or a == attr:
+                return attr
+            if start == 0 and end >= length:
+                return a
+            offsets = [0, start, end] if start > 0 else [0, end]
+            attrs = [attr, a, attr] if start > 0 else [a, attr]
+            if end >= length:
+                offsets.pop()
+                attrs.pop()
+            return cls(offsets, attrs)
+
+        offsets = [0]
+        attrs = [attr]
+        for start, end, a in spans:
+            if start >= end:
+                continue
+            # replace the runs starting within the span with the span,
+            # followed by whatever was showing at its end
+            i = bisect.bisect_right(offsets, start)
+            j = bisect.bisect_right(offsets, end)
+            after = attrs[j - 1]
+            if offsets[i - 1] == start:
+                i -= 1
+            if end < length:
+                offsets[i:j] = [start, end]
+                attrs[i:j] = [a, after]
+            else:
+                offsets[i:j] = [start]
+                attrs[i:j] = [a]
+
+        # merge neighbouring runs with the same attribute
+        merged_offsets: list[int] = []
+        merged_attrs: list[int] = []
+        for offset, a in zip(offsets, attrs):
+            if not merged_attrs or merged_attrs[-1] != a:
+                merged_offsets.append(offset)
+                merged_attrs.append(a)
+        if len(merged_attrs) == 1:
+            return merged_attrs[0]
+        return cls(merged_offsets, merged_attrs)
+
+    def slice(self, start: int, end: int) -> "Runs | int":
+        """The runs covering the characters from start to end, with
+        offsets relative to start"""
+        offsets: list[int] = []
+        attrs: list[int] = []
+        for i, offset in enumerate(self.offsets):
+            if offset >= end:
+                break
+            next_offset = self.offsets[i + 1] if i + 1 < len(self.offsets) else end
+            if next_offset <= start:
+                continue
+            offsets.append(max(offset - start, 0))
+            attrs.append(self.attrs[i])
+        if len(attrs) == 1:
+            return attrs[0]
+        return Runs(offsets, attrs)
+
+    def runs(self, length: int) -> Generator[tuple[int, int, int], None, None]:
+        """The start, end and attribute of each run in a row of the
+        given length"""
+        for i, offset in enumerate(self.offsets):
+            end = self.offsets[i + 1] if i + 1 < len(self.offsets) else length
+            yield offset, end, self.attrs[i]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Runs):
+            return False
+        return self.offsets == other.offsets and self.attrs == other.attrs
+
+    def __repr__(self) -> str:
+        return f"Runs({list(self.offsets)}, {list(self.attrs)})"
+
+
+RowAttr: TypeAlias = int | Runs
 
 
 class Buffer:
+    """The output of a command, stored as the logical lines which were
+    pushed. Lines are only wrapped to the width of the pane when they
+    are displayed, so resizing is cheap and loses nothing.
+
+    If a spill directory is given every line is also appended to a log on
+    disk, and lines which have been evicted from memory are read back
+    from it when scrolled to"""
+
     def __init__(
         self,
         maxcols: int,
         maxrows: int,
         rules: dict[Rule, int] | None = None,
+        match_cache: int = 0,
+        scrollback: int = 100000,
+        spill: str | None = None,
     ):
-        self.buf: deque[tuple[str, int]] = deque(maxlen=maxrows)
+        self.buf: Ring[Runs] = Ring(scrollback)
+        self.log = SpillLog(spill) if spill is not None else None
         self.maxcols = maxcols
+        self.maxrows = maxrows
+        self.appended = 0
         self.rules = rules if rules is not None else {}
+        line_rules = [r for r in self.rules if not r.span]
+        self.ruleset = RuleSet.shared(line_rules, match_cache)
+        self.attrs = [self.rules[r] for r in line_rules]
+        self.span_rules = [(r, a) for r, a in self.rules.items() if r.span]
+        self.span_literals = [r.literals() for r, _ in self.span_rules]
         self.lock = threading.Lock()
 
+        # the line and row within it at the top of the pane when
+        # scrolled back, or None when following the output
+        self.anchor: tuple[int, int] | None = None
+        # the line found by the last search
+        self.match: int | None = None
+
+        # the number of rows each line wraps to at index_width, built
+        # when first needed and then kept up to date lazily
+        self.index: Fenwick | None = None
+        self.index_width = 0
+        self.indexed = 0
+
+    def close(self):
+        """Close the spill log, if there is one, once no more lines are
+        needed from it"""
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+
     def push(self, data: str):
         with self.lock:
-            if self.maxcols == 0:
-                return
+            attr = self._match(data)
+            for line in data.splitlines(keepends=False):
+                self._append(line, self._highlight(line, attr))
 
-            attr = 0
-            for rule, a in self.rules.items():
-                if rule.matches(data):
-                    attr = a
-                    break
+    def extend(self, lines: list[str], attrs: list[RowAttr] | None = None):
+        """Push a batch of lines, with rules applied to each line
+        individually unless their attributes are given"""
+        if attrs is None:
+            attrs = self.highlight_lines(lines)
+        with self.lock:
+            for line, attr in zip(lines, attrs):
+                self._append(line, attr)
 
-            for line in data.splitlines(keepends=False):
-                while len(line) > 0:
-                    b, line = line[: self.maxcols], line[self.maxcols :]
-                    self.buf.append((b, attr))
+    def highlight(self, line: str) -> RowAttr:
+        """The attribute of a line after applying the rules"""
+        return self._highlight(line, self._match(line))
+
+    def highlight_lines(
+        self, lines: list[str], base: list[RowAttr] | None = None
+    ) -> list[RowAttr]:
+        """The attributes of a batch of lines after applying the rules,
+        looking for the rules in the whole batch at once. Rules are
+        applied over the base attributes of each line, if given"""
+        matched = [
+            self.attrs[i] if i is not None else 0
+            for i in self.ruleset.match_lines(lines)
+        ]
+        attrs: list[RowAttr] = list(matched)
+        if base is not None:
+            attrs = [m or b for m, b in zip(matched, base)]
+        if not self.span_rules:
+            return attrs
+
+        # only span rules which may match somewhere in the batch need to
+        # be applied to each line
+        text = "\n".join(lines)
+        ascii = text.isascii()
+        folded = text.casefold() if ascii else text
+        span_rules: list[tuple[Rule, int]] = []
+        for rule, literals in zip(self.span_rules, self.span_literals):
+            if literals is None or (literals[1] and not ascii):
+                span_rules.append(rule)
+            elif any(lit in (folded if literals[1] else text) for lit in literals[0]):
+                span_rules.append(rule)
+        if not span_rules:
+            return attrs
+
+        # apply in reverse so that earlier rules take priority
+        rule_spans = [(rule.spans_lines(lines), a) for rule, a in reversed(span_rules)]
+        for k, line in enumerate(lines):
+            spans = [(start, end, a) for s, a in rule_spans for start, end in s[k]]
+            if not spans:
+                continue
+            attr = attrs[k]
+            if isinstance(attr, Runs):
+                spans = list(attr.runs(len(line))) + spans
+                attr = 0
+            attrs[k] = Runs.from_spans(len(line), attr, spans)
+        return attrs
+
+    def _match(self, data: str) -> int:
+        i = self.ruleset.match(data)
+        return self.attrs[i] if i is not None else 0
+
+    def _highlight(self, line: str, attr: int) -> RowAttr:
+        """Apply any span rules on top of the attribute for the whole
+        line"""
+        if not self.span_rules:
+            return attr
+
+        # apply in reverse so that earlier rules take priority
+        spans = [
+            (start, end, a)
+            for rule, a in reversed(self.span_rules)
+            for start, end in rule.spans(line)
+        ]
+        if not spans:
+            return attr
+        return Runs.from_spans(len(line), attr, spans)
+
+    def _append(self, line: str, attr: RowAttr):
+        if len(line) == 0:
+            return
+        self.buf.append(line, attr)
+        if self.log is not None:
+            self.log.append(line)
+        if self.maxcols > 0:
+            self.appended += self._text_rows(line)
+
+    def wrap(self, line: str, attr: RowAttr) -> list[tuple[str, RowAttr]]:
+        """Split a logical line into rows of the current width, measured
+        in cells so that wide characters do not overflow the pane"""
+        if len(line) <= self.maxcols and (
+            line.isascii() or width.width(line) <= self.maxcols
+        ):
+            return [(line, attr)]
+        rows: list[tuple[str, RowAttr]] = []
+        for start, end in width.split(line, self.maxcols):
+            if isinstance(attr, Runs):
+                rows.append((line[start:end], attr.slice(start, end)))
+            else:
+                rows.append((line[start:end], attr))
+        return rows
 
     def resize(
         self,
@@ -45,11 +292,297 @@ class Buffer:
             if maxrows is not None:
                 self.maxrows = maxrows
 
-            buf: deque[tuple[str, int]] = deque(maxlen=maxrows)
-            for line in self.buf:
-                buf.append((line[0][: self.maxcols], line[1]))
-            self.buf = buf
+    def rows(self) -> list[tuple[str, RowAttr]]:
+        """The rows which fit in the pane"""
+        with self.lock:
+            return self._rows()
+
+    def take_frame(self) -> tuple[list[tuple[str, RowAttr]], int]:
+        """The rows which fit in the pane, and the number of rows
+        appended since the last frame was taken. Appended rows are only
+        counted when following the output"""
+        with self.lock:
+            n, self.appended = self.appended, 0
+            if self.anchor is not None:
+                n = 0
+            return self._rows(), n
+
+    def _rows(self) -> list[tuple[str, RowAttr]]:
+        if self.maxcols <= 0 or self.maxrows <= 0:
+            return []
 
-    def __iter__(self) -> Generator[tuple[str, int], None, None]:
+        if self.anchor is not None:
+            # wrap lines forward from the anchor until the pane is full
+            seq, offset = self._clamp_anchor(self.anchor)
+            res: list[tuple[str, RowAttr]] = []
+            for line, attr in self._lines(seq):
+                if len(res) >= offset + self.maxrows:
+                    break
+                res.extend(self.wrap(line, attr))
+            return res[offset : offset + self.maxrows]
+
+        # only wrap as many of the most recent lines as are needed to
+        # fill the pane
+        wrapped: list[list[tuple[str, RowAttr]]] = []
+        n = 0
+        i = len(self.buf) - 1
+        while i >= 0 and n < self.maxrows:
+            rows = self.wrap(*self.buf[i])
+            wrapped.append(rows)
+            n += len(rows)
+            i -= 1
+        res = [row for rows in reversed(wrapped) for row in rows]
+        return res[-self.maxrows :]
+
+    @property
+    def following(self) -> bool:
+        return self.anchor is None
+
+    def scroll(self, delta: int):
+        """Scroll the pane by a number of rows, negative values
+        scrolling back through the history"""
+        with self.lock:
+            if self.maxcols <= 0 or self.maxrows <= 0:
+                return
+            index = self._sync_index()
+            last = max(0, index.total - self.maxrows)
+            self.match = None
+            if self.anchor is not None and self.anchor[0] < self.buf.first:
+                # rows of spilled lines are not indexed, so walk through
+                # them line by line
+                seq, offset = self._clamp_anchor(self.anchor)
+                if delta < 0:
+                    self.anchor = self._walk_back(seq, offset, -delta)
+                    return
+                anchor, remaining = self._walk_forward(seq, offset, delta)
+                if anchor is not None:
+                    self.anchor = anchor
+                else:
+                    self._seek(index, min(remaining, last))
+                return
+
+            top = last if self.anchor is None else self._anchor_row(index)
+            if top + delta < 0 and self._oldest() < self.buf.first:
+                self.anchor = self._walk_back(self.buf.first, 0, -top - delta)
+            else:
+                self._seek(index, min(max(top + delta, 0), last))
+
+    def seek(self, row: int):
+        """Scroll the pane so that the given row, counting from the
+        oldest retained row, is at the top"""
         with self.lock:
-            yield from self.buf
+            if self.maxcols <= 0 or self.maxrows <= 0:
+                return
+            index = self._sync_index()
+            last = max(0, index.total - self.maxrows)
+            self._seek(index, min(max(row, 0), last))
+            self.match = None
+
+    def home(self):
+        """Scroll to the oldest output, including any spilled to disk"""
+        with self.lock:
+            if self.maxcols <= 0 or self.maxrows <= 0:
+                return
+            index = self._sync_index()
+            self.match = None
+            if self._oldest() < self.buf.first:
+                self.anchor = (self._oldest(), 0)
+            else:
+                self._seek(index, 0)
+
+    def follow(self):
+        """Scroll to the bottom and follow new output"""
+        with self.lock:
+            self.anchor = None
+            self.match = None
+
+    def search(self, query: str, older: bool = True) -> bool:
+        """Scroll so the next line containing the query, ignoring case,
+        is at the top of the pane. Searches back through older output,
+        or forward through newer output if older is false, starting from
+        the last match or the top of the pane. Returns whether a line
+        was found"""
+        with self.lock:
+            if self.maxcols <= 0 or self.maxrows <= 0 or not query:
+                return False
+            first = self.buf.first
+            if self.match is not None and self.match >= self._oldest():
+                start = self.match
+            elif self.anchor is not None:
+                start = self._clamp_anchor(self.anchor)[0]
+            else:
+                start = self.buf.end
+            start += -1 if older else 1
+
+            seq: int | None = None
+            if start < first:
+                # the log holds every line, so searching forward from a
+                # spilled line never needs to continue in memory
+                assert self.log is not None
+                seq = self.log.find(query, start, older)
+            elif (i := self.buf.find(query, start - first, older)) is not None:
+                seq = first + i
+            elif older and self.log is not None:
+                seq = self.log.find(query, first - 1, True)
+            if seq is None:
+                return False
+
+            self.match = seq
+            if seq < first:
+                self.anchor = (seq, 0)
+                return True
+
+            # stay anchored even if the match is on the last page, so
+            # that searching again continues from it
+            index = self._sync_index()
+            last = max(0, index.total - self.maxrows)
+            row = min(self._rows_before(index, self.match), last)
+            self.anchor = self._locate_row(index, row)
+            return True
+
+    def rows_below(self) -> int:
+        """The number of rows below the bottom of the pane. Spilled lines
+        are counted as a single row each"""
+        with self.lock:
+            if self.anchor is None or self.maxcols <= 0:
+                return 0
+            index = self._sync_index()
+            seq = self.anchor[0]
+            if seq < self.buf.first:
+                return max(0, self.buf.first - seq + index.total - self.maxrows)
+            return max(0, index.total - self._anchor_row(index) - self.maxrows)
+
+    def _seek(self, index: Fenwick, row: int):
+        if row >= index.total - self.maxrows:
+            self.anchor = None
+            return
+        self.anchor = self._locate_row(index, row)
+
+    def _oldest(self) -> int:
+        """The first line which can still be shown"""
+        return 0 if self.log is not None else self.buf.first
+
+    def _lines(self, seq: int) -> Generator[tuple[str, RowAttr], None, None]:
+        """The lines from seq onwards, reading any which have been
+        evicted from memory back from the log"""
+        first = self.buf.first
+        if seq < first:
+            assert self.log is not None
+            for line in itertools.islice(self.log.lines(seq), first - seq):
+                yield line, self.highlight(line)
+            seq = first
+        for i in range(seq - first, len(self.buf)):
+            yield self.buf[i]
+
+    def _seq_rows(self, seq: int) -> int:
+        """The number of rows a line wraps to, only decoding lines in
+        memory which are not all ascii"""
+        if seq >= self.buf.first:
+            i = seq - self.buf.first
+            if self.buf.isascii(i):
+                return self._line_rows(self.buf.chars(i))
+            return self._text_rows(self.buf.text(i))
+        assert self.log is not None
+        return self._text_rows(self.log.text(seq))
+
+    def _walk_back(self, seq: int, offset: int, n: int) -> tuple[int, int]:
+        """The line and row within it n rows above the given one"""
+        oldest = self._oldest()
+        while n > offset and seq > oldest:
+            n -= offset + 1
+            seq -= 1
+            offset = self._seq_rows(seq) - 1
+        return seq, max(offset - n, 0)
+
+    def _walk_forward(
+        self, seq: int, offset: int, n: int
+    ) -> tuple[tuple[int, int] | None, int]:
+        """The spilled line and row within it n rows below the given
+        one, or None and the row counting from the oldest line in memory
+        if that is reached first"""
+        while seq < self.buf.first:
+            rows = self._seq_rows(seq)
+            if offset + n < rows:
+                return (seq, offset + n), 0
+            n -= rows - offset
+            seq, offset = seq + 1, 0
+        return None, n
+
+    def _line_rows(self, chars: int) -> int:
+        """The number of rows an ascii line of chars characters wraps to"""
+        return max(1, -(-chars // self.maxcols))
+
+    def _text_rows(self, line: str) -> int:
+        if line.isascii():
+            return self._line_rows(len(line))
+        if 2 * len(line) <= self.maxcols:
+            # no character is more than two cells wide
+            return 1
+        return len(width.split(line, self.maxcols))
+
+    def _sync_index(self) -> Fenwick:
+        """Bring the wrapped row index up to date with the current width
+        and any lines pushed since it was last used"""
+        capacity = self.buf.capacity
+        first = self.buf.first
+        if self.index is None or self.index_width != self.maxcols:
+            counts = array("q", bytes(8 * capacity))
+            for seq, (chars, ascii) in enumerate(self.buf.lengths(), first):
+                if ascii:
+                    counts[seq % capacity] = self._line_rows(chars)
+                else:
+                    text = self.buf.text(seq - first)
+                    counts[seq % capacity] = self._text_rows(text)
+            self.index = Fenwick(counts)
+            self.index_width = self.maxcols
+        else:
+            # a new line reuses the slot of the line it evicted
+            for seq in range(max(self.indexed, first), self.buf.end):
+                rows = self._seq_rows(seq)
+                self.index.set(seq % capacity, rows)
+        self.indexed = self.buf.end
+        return self.index
+
+    def _rows_before(self, index: Fenwick, seq: int) -> int:
+        """The number of rows in the retained lines before seq"""
+        n = seq - self.buf.first
+        if n <= 0:
+            return 0
+        if n >= len(self.buf):
+            return index.total
+        a = self.buf.first % index.size
+        b = seq % index.size
+        if a < b:
+            return index.prefix(b) - index.prefix(a)
+        return index.total - index.prefix(a) + index.prefix(b)
+
+    def _locate_row(self, index: Fenwick, row: int) -> tuple[int, int]:
+        """The line containing a row, and the offset of the row within
+        the line"""
+        a = self.buf.first % index.size
+        base = index.prefix(a)
+        if row < index.total - base:
+            slot = index.find(base + row)
+        else:
+            slot = index.find(row - (index.total - base))
+        seq = self.buf.first + (slot - a) % index.size
+        return seq, row - self._rows_before(index, seq)
+
+    def _clamp_anchor(self, anchor: tuple[int, int]) -> tuple[int, int]:
+        # the line may have been evicted, or now wrap to fewer rows
+        seq, offset = anchor
+        if seq < self._oldest():
+            return self._oldest(), 0
+        rows = self._seq_rows(seq)
+        return seq, min(offset, rows - 1)
+
+    def _anchor_row(self, index: Fenwick) -> int:
+        assert self.anchor is not None
+        seq, offset = self._clamp_anchor(self.anchor)
+        return self._rows_before(index, seq) + offset
+
+    def __len__(self) -> int:
+        return len(self.buf)
+
+    def __iter__(self) -> Generator[tuple[str, RowAttr], None, None]:
+        yield from self.rows()
@@ -1,10 +1,55 @@
 import curses
+import threading
 
 
 def _scale(v: int) -> int:
     return int(v * 1000 / 256)
 
 
+# the usual values of the system colours, which vary between terminals
+_SYSTEM_COLOURS = [
+    (0, 0, 0),
+    (128, 0, 0),
+    (0, 128, 0),
+    (128, 128, 0),
+    (0, 0, 128),
+    (128, 0, 128),
+    (0, 128, 128),
+    (192, 192, 192),
+    (128, 128, 128),
+    (255, 0, 0),
+    (0, 255, 0),
+    (255, 255, 0),
+    (0, 0, 255),
+    (255, 0, 255),
+    (0, 255, 255),
+    (255, 255, 255),
+]
+
+
+def _palette(n: int) -> dict[int, tuple[int, int, int]]:
+    """The default values of the first n colours of an xterm"""
+    levels = (0, 95, 135, 175, 215, 255)
+    palette: dict[int, tuple[int, int, int]] = {}
+    for i in range(min(n, 256)):
+        if i < 16:
+            palette[i] = _SYSTEM_COLOURS[i]
+        elif i < 232:
+            c = i - 16
+            palette[i] = (levels[c // 36], levels[c // 6 % 6], levels[c % 6])
+        else:
+            v = 8 + (i - 232) * 10
+            palette[i] = (v, v, v)
+    return palette
+
+
+_XTERM_PALETTE = _palette(256)
+
+
+def _distance(a: tuple[int, int, int], b: tuple[int, int, int]) -> int:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
 class ColourManager:
     def __init__(self):
         self.colours = {
@@ -18,26 +63,73 @@ class ColourManager:
             "yellow": curses.COLOR_YELLOW,
         }
         self.next_colour = 8
-        self.colour_pairs = []
+        self.colour_pairs: list[tuple[int, int]] = []
+        # the pair number of each pair of colours, and the colour of
+        # each rgb value, so that each is only defined once
+        self.pairs: dict[tuple[int, int], int] = {}
+        self.rgb_colours: dict[tuple[int, int, int], int] = {}
+        # the rgb value of each colour which can be displayed, built
+        # when the first colour is made
+        self.palette: dict[int, tuple[int, int, int]] | None = None
+        # colours are made by the threads reading output as well as the
+        # one drawing, so are only defined holding the lock, which is
+        # also held while the screen is drawn
+        self.lock = threading.RLock()
 
     def make_pair(self, fg: str | int | None, bg: str | int | None) -> int:
         if fg is None and bg is None:
             return 0
 
-        # colour string to curses colour
-        f = self.parse_colour(fg)
-        b = self.parse_colour(bg)
+        with self.lock:
+            # colour string to curses colour
+            pair = (self.parse_colour(fg), self.parse_colour(bg))
+            n = self.pairs.get(pair)
+            if n is None:
+                if len(self.colour_pairs) + 1 < self.pair_limit():
+                    # create new colour pair and cache
+                    n = len(self.colour_pairs) + 1
+                    self.init_pair(n, *pair)
+                    self.colour_pairs.append(pair)
+                else:
+                    # once there is no room, the nearest pair is used
+                    n = self.nearest_pair(pair)
+                self.pairs[pair] = n
+            return self.color_pair(n)
 
-        try:
-            # try to find cached value
-            n = self.colour_pairs.index((f, b))
-        except ValueError:
-            # create new colour pair and cache
-            n = len(self.colour_pairs)
-            curses.init_pair(n + 1, f, b)
-            self.colour_pairs.append((f, b))
+    def pair_limit(self) -> int:
+        """The number of colour pairs, including the default pair 0.
+        Pairs are stored in the colour bits of an attribute, so there are
+        never more than those can hold"""
+        limit = (curses.A_COLOR >> 8) + 1
+        return min(getattr(curses, "COLOR_PAIRS", limit), limit)
+
+    def nearest_pair(self, pair: tuple[int, int]) -> int:
+        """The defined pair closest to a pair of colours, or the default
+        pair if none uses the default colour in the same places"""
+        best, best_distance = 0, -1
+        for n, other in enumerate(self.colour_pairs, 1):
+            if (pair[0] < 0) != (other[0] < 0) or (pair[1] < 0) != (other[1] < 0):
+                continue
+            distance = sum(
+                _distance(self.colour_rgb(a), self.colour_rgb(b))
+                for a, b in zip(pair, other)
+                if a >= 0
+            )
+            if best_distance < 0 or distance < best_distance:
+                best, best_distance = n, distance
+        return best
 
-        return curses.color_pair(n + 1)
+    def colour_rgb(self, colour: int) -> tuple[int, int, int]:
+        """The rgb value of a colour, as far as it is known"""
+        if self.palette is not None and colour in self.palette:
+            return self.palette[colour]
+        return _XTERM_PALETTE.get(colour, (0, 0, 0))
+
+    def init_pair(self, n: int, fg: int, bg: int):
+        curses.init_pair(n, fg, bg)
+
+    def color_pair(self, n: int) -> int:
+        return curses.color_pair(n)
 
     def parse_colour(self, colour: str | int | None) -> int:
         # int values are already parsed
@@ -54,31 +146,160 @@ class ColourManager:
 
         # try to parse
         if colour.startswith("#"):
-            return self.parse_hex(colour)
+            res = self.parse_hex(colour)
         elif colour.startswith("rgb("):
-            return self.parse_rgb(colour)
+            res = self.parse_rgb(colour)
         else:
             raise ValueError("invalid colour: " + colour)
+        self.colours[colour] = res
+        return res
 
     def parse_hex(self, hex_code: str) -> int:
+        return self.make_colour(
+            int(hex_code[1:3], 16),
+            int(hex_code[3:5], 16),
+            int(hex_code[5:7], 16),
+        )
+
+    def parse_rgb(self, rgb: str) -> int:
+        r, g, b = rgb[4:-1].split(",")
+        return self.make_colour(int(r), int(g), int(b))
+
+    def make_colour(self, r: int, g: int, b: int) -> int:
+        """The colour with 8 bit components, which is defined the first
+        time it is made. Once no more colours can be defined, the nearest
+        colour which can be displayed is used instead"""
+        rgb = (r, g, b)
+        if rgb in self.rgb_colours:
+            return self.rgb_colours[rgb]
+        with self.lock:
+            if rgb in self.rgb_colours:
+                return self.rgb_colours[rgb]
+            res = self.define_colour(r, g, b)
+            if res is None:
+                res = self.nearest(rgb)
+            self.rgb_colours[rgb] = res
+            return res
+
+    def define_colour(self, r: int, g: int, b: int) -> int | None:
+        """Define a new colour, returning None if there is no room"""
+        limit = min(getattr(curses, "COLORS", 256), 256)
+        if self.palette is None:
+            self.palette = _palette(limit)
+            if limit > 16:
+                # the system colours are often changed by themes, so are
+                # only used when there is nothing else
+                for i in range(16):
+                    del self.palette[i]
+        if self.next_colour >= limit:
+            return None
+        try:
+            curses.init_color(self.next_colour, _scale(r), _scale(g), _scale(b))
+        except curses.error:
+            # the terminal cannot change its colours
+            self.next_colour = limit
+            return None
         res = self.next_colour
         self.next_colour += 1
-        curses.init_color(
-            res,
-            _scale(int(hex_code[1:3], 16)),
-            _scale(int(hex_code[3:5], 16)),
-            _scale(int(hex_code[5:7], 16)),
-        )
+        self.palette[res] = (r, g, b)
         return res
 
-    def parse_rgb(self, rgb: str) -> int:
+    def indexed(self, n: int) -> int:
+        """The colour with an index in the xterm palette. Slots from 8 on
+        may have been redefined, so those are defined again"""
+        if n < 8:
+            return n
+        return self.make_colour(*_XTERM_PALETTE[n])
+
+    def nearest(self, rgb: tuple[int, int, int]) -> int:
+        """The displayable colour closest to an rgb value"""
+        assert self.palette is not None
+        best, best_distance = 0, -1
+        for colour, value in self.palette.items():
+            distance = _distance(value, rgb)
+            if best_distance < 0 or distance < best_distance:
+                best, best_distance = colour, distance
+        return best
+
+
+# the codes for the curses attributes which have an SGR equivalent
+_SGR_ATTRS = (
+    (curses.A_BOLD, "1"),
+    (curses.A_DIM, "2"),
+    (curses.A_UNDERLINE, "4"),
+    (curses.A_BLINK, "5"),
+    (curses.A_REVERSE, "7"),
+    (curses.A_STANDOUT, "7"),
+)
+
+SGR_RESET = "\x1b[0m"
+
+
+class AnsiColourManager(ColourManager):
+    """A colour manager for writing to a stream instead of a curses
+    screen. Attributes are built the same way as for curses, but can be
+    turned into ANSI escape sequences instead of being drawn"""
+
+    def __init__(self):
+        super().__init__()
+        # colours are only numbered to look them up, so are numbered
+        # after the palette to keep it intact
+        self.next_colour = 256
+        self.rgb: dict[int, tuple[int, int, int]] = {}
+        self.sequences: dict[int, str] = {}
+
+    def init_pair(self, n: int, fg: int, bg: int):
+        pass
+
+    def color_pair(self, n: int) -> int:
+        # the same encoding as curses.color_pair
+        return n << 8
+
+    def pair_limit(self) -> int:
+        # not limited by the terminal, only by the attribute encoding
+        return (curses.A_COLOR >> 8) + 1
+
+    def colour_rgb(self, colour: int) -> tuple[int, int, int]:
+        if colour in self.rgb:
+            return self.rgb[colour]
+        return _XTERM_PALETTE.get(colour, (0, 0, 0))
+
+    def indexed(self, n: int) -> int:
+        return n
+
+    def define_colour(self, r: int, g: int, b: int) -> int | None:
+        # colours are sent as 24-bit colour, so there is no limit
         res = self.next_colour
         self.next_colour += 1
-        r, g, b = rgb[4:-1].split(",")
-        curses.init_color(
-            res,
-            _scale(int(r)),
-            _scale(int(g)),
-            _scale(int(b)),
-        )
+        self.rgb[res] = (r, g, b)
         return res
+
+    def sgr(self, attr: int) -> str:
+        """The escape sequence which selects a curses attribute, or an
+        empty string for the default attribute"""
+        if attr in self.sequences:
+            return self.sequences[attr]
+
+        codes: list[str] = []
+        for a, code in _SGR_ATTRS:
+            if attr & a and code not in codes:
+                codes.append(code)
+        pair = (attr & curses.A_COLOR) >> 8
+        if pair > 0:
+            fg, bg = self.colour_pairs[pair - 1]
+            codes += self._colour_codes(fg, 30)
+            codes += self._colour_codes(bg, 40)
+
+        seq = f"\x1b[{';'.join(codes)}m" if codes else ""
+        self.sequences[attr] = seq
+        return seq
+
+    def _colour_codes(self, colour: int, base: int) -> list[str]:
+        if colour < 0:
+            return []
+        if colour in self.rgb:
+            r, g, b = self.rgb[colour]
+            return [str(base + 8), "2", str(r), str(g), str(b)]
+        if colour < 8:
+            return [str(base + colour)]
+        return [str(base + 8), "5", str(colour)]
@@ -2,11 +2,12 @@ import configparser
 import curses
 import re
 import shlex
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import TextIO
 
 import minimux.utils as utils
 from minimux.colour import ColourManager
+from minimux.ingest import OVERFLOW_POLICIES
 from minimux.rules import LiteralRule, RegexRule, Rule
 
 
@@ -20,6 +21,10 @@ class Attr:
     reverse: bool | None = None
     standout: bool | None = None
     underline: bool | None = None
+    # the attribute made by the last colour manager called with
+    resolved: tuple[ColourManager, int] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __or__(self, other: object) -> "Attr":
         if not isinstance(other, Attr):
@@ -35,7 +40,9 @@ class Attr:
             underline=utils.combine(self.underline, other.underline),
         )
 
-    def __call__(self, colour_manager: ColourManager):
+    def __call__(self, colour_manager: ColourManager) -> int:
+        if self.resolved is not None and self.resolved[0] is colour_manager:
+            return self.resolved[1]
         attr = colour_manager.make_pair(self.fg, self.bg)
         if self.blink:
             attr |= curses.A_BLINK
@@ -49,6 +56,7 @@ class Attr:
             attr |= curses.A_STANDOUT
         if self.underline:
             attr |= curses.A_UNDERLINE
+        self.resolved = (colour_manager, attr)
         return attr
 
 
@@ -68,6 +76,29 @@ class Command(Element):
     input: str | None
     padding: tuple[int, int, int, int]
     title_attr: Attr
+    match_cache: int
+    scrollback: int
+    spill: str | None
+    overflow: str
+    queue_size: int
+    pty: bool
+    ansi: bool
+    depends_on: list[str]
+    ready: re.Pattern[str] | None
+
+    @property
+    def filename(self) -> str:
+        """A name for the command which can be used in a path, made
+        from the sections leading to it"""
+        return self.name.strip(":").replace(":", "-")
+
+    @property
+    def label(self) -> str:
+        """A short name for the command: its title, or else the name of
+        its section"""
+        if self.title:
+            return self.title
+        return self.name.rsplit(":", 1)[-1]
 
 
 @dataclass
@@ -114,6 +145,19 @@ class MiniMuxConfigParser(configparser.ConfigParser):
         shell = section.getboolean("shell", False)
         input = section.get("input", None)
         padding = self.aspadding(section.get("padding", None))
+        match_cache = section.getint("match_cache", 1024)
+        scrollback = section.getint("scrollback", 100000)
+        spill = section.get("spill", None)
+        overflow = section.get("overflow", "block")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of block, drop-oldest or sample")
+        queue_size = section.getint("queue_size", 10000)
+        pty = section.getboolean("pty", False)
+        ansi = section.getboolean("ansi", True)
+        depends_on = self.aslist(section.get("depends_on", ""))
+        ready = None
+        if pattern := section.get("ready", None):
+            ready = re.compile(pattern)
 
         return Command(
             prefix + ":" + section.name,
@@ -126,6 +170,15 @@ class MiniMuxConfigParser(configparser.ConfigParser):
             input,
             padding,
             title_attr,
+            match_cache,
+            scrollback,
+            spill,
+            overflow,
+            queue_size,
+            pty,
+            ansi,
+            depends_on,
+            ready,
         )
 
     def parse_panel(
@@ -183,7 +236,9 @@ class MiniMuxConfigParser(configparser.ConfigParser):
         if section.getboolean("verbose", False):
             flags |= re.VERBOSE
 
-        rule = RegexRule(pattern, flags)
+        span = section.getboolean("span", False)
+
+        rule = RegexRule(pattern, flags, span)
         attr = default_attr | self.parse_attrs(section)
         return rule, attr
 
@@ -194,8 +249,9 @@ class MiniMuxConfigParser(configparser.ConfigParser):
     ) -> tuple[Rule, Attr]:
         pattern = section["literal"]
         ignorecase = section.getboolean("ignorecase", False)
+        span = section.getboolean("span", False)
 
-        rule = LiteralRule(pattern, ignorecase)
+        rule = LiteralRule(pattern, ignorecase, span)
         attr = default_attr | self.parse_attrs(section)
         return rule, attr
 
@@ -233,12 +289,29 @@ class Config:
     content: Element
     sep_attr: Attr
     title_attr: Attr
+    fps: int = 30
+    engine: str = "threads"
+    renderer: str = "curses"
+    stop_timeout: float = 5.0
 
     @classmethod
     def from_parser(cls, parser: MiniMuxConfigParser) -> "Config":
         main = parser["main"]
         title = main.pop("title", None)
+        fps = main.getint("fps", 30)
+        if fps <= 0:
+            raise ValueError("fps must be a positive integer")
+        engine = main.get("engine", "threads")
+        if engine not in ("threads", "selectors"):
+            raise ValueError("engine must be one of threads or selectors")
+        renderer = main.get("renderer", "curses")
+        if renderer not in ("curses", "ansi"):
+            raise ValueError("renderer must be one of curses or ansi")
+        stop_timeout = main.getfloat("stop_timeout", 5.0)
+        if stop_timeout < 0:
+            raise ValueError("stop_timeout must not be negative")
         content = parser.create_panels(main, "", Attr())
+        _resolve_dependencies(content)
         base_attr = parser.parse_attrs(main)
         sep_attrs = base_attr
         if "seperator" in parser:
@@ -247,10 +320,70 @@ class Config:
         if "title" in parser:
             title_attrs = base_attr | parser.parse_attrs(parser["title"])
 
-        return cls(title, content, sep_attrs, title_attrs)
+        return cls(
+            title,
+            content,
+            sep_attrs,
+            title_attrs,
+            fps,
+            engine,
+            renderer,
+            stop_timeout,
+        )
+
+    def commands(self) -> list[Command]:
+        """Every command in the config, in order"""
+        return _commands(self.content)
 
     @classmethod
     def from_file(cls, f: TextIO) -> "Config":
         parser = MiniMuxConfigParser()
         parser.read_file(f)
         return cls.from_parser(parser)
+
+
+def _commands(content: Element) -> list[Command]:
+    """Every command in the tree of elements, in order"""
+    if isinstance(content, Panel):
+        return [c for child in content.children for c in _commands(child)]
+    elif isinstance(content, Command):
+        return [content]
+    else:
+        raise TypeError
+
+
+def _resolve_dependencies(content: Element):
+    """Replace the section names each command depends on with the names
+    of the commands made from those sections, checking that they exist
+    and do not depend on each other in a cycle"""
+    by_section: dict[str, list[str]] = {}
+    for command in _commands(content):
+        by_section.setdefault(command.name.rsplit(":", 1)[-1], []).append(command.name)
+    graph: dict[str, list[str]] = {}
+    for command in _commands(content):
+        names: list[str] = []
+        for section in command.depends_on:
+            if section not in by_section:
+                raise ValueError(f"depends_on: no command named {section}")
+            names.extend(by_section[section])
+        command.depends_on = names
+        graph[command.name] = names
+
+    # depth first search, where a command seen again before all of its
+    # dependencies have been visited is part of a cycle
+    done: set[str] = set()
+    visiting: set[str] = set()
+
+    def visit(name: str):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"depends_on: {name.rsplit(':', 1)[-1]} depends on itself")
+        visiting.add(name)
+        for dep in graph[name]:
+            visit(dep)
+        visiting.remove(name)
+        done.add(name)
+
+    for name in graph:
+        visit(name)
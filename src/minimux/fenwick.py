@@ -0,0 +1,58 @@
+from array import array
+
+
+class Fenwick:
+    """A fixed number of counts supporting O(log n) updates, prefix
+    sums and finding the position of the kth item"""
+
+    __slots__ = ("size", "tree", "counts", "total")
+
+    def __init__(self, counts: array):
+        self.size = len(counts)
+        self.counts = array("q", counts)
+        self.total = sum(self.counts)
+
+        # linear time construction, each node passes its sum on to its
+        # parent
+        self.tree = array("q", [0]) + self.counts
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    @classmethod
+    def zeros(cls, size: int) -> "Fenwick":
+        return cls(array("q", bytes(8 * size)))
+
+    def set(self, i: int, count: int):
+        """Set the count at position i"""
+        delta = count - self.counts[i]
+        if delta == 0:
+            return
+        self.counts[i] = count
+        self.total += delta
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i: int) -> int:
+        """The sum of the counts before position i"""
+        res = 0
+        while i > 0:
+            res += self.tree[i]
+            i -= i & -i
+        return res
+
+    def find(self, k: int) -> int:
+        """The position containing the kth item, i.e. the largest i
+        with prefix(i) <= k"""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step > 0:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return pos
@@ -0,0 +1,232 @@
+import dataclasses
+import selectors
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO
+
+from minimux.buffer import RowAttr, Runs
+from minimux.colour import SGR_RESET, AnsiColourManager
+from minimux.config import Command, Config
+from minimux.runner import Runner, stop_all, stop_signals
+from minimux.scheduler import Scheduler
+from minimux.stats import SAMPLE_INTERVAL, StatsFile
+
+# the amount of pending output at which a writer writes it out without
+# waiting for the next flush
+WRITE_SIZE = 1024 * 1024
+
+
+class Writer:
+    """Collects text written to a binary stream so that it is encoded and
+    written in large batches, rather than line by line"""
+
+    def __init__(self, stream: BinaryIO, limit: int = WRITE_SIZE):
+        self.stream = stream
+        self.limit = limit
+        self.pending: list[str] = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.pending.append(text)
+        self.size += len(text)
+        if self.size >= self.limit:
+            self._write()
+
+    def _write(self):
+        if self.pending:
+            self.stream.write("".join(self.pending).encode("utf-8", "replace"))
+            self.pending = []
+            self.size = 0
+
+    def flush(self):
+        self._write()
+        self.stream.flush()
+
+
+class HeadlessRunner(Runner):
+    """A runner which writes each line of output to a writer as soon as
+    it is complete, instead of keeping it to be displayed"""
+
+    def __init__(
+        self,
+        command: Command,
+        colour_manager: AnsiColourManager,
+        writer: Writer,
+        prefix: str = "",
+        colour: bool = False,
+    ):
+        # output is streamed rather than scrolled back through, so is not
+        # spilled, which would also empty the spill directory of anything
+        # else running the same config
+        command = dataclasses.replace(command, spill=None)
+        super().__init__(command, threading.RLock(), colour_manager)
+        self.cm = colour_manager
+        self.writer = writer
+        self.prefix = prefix
+        self.colour = colour
+        self.reported = 0
+        if colour and (seq := colour_manager.sgr(self.title_attr)):
+            self.prefix = seq + prefix + SGR_RESET
+
+    def drain(self):
+        # mark where lines were dropped in the output
+        if self.queue is not None and self.queue.dropped > self.reported:
+            n = self.queue.dropped - self.reported
+            self.reported = self.queue.dropped
+            self.emit([f"** {self.queue.describe(n)} **"])
+        super().drain()
+
+    def emit(self, lines: list[str]):
+        if not lines:
+            return
+        attrs: list[RowAttr] = []
+        with self.stats.timed("rule_time"):
+            lines, escapes = self.decode(lines)
+            if self.colour:
+                attrs = self.buf.highlight_lines(lines, escapes)
+        if not self.colour or (not self.bkgd and not any(attrs)):
+            # nothing to colour, so the lines can be joined all at once
+            sep = "\n" + self.prefix
+            self.writer.write(self.prefix + sep.join(lines) + "\n")
+            return
+
+        # lines which match no rule are shown in the command's colours
+        sgr = self.cm.sgr
+        bkgd = self.bkgd
+        parts: list[str] = []
+        for line, attr in zip(lines, attrs):
+            parts.append(self.prefix)
+            if isinstance(attr, Runs):
+                for start, end, a in attr.runs(len(line)):
+                    parts.append(SGR_RESET + sgr(a or bkgd) + line[start:end])
+                parts.append(SGR_RESET + "\n")
+            elif seq := sgr(attr or bkgd):
+                parts.append(seq + line + SGR_RESET + "\n")
+            else:
+                parts.append(line + "\n")
+        self.writer.write("".join(parts))
+
+
+class Headless:
+    """Runs the commands of a config without a user interface, streaming
+    their output as it arrives to stdout with each line prefixed by the
+    command it came from, or to a file per command"""
+
+    def __init__(
+        self,
+        config: Config,
+        output: Path | None = None,
+        colour: bool = False,
+        stats: str | None = None,
+    ):
+        self.config = config
+        self.output = output
+        self.colour = colour
+        self.stats_file = StatsFile(stats) if stats is not None else None
+        self.next_sample = 0.0
+        self.cm = AnsiColourManager()
+        self.writers: list[Writer] = []
+        self.runners: list[HeadlessRunner] = []
+
+    def run(self) -> int:
+        """Run every command until they have all exited, returning 1 if
+        any of them failed and 0 otherwise"""
+        commands = self.config.commands()
+        if self.output is not None:
+            self.output.mkdir(parents=True, exist_ok=True)
+            for command in commands:
+                f = open(self.output / (command.filename + ".log"), "wb")
+                self.writers.append(Writer(f))
+                self.runners.append(
+                    HeadlessRunner(command, self.cm, self.writers[-1], "", self.colour)
+                )
+        else:
+            writer = Writer(sys.stdout.buffer)
+            self.writers.append(writer)
+            names = [command.label for command in commands]
+            width = max((len(name) for name in names), default=0)
+            for command, name in zip(commands, names):
+                prefix = name.ljust(width) + " | "
+                self.runners.append(
+                    HeadlessRunner(command, self.cm, writer, prefix, self.colour)
+                )
+
+        try:
+            with stop_signals():
+                self.stream()
+        except KeyboardInterrupt:
+            # interrupts are a normal way to stop
+            pass
+        finally:
+            # anything the commands left running in the background is
+            # stopped as well, however the run ended
+            stop_all(self.runners, self.config.stop_timeout)
+            for runner in self.runners:
+                runner.close()
+            for writer in self.writers:
+                writer.flush()
+                if writer.stream is not sys.stdout.buffer:
+                    writer.stream.close()
+
+        for runner in self.runners:
+            if runner.proc is None or runner.proc.returncode != 0:
+                return 1
+        return 0
+
+    def stream(self):
+        """Multiplex the output of all runners until they have exited,
+        flushing the writers at most fps times per second"""
+        sel = selectors.DefaultSelector()
+        running: list[HeadlessRunner] = []
+        scheduler = Scheduler({r.command.name: r for r in self.runners})
+
+        def start(runners: list[HeadlessRunner]):
+            for runner in runners:
+                if runner.spawn():
+                    sel.register(runner.fileno(), selectors.EVENT_READ, runner)
+                    running.append(runner)
+
+        start(scheduler.due())
+        interval = 1 / self.config.fps
+        next_flush = time.monotonic() + interval
+        exiting: list[HeadlessRunner] = []
+        while running or scheduler.pending:
+            timeout = max(0.0, next_flush - time.monotonic())
+            for key, _ in sel.select(timeout):
+                runner = key.data
+                data = runner.read()
+                if data:
+                    runner.feed(data)
+                else:
+                    sel.unregister(key.fd)
+                    runner.finish()
+                    exiting.append(runner)
+            for runner in exiting:
+                if runner.reap():
+                    running.remove(runner)
+            exiting = [runner for runner in exiting if runner in running]
+            start(scheduler.due())
+
+            now = time.monotonic()
+            if now >= next_flush:
+                self.flush()
+                next_flush = now + interval
+        self.flush()
+
+    def flush(self):
+        """Write out the lines waiting in the runners' queues and the
+        writers"""
+        for runner in self.runners:
+            runner.drain()
+        for writer in self.writers:
+            writer.flush()
+
+        now = time.monotonic()
+        if self.stats_file is not None and now >= self.next_sample:
+            self.next_sample = now + SAMPLE_INTERVAL
+            for runner in self.runners:
+                runner.stats.sample(now)
+            runners = {r.command.filename: r.snapshot() for r in self.runners}
+            self.stats_file.write({"runners": runners})
@@ -0,0 +1,57 @@
+import threading
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "sample")
+
+
+class LineQueue:
+    """A bounded queue of lines between the reader of a process and its
+    buffer, so the process output can be read at full speed even when
+    the lines cannot be displayed as fast. When more lines arrive than
+    fit, drop-oldest discards the oldest lines waiting, and sample
+    discards every other line waiting until they fit, which leaves an
+    evenly spread sample of the output"""
+
+    def __init__(self, capacity: int, policy: str):
+        if policy not in OVERFLOW_POLICIES[1:]:
+            raise ValueError("policy must be one of drop-oldest or sample")
+        self.capacity = max(1, capacity)
+        self.policy = policy
+        self.lines: list[str] = []
+        self.lock = threading.Lock()
+        # the number of lines which have ever been discarded
+        self.dropped = 0
+
+    def put(self, lines: list[str]):
+        with self.lock:
+            self.lines += lines
+            excess = len(self.lines) - self.capacity
+            if excess <= 0:
+                return
+            if self.policy == "drop-oldest":
+                del self.lines[:excess]
+                self.dropped += excess
+                return
+            while len(self.lines) > self.capacity:
+                kept = self.lines[::2]
+                self.dropped += len(self.lines) - len(kept)
+                self.lines = kept
+
+    def take(self) -> list[str]:
+        """Remove and return all of the lines waiting"""
+        with self.lock:
+            lines, self.lines = self.lines, []
+            return lines
+
+    def describe(self, count: int | None = None) -> str | None:
+        """A description of how many lines have been discarded in total,
+        or of the given count, or None if there are none"""
+        if count is None:
+            count = self.dropped
+        if count == 0:
+            return None
+        verb = "dropped" if self.policy == "drop-oldest" else "skipped"
+        noun = "line" if count == 1 else "lines"
+        return f"{count} {noun} {verb}"
+
+    def __len__(self) -> int:
+        return len(self.lines)
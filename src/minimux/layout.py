@@ -0,0 +1,137 @@
+from minimux.config import Command, Config, Element, Panel
+
+Bounds = tuple[int, int, int, int]
+
+# the offsets of the neighbours of a cell, in the order of the letters of
+# curses' names for line drawing characters: top, right, bottom, left
+_DIRECTIONS = ((-1, 0), (0, 1), (1, 0), (0, -1))
+
+
+class Layout:
+    """The positions of everything drawn on the screen for a config at a
+    particular size, solved once so that drawing the screen needs no
+    recursion through the panels or reading back what has been drawn.
+    Each command has the bounds (rows, cols, y, x) of its window, and
+    each cell of a separator has the name of its line drawing character
+    without the ACS_ prefix"""
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.panes: list[tuple[Command, Bounds]] = []
+        self.separators: dict[tuple[int, int], str] = {}
+
+    @classmethod
+    def solve(cls, config: Config, rows: int, cols: int) -> "Layout":
+        layout = cls(rows, cols)
+        # which of a cell's neighbours it joins to, as separators are laid
+        # out, from which the characters are chosen at the end
+        joins: dict[tuple[int, int], list[bool]] = {}
+        start_row = 0
+        if config.title:
+            layout._line(joins, 1, 0, cols, False)
+            start_row = 2
+        layout._content(joins, config.content, (start_row, rows), (0, cols))
+        for cell, join in joins.items():
+            layout.separators[cell] = _glyph(join)
+        return layout
+
+    def _content(
+        self,
+        joins: dict[tuple[int, int], list[bool]],
+        content: Element,
+        range_y: tuple[int, int],
+        range_x: tuple[int, int],
+    ):
+        if isinstance(content, Panel):
+            self._panel(joins, content, range_y, range_x)
+        elif isinstance(content, Command):
+            bounds = (
+                range_y[1] - range_y[0],
+                range_x[1] - range_x[0],
+                range_y[0],
+                range_x[0],
+            )
+            self.panes.append((content, bounds))
+        else:
+            raise TypeError
+
+    def _panel(
+        self,
+        joins: dict[tuple[int, int], list[bool]],
+        panel: Panel,
+        range_y: tuple[int, int],
+        range_x: tuple[int, int],
+    ):
+        """Split the range between the children of a panel in proportion
+        to their weights, with a separator before each but the first"""
+        if len(panel.children) == 0:
+            return
+
+        lo, hi = range_y if panel.vertical else range_x
+        size = (hi - lo) // sum(c.weight for c in panel.children)
+        i = 0
+        for n, child in enumerate(panel.children):
+            start = lo + i * size
+            end = hi if n == len(panel.children) - 1 else lo + (i + child.weight) * size
+            if n != 0:
+                if panel.vertical:
+                    self._line(joins, start, range_x[0], range_x[1] - range_x[0], False)
+                else:
+                    self._line(joins, range_y[0], start, range_y[1] - range_y[0], True)
+                start += 1
+            i += child.weight
+            if panel.vertical:
+                self._content(joins, child, (start, end), range_x)
+            else:
+                self._content(joins, child, range_y, (start, end))
+
+    def _line(
+        self,
+        joins: dict[tuple[int, int], list[bool]],
+        y: int,
+        x: int,
+        n: int,
+        vertical: bool,
+    ):
+        """Add a separator of n cells, joined to any separator beyond
+        either end of it"""
+        dy, dx = (1, 0) if vertical else (0, 1)
+        cells = [(y + i * dy, x + i * dx) for i in range(n)]
+        if not cells:
+            return
+        forward, back = (2, 0) if vertical else (1, 3)
+        for i, cell in enumerate(cells):
+            join = joins.setdefault(cell, [False] * 4)
+            join[back] = join[back] or i > 0
+            join[forward] = join[forward] or i < n - 1
+        # separators meet when one ends next to another
+        for cell, end in ((cells[0], back), (cells[-1], forward)):
+            oy, ox = _DIRECTIONS[end]
+            beyond = (cell[0] + oy, cell[1] + ox)
+            if beyond in joins:
+                joins[cell][end] = True
+                joins[beyond][(end + 2) % 4] = True
+        # and when a separator ends next to this one
+        for cell in cells:
+            for d in (forward + 1) % 4, (back + 1) % 4:
+                oy, ox = _DIRECTIONS[d]
+                beyond = (cell[0] + oy, cell[1] + ox)
+                if beyond in joins and _across(joins[beyond], d):
+                    joins[cell][d] = True
+                    joins[beyond][(d + 2) % 4] = True
+
+
+def _across(join: list[bool], d: int) -> bool:
+    """Whether a separator cell is part of a line running in direction d
+    or its opposite"""
+    return join[d] or join[(d + 2) % 4]
+
+
+def _glyph(join: list[bool]) -> str:
+    top, right, bottom, left = join
+    if not (top or bottom):
+        return "BSBS"
+    if not (left or right):
+        return "SBSB"
+    return "".join("S" if j else "B" for j in join)
@@ -0,0 +1,44 @@
+import codecs
+import locale
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LineReader:
+    """Incrementally decodes chunks of raw output into lines, using
+    universal newlines. Incomplete lines are held back until the rest
+    of the line arrives or the reader is closed"""
+
+    def __init__(self, encoding: str | None = None):
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.partial = ""
+        self.pending_cr = False
+
+    def feed(self, data: bytes) -> list[str]:
+        """Decode a chunk of output and return the lines it completes"""
+        return self._split(self.decoder.decode(data))
+
+    def close(self) -> list[str]:
+        """Flush the decoder and return any remaining incomplete line"""
+        lines = self._split(self.decoder.decode(b"", final=True))
+        if self.partial:
+            lines.append(self.partial.rstrip())
+            self.partial = ""
+        return lines
+
+    def _split(self, text: str) -> list[str]:
+        if not text:
+            return []
+
+        # a \r\n pair may have been split across two chunks
+        if self.pending_cr and text[0] == "\n":
+            text = text[1:]
+        self.pending_cr = text.endswith("\r")
+
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        return [line.rstrip() for line in lines]
@@ -0,0 +1,237 @@
+import itertools
+from array import array
+from collections import deque
+from typing import Generator, Generic, TypeVar
+
+T = TypeVar("T")
+
+# the maximum number of entries stored in each block
+BLOCK_SIZE = 1024
+
+# the number of bits in the trigram bloom filter of each block
+BLOOM_BITS = 1 << 16
+
+# the most bloom filters built by each search, so that the first search
+# through a long scrollback is not held up indexing all of it
+BLOOMS_PER_FIND = 8
+
+
+def trigrams(data: bytes) -> set[tuple[int, int, int]]:
+    return set(zip(data, data[1:], data[2:]))
+
+
+class _Block(Generic[T]):
+    """A fixed number of entries, with the text of all of them stored
+    in one contiguous bytearray"""
+
+    __slots__ = ("data", "ends", "lens", "attrs", "extra", "bloom", "ascii")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array("I")
+        self.lens = array("I")
+        self.attrs = array("q")
+        self.extra: list[T] = []
+        self.bloom: bytearray | None = None
+        # whether the text of every entry is ascii
+        self.ascii = True
+
+    def append(self, text: str, attr: "int | T"):
+        self.data += text.encode("utf-8", "surrogatepass")
+        self.ends.append(len(self.data))
+        self.lens.append(len(text))
+        self.ascii = self.ascii and text.isascii()
+        if isinstance(attr, int):
+            self.attrs.append(attr)
+        else:
+            # attributes which are not plain ints are stored out of line
+            # and referred to by a negative index
+            self.extra.append(attr)
+            self.attrs.append(-len(self.extra))
+
+    def text(self, i: int) -> str:
+        start = self.ends[i - 1] if i > 0 else 0
+        return self.data[start : self.ends[i]].decode("utf-8", "surrogatepass")
+
+    def isascii(self, i: int) -> bool:
+        # only ascii text encodes to one byte per character
+        start = self.ends[i - 1] if i > 0 else 0
+        return self.ends[i] - start == self.lens[i]
+
+    def attr(self, i: int) -> "int | T":
+        attr = self.attrs[i]
+        if attr < 0:
+            return self.extra[-attr - 1]
+        return attr
+
+    def folded(self) -> str:
+        """The casefolded text of all of the entries, run together"""
+        return self.data.decode("utf-8", "surrogatepass").casefold()
+
+    def index(self, folded: str):
+        """Build the bloom filter of the block's casefolded trigrams. This
+        should only be called once the block is full"""
+        bloom = bytearray(BLOOM_BITS // 8)
+        for gram in trigrams(folded.encode("utf-8", "surrogatepass")):
+            h = hash(gram) % BLOOM_BITS
+            bloom[h >> 3] |= 1 << (h & 7)
+        self.bloom = bloom
+
+    def may_contain(self, grams: set[tuple[int, int, int]]) -> bool:
+        """Whether the block may contain all of the trigrams, according
+        to its bloom filter"""
+        if self.bloom is None:
+            return True
+        for gram in grams:
+            h = hash(gram) % BLOOM_BITS
+            if not self.bloom[h >> 3] & (1 << (h & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+
+class Ring(Generic[T]):
+    """A bounded first-in-first-out sequence of (text, attr) entries.
+    Entries are packed into blocks so that each one costs little more
+    than its utf-8 encoded text, and appending and evicting are O(1).
+    Attributes are ints, or occasionally some other object T"""
+
+    __slots__ = ("capacity", "block_size", "blocks", "head", "length", "first")
+
+    def __init__(self, capacity: int, block_size: int = BLOCK_SIZE):
+        self.capacity = capacity
+        self.block_size = max(1, min(block_size, capacity))
+        self.blocks: deque[_Block[T]] = deque()
+        # the offset of the first entry in the first block
+        self.head = 0
+        self.length = 0
+        # the number of entries which have ever been evicted
+        self.first = 0
+
+    def append(self, text: str, attr: "int | T"):
+        if self.capacity <= 0:
+            return
+        if not self.blocks or len(self.blocks[-1]) >= self.block_size:
+            self.blocks.append(_Block())
+        self.blocks[-1].append(text, attr)
+        self.length += 1
+        if self.length > self.capacity:
+            self.popleft()
+
+    def popleft(self):
+        """Evict the oldest entry"""
+        if self.length == 0:
+            raise IndexError("pop from an empty ring")
+        self.head += 1
+        self.length -= 1
+        self.first += 1
+        if self.head >= len(self.blocks[0]) or self.length == 0:
+            self.blocks.popleft()
+            self.head = 0
+
+    def _locate(self, i: int) -> tuple[_Block[T], int]:
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("ring index out of range")
+        i += self.head
+        return self.blocks[i // self.block_size], i % self.block_size
+
+    def text(self, i: int) -> str:
+        block, j = self._locate(i)
+        return block.text(j)
+
+    def attr(self, i: int) -> "int | T":
+        block, j = self._locate(i)
+        return block.attr(j)
+
+    def chars(self, i: int) -> int:
+        """The number of characters in the text of an entry, without
+        decoding it"""
+        block, j = self._locate(i)
+        return block.lens[j]
+
+    def isascii(self, i: int) -> bool:
+        """Whether the text of an entry is all ascii, without decoding
+        it"""
+        block, j = self._locate(i)
+        return block.isascii(j)
+
+    def lengths(self) -> Generator[tuple[int, bool], None, None]:
+        """The number of characters in the text of each entry, and
+        whether it is all ascii"""
+        j = self.head
+        remaining = self.length
+        for block in self.blocks:
+            end = min(len(block), j + remaining)
+            if block.ascii:
+                yield from zip(block.lens[j:end], itertools.repeat(True))
+            else:
+                lens, ends = block.lens, block.ends
+                for k in range(j, end):
+                    start = ends[k - 1] if k > 0 else 0
+                    yield lens[k], ends[k] - start == lens[k]
+            remaining -= len(block) - j
+            j = 0
+
+    def find(self, needle: str, start: int, reverse: bool = False) -> int | None:
+        """Find the first entry from start, or the last entry up to and
+        including start if reverse is true, whose casefolded text
+        contains the casefolded needle. Full blocks whose bloom filters
+        rule out the needle's trigrams are skipped without being read, and
+        other blocks are only checked entry by entry if their text as a
+        whole contains the needle"""
+        needle = needle.casefold()
+        grams = trigrams(needle.encode("utf-8", "surrogatepass"))
+        budget = BLOOMS_PER_FIND
+        step = -1 if reverse else 1
+        i = start
+        while 0 <= i < self.length:
+            block, j = self._locate(i)
+            # the range of entries still to check in this block
+            if reverse:
+                n = j + 1 if block is not self.blocks[0] else j - self.head + 1
+            else:
+                n = min(len(block) - j, self.length - i)
+            if not block.may_contain(grams):
+                i += step * n
+                continue
+            if block.bloom is None:
+                # scanning the whole block is far cheaper than checking
+                # each entry, and the text is at hand to index the block
+                folded = block.folded()
+                if budget > 0 and len(block) == self.block_size:
+                    block.index(folded)
+                    budget -= 1
+                if needle not in folded:
+                    i += step * n
+                    continue
+            for k in range(n):
+                if needle in block.text(j + step * k).casefold():
+                    return i + step * k
+            i += step * n
+        return None
+
+    @property
+    def end(self) -> int:
+        """The number of entries which have ever been appended"""
+        return self.first + self.length
+
+    def __getitem__(self, i: int) -> "tuple[str, int | T]":
+        block, j = self._locate(i)
+        return block.text(j), block.attr(j)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> "Generator[tuple[str, int | T], None, None]":
+        j = self.head
+        remaining = self.length
+        for block in self.blocks:
+            while j < len(block) and remaining > 0:
+                yield block.text(j), block.attr(j)
+                j += 1
+                remaining -= 1
+            j = 0
@@ -1,34 +1,162 @@
 import abc
+import bisect
+import functools
+import itertools
 import re
+from typing import Any, Callable, Iterable
+
+try:
+    import re._parser as sre_parse  # type: ignore
+except ImportError:  # python < 3.11
+    import sre_parse  # type: ignore
+
+_LITERAL = sre_parse.LITERAL
+_BRANCH = sre_parse.BRANCH
+_AT = sre_parse.AT
+_ASSERTS = (sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+# word boundaries behave the same next to a newline as at either end of
+# a line
+_LINE_LOCAL_AT = (sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY)
+
+
+class MatchContext:
+    """A line being matched against a set of rules. Derived forms of
+    the line are computed on first use and shared by every rule"""
+
+    __slots__ = ("line", "_folded", "_ascii")
+
+    def __init__(self, line: str):
+        self.line = line
+        self._folded: str | None = None
+        self._ascii: bool | None = None
+
+    @property
+    def folded(self) -> str:
+        if self._folded is None:
+            self._folded = self.line.casefold()
+        return self._folded
+
+    @property
+    def ascii(self) -> bool:
+        if self._ascii is None:
+            self._ascii = self.line.isascii()
+        return self._ascii
 
 
 class Rule(abc.ABC):
+    # whether only the matched parts of a line are highlighted, rather
+    # than the whole line
+    span: bool = False
+
     @abc.abstractmethod
     def matches(self, line: str) -> bool: ...
 
+    def spans(self, line: str) -> list[tuple[int, int]]:
+        """The start and end offsets of each match in the line"""
+        return [(0, len(line))] if self.matches(line) else []
+
+    def spans_lines(self, lines: list[str]) -> list[list[tuple[int, int]]]:
+        """The spans of each of a batch of lines"""
+        return [self.spans(line) for line in lines]
+
+    def matches_context(self, ctx: MatchContext) -> bool:
+        """Like matches, but may reuse forms of the line already
+        computed by other rules"""
+        return self.matches(ctx.line)
+
     @abc.abstractmethod
     def __hash__(self) -> int: ...
 
+    def literals(self) -> tuple[tuple[str, ...], bool] | None:
+        """Substrings, one of which must be present in a line for the
+        rule to match it, and whether they should be looked for in the
+        casefolded line. Returns None if there are no such substrings"""
+        return None
+
+    def exact(self) -> bool:
+        """Whether the presence of one of the literals is enough for the
+        rule to match"""
+        return False
+
 
 class RegexRule(Rule):
-    def __init__(self, pattern: str, flags: "re._FlagsType"):
+    def __init__(self, pattern: str, flags: "re._FlagsType", span: bool = False):
         self.pattern = re.compile(pattern, flags)
+        self.span = span
+        # whether the pattern finds the same matches in a line whether
+        # or not it is surrounded by other lines
+        try:
+            parsed = sre_parse.parse(self.pattern.pattern, self.pattern.flags)
+            self.line_local = _line_local(parsed)
+        except Exception:
+            self.line_local = False
 
     def matches(self, line: str) -> bool:
         return self.pattern.search(line) != None
 
+    def spans(self, line: str) -> list[tuple[int, int]]:
+        return [m.span() for m in self.pattern.finditer(line) if m.end() > m.start()]
+
+    def spans_lines(self, lines: list[str]) -> list[list[tuple[int, int]]]:
+        if not self.line_local:
+            return super().spans_lines(lines)
+
+        # search all of the lines at once, only falling back to searching
+        # lines individually where a match runs from one into the next
+        text = "\n".join(lines)
+        starts = list(
+            itertools.accumulate((len(line) + 1 for line in lines), initial=0)
+        )
+        res: list[list[tuple[int, int]]] = [[] for _ in lines]
+        fallback: set[int] = set()
+        for m in self.pattern.finditer(text):
+            start, end = m.span()
+            if end == start:
+                continue
+            k = bisect.bisect_right(starts, start) - 1
+            if end >= starts[k + 1]:
+                last = bisect.bisect_right(starts, end - 1) - 1
+                fallback.update(range(k, last + 1))
+            else:
+                res[k].append((start - starts[k], end - starts[k]))
+        for k in fallback:
+            res[k] = self.spans(lines[k])
+        return res
+
+    def literals(self) -> tuple[tuple[str, ...], bool] | None:
+        try:
+            parsed = sre_parse.parse(self.pattern.pattern, self.pattern.flags)
+        except Exception:
+            return None
+        ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+
+        # only consider literals at the top level, or at the top level of
+        # each branch of a top level alternation
+        branches: list[Any] = [parsed]
+        if len(parsed.data) == 1 and parsed.data[0][0] == _BRANCH:
+            branches = parsed.data[0][1][1]
+
+        literals: list[str] = []
+        for branch in branches:
+            literal = _longest_literal(branch)
+            if not literal or (ignorecase and not literal.isascii()):
+                return None
+            literals.append(literal.casefold() if ignorecase else literal)
+        return tuple(literals), ignorecase
+
     def __hash__(self) -> int:
-        return hash(self.pattern)
+        return hash((self.pattern, self.span))
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, RegexRule):
             return False
-        return self.pattern == other.pattern
+        return self.pattern == other.pattern and self.span == other.span
 
 
 class LiteralRule(Rule):
-    def __init__(self, pattern: str, ignorecase: bool):
+    def __init__(self, pattern: str, ignorecase: bool, span: bool = False):
         self.ignorecase = ignorecase
+        self.span = span
         if ignorecase:
             self.pattern = pattern.casefold()
         else:
@@ -39,10 +167,211 @@ class LiteralRule(Rule):
             line = line.casefold()
         return self.pattern in line
 
+    def matches_context(self, ctx: MatchContext) -> bool:
+        return self.pattern in (ctx.folded if self.ignorecase else ctx.line)
+
+    def spans(self, line: str) -> list[tuple[int, int]]:
+        if not self.pattern:
+            return []
+        if self.ignorecase:
+            if not line.isascii():
+                # casefolding may change the length of the line, so the
+                # offsets would not line up
+                pattern = re.compile(re.escape(self.pattern), re.IGNORECASE)
+                return [m.span() for m in pattern.finditer(line)]
+            line = line.casefold()
+
+        res: list[tuple[int, int]] = []
+        i = line.find(self.pattern)
+        while i != -1:
+            res.append((i, i + len(self.pattern)))
+            i = line.find(self.pattern, i + len(self.pattern))
+        return res
+
+    def spans_lines(self, lines: list[str]) -> list[list[tuple[int, int]]]:
+        text = "\n".join(lines)
+        if not self.pattern or "\n" in self.pattern:
+            return super().spans_lines(lines)
+        if self.ignorecase:
+            if not text.isascii():
+                return super().spans_lines(lines)
+            text = text.casefold()
+
+        # the pattern cannot run from one line into the next, so it can
+        # be looked for in all of the lines at once
+        starts = list(
+            itertools.accumulate((len(line) + 1 for line in lines), initial=0)
+        )
+        res: list[list[tuple[int, int]]] = [[] for _ in lines]
+        i = text.find(self.pattern)
+        while i != -1:
+            k = bisect.bisect_right(starts, i) - 1
+            res[k].append((i - starts[k], i - starts[k] + len(self.pattern)))
+            i = text.find(self.pattern, i + len(self.pattern))
+        return res
+
+    def literals(self) -> tuple[tuple[str, ...], bool] | None:
+        return (self.pattern,), self.ignorecase
+
+    def exact(self) -> bool:
+        return True
+
     def __hash__(self) -> int:
-        return hash((self.ignorecase, self.pattern))
+        return hash((self.ignorecase, self.pattern, self.span))
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, LiteralRule):
             return False
-        return self.pattern == other.pattern and self.ignorecase == other.ignorecase
+        return (
+            self.pattern == other.pattern
+            and self.ignorecase == other.ignorecase
+            and self.span == other.span
+        )
+
+
+def _line_local(items: Any) -> bool:
+    """Whether a parsed regex is free of anchors and lookarounds which
+    could see past the end of a line"""
+    for op, av in items:
+        if op == _AT and av not in _LINE_LOCAL_AT:
+            return False
+        if op in _ASSERTS:
+            return False
+        if not _line_local_args(av):
+            return False
+    return True
+
+
+def _line_local_args(av: Any) -> bool:
+    if isinstance(av, sre_parse.SubPattern):
+        return _line_local(av)
+    if isinstance(av, (tuple, list)):
+        return all(_line_local_args(a) for a in av)
+    return True
+
+
+def _longest_literal(items: Iterable[tuple[Any, Any]]) -> str:
+    """Find the longest run of consecutive literal characters in a
+    parsed regex"""
+    best, run = "", ""
+    for op, av in items:
+        if op == _LITERAL:
+            run += chr(av)
+            if len(run) > len(best):
+                best = run
+        else:
+            run = ""
+    return best
+
+
+class RuleSet:
+    """An ordered collection of rules which finds the first rule
+    matching a line. Each rule is prefiltered by the literals it
+    requires, so the line is casefolded at most once and only rules
+    whose literals are present are fully evaluated. Results for
+    recently seen lines are optionally cached"""
+
+    _shared: dict[tuple[tuple[Rule, ...], int], "RuleSet"] = {}
+
+    def __init__(self, rules: Iterable[Rule], cache_size: int = 0):
+        self.rules = list(rules)
+        self.prefilters: list[tuple[Rule, tuple[str, ...] | None, bool, bool]] = []
+        for rule in self.rules:
+            literals = rule.literals()
+            if literals is None:
+                self.prefilters.append((rule, None, False, False))
+            else:
+                self.prefilters.append((rule, literals[0], literals[1], rule.exact()))
+
+        # return the index of the first rule which matches a line, or
+        # None if no rule matches
+        self.match: Callable[[str], int | None] = self._match
+        if cache_size > 0 and self.rules:
+            self.match = functools.lru_cache(maxsize=cache_size)(self._match)
+
+    @classmethod
+    def shared(cls, rules: Iterable[Rule], cache_size: int = 0) -> "RuleSet":
+        """Get a rule set shared with any other users of the same rules,
+        so that lines are only evaluated once across all of them"""
+        key = (tuple(rules), cache_size)
+        if key not in cls._shared:
+            cls._shared[key] = cls(key[0], cache_size)
+        return cls._shared[key]
+
+    def _match(self, line: str) -> int | None:
+        if not self.prefilters:
+            return None
+        ctx = MatchContext(line)
+        for i, (rule, literals, ignorecase, exact) in enumerate(self.prefilters):
+            # case-insensitive regexes and casefolding only agree for
+            # ascii text, so only prefilter regexes on ascii lines
+            if literals is not None and (exact or not ignorecase or ctx.ascii):
+                text = ctx.folded if ignorecase else line
+                for literal in literals:
+                    if literal in text:
+                        break
+                else:
+                    continue
+                if exact:
+                    return i
+            if rule.matches_context(ctx):
+                return i
+        return None
+
+    def match_lines(self, lines: list[str]) -> list[int | None]:
+        """The index of the first rule matching each of a batch of lines.
+        The batch is searched for each rule's literals all at once, so
+        only the lines containing them are checked individually. When
+        results are cached, those lines are looked up in the cache"""
+        res: list[int | None] = [None] * len(lines)
+        if not self.prefilters or not lines:
+            return res
+        cached = self.match is not self._match
+        text = "\n".join(lines)
+        ascii = text.isascii()
+        folded: str | None = None
+        # the offset of the start of each line in the text, and the end
+        starts = list(
+            itertools.accumulate((len(line) + 1 for line in lines), initial=0)
+        )
+        # the lines which may match a rule, when results are cached
+        candidates: set[int] = set()
+
+        for i, (rule, literals, ignorecase, exact) in enumerate(self.prefilters):
+            # casefolding non-ascii text may move the lines, so offsets
+            # in the casefolded text can only be used for ascii text
+            if literals is None or (ignorecase and not ascii):
+                if cached:
+                    return [self.match(line) for line in lines]
+                for k, line in enumerate(lines):
+                    if res[k] is None and rule.matches(line):
+                        res[k] = i
+                continue
+
+            haystack = text
+            if ignorecase:
+                if folded is None:
+                    folded = text.casefold()
+                haystack = folded
+            hits: set[int] = set()
+            for literal in literals:
+                if "\n" in literal:
+                    continue
+                pos = haystack.find(literal)
+                while pos != -1:
+                    k = bisect.bisect_right(starts, pos) - 1
+                    hits.add(k)
+                    pos = haystack.find(literal, starts[k + 1])
+            if cached:
+                candidates |= hits
+                continue
+            for k in sorted(hits):
+                if res[k] is None and (exact or rule.matches(lines[k])):
+                    res[k] = i
+
+        for k in sorted(candidates):
+            res[k] = self.match(lines[k])
+        return res
+
+    def __len__(self) -> int:
+        return len(self.rules)
@@ -1,105 +1,563 @@
 import atexit
+import contextlib
 import curses
+import errno
+import fcntl
+import os
+import pty
+import signal
+import struct
 import subprocess
+import termios
 import threading
-from typing import Any, Callable, TypeAlias
+import time
+from typing import Any, Callable, Generator, Sequence, TypeAlias
 
-from minimux.buffer import Buffer
+import minimux.width as width
+from minimux.ansi import ESCAPE, SgrParser
+from minimux.buffer import Buffer, RowAttr, Runs
 from minimux.colour import ColourManager
 from minimux.config import Command
+from minimux.ingest import LineQueue
+from minimux.reader import CHUNK_SIZE, LineReader
+from minimux.screen import Window
+from minimux.stats import runner_stats
 
 WindowBounds: TypeAlias = tuple[int, int, int, int]
 
+# the longest time between checks on processes which are stopping
+STOP_POLL_INTERVAL = 0.05
+
+# the signals which stop minimux the same way as an interrupt does
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGHUP)
+
 
 class Runner:
     def __init__(
         self,
         command: Command,
-        lock: threading.Lock,
+        lock: threading.RLock,
         colour_manager: ColourManager,
     ):
         self.command = command
         self.lock = lock
-        self.win: "curses._CursesWindow | None" = None
-        self.proc: subprocess.Popen[str] | None = None
+        self.win: Window | None = None
+        self.title_win: Window | None = None
+        self.proc: subprocess.Popen[bytes] | None = None
+        # whether the commands which depend on this one can be started,
+        # and whether the process has exited or could not be started
+        self.ready = False
+        self.exited = False
+        # the controlling side of the process's terminal, if it has one,
+        # which is resized and closed from different threads
+        self.master: int | None = None
+        self.master_lock = threading.Lock()
+        self.pty_size: tuple[int, int] | None = None
         self.bkgd = command.attr(colour_manager)
+        self.title_attr = command.title_attr(colour_manager)
+        self.focused = False
+        # the search query being typed, the last query searched for and
+        # a message to show in the title until the next key press
+        self.prompt: str | None = None
+        self.query = ""
+        self.message: str | None = None
+        self.dirty = False
+        self.redraw = True
+        self.drawn_rows: list[tuple[str, RowAttr]] = []
+        self.drawn_title: tuple[str, bool] | None = None
+        self.drawn_tag: str | None = None
+        self.reader = LineReader()
+        self.stats = runner_stats()
+        # lines waiting to be pushed to the buffer on the next frame, or
+        # None if lines are pushed as soon as they are read
+        self.queue: LineQueue | None = None
+        if command.overflow != "block":
+            self.queue = LineQueue(command.queue_size, command.overflow)
 
+        # escape sequences in the output, unless they are to be shown
+        self.sgr = SgrParser(colour_manager) if command.ansi else None
         rules = {r: a(colour_manager) for r, a in command.rules.items()}
-        self.buf = Buffer(0, 0, rules)
+        spill = None
+        if command.spill is not None:
+            # each command logs to its own directory
+            spill = os.path.join(command.spill, command.filename)
+        self.buf = Buffer(0, 0, rules, command.match_cache, command.scrollback, spill)
 
-    def init(self, stdscr: "curses._CursesWindow", bounds: WindowBounds):
-        with self.lock:
-            if self.win is not None:
-                del self.win
-            self.win = stdscr.subwin(*bounds)
-            self.win.bkgdset(" ", self.bkgd)
-            pt, pr, pb, pl = self.command.padding
-            self.buf.resize(
-                maxrows=bounds[0] - pt - pb,
-                maxcols=bounds[1] - pl - pr,
-            )
-        self.flush()
+    def init(self, stdscr: Window, bounds: WindowBounds):
+        """Create the subwindows for the title and output of the runner.
+        Must be called with the lock held"""
+        rows, cols, y, x = bounds
+        self.title_win = None
+        if self.command.title is not None:
+            self.title_win = stdscr.subwin(1, cols, y, x)
+            self.title_win.bkgdset(" ", self.bkgd)
+            self.drawn_title = None
+            rows, y = rows - 1, y + 1
+
+        self.win = stdscr.subwin(rows, cols, y, x)
+        self.win.bkgdset(" ", self.bkgd)
+        self.win.idlok(True)
+        pt, pr, pb, pl = self.command.padding
+        self.buf.resize(
+            maxrows=rows - pt - pb,
+            maxcols=cols - pl - pr,
+        )
+        if self.buf.maxrows > 0:
+            self.win.setscrreg(pt, pt + self.buf.maxrows - 1)
+        self.resize_pty()
+        self.dirty = True
+        self.redraw = True
 
     def start(self):
         t = threading.Thread(target=self.run, daemon=True)
         t.start()
 
     def run(self):
+        """Run the process and block until it exits, reading its output
+        on the calling thread"""
+        if not self.spawn():
+            return
+
+        assert self.proc is not None
+        while data := self.read():
+            self.feed(data)
+        self.finish()
+        self.proc.wait()
+        self.reap()
+
+    def spawn(self) -> bool:
+        """Start the process, returning whether it started successfully"""
+        try:
+            if self.command.pty:
+                self.proc = self.spawn_pty()
+            else:
+                self.proc = subprocess.Popen(
+                    self.command.command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.PIPE,
+                    shell=self.command.shell,
+                    bufsize=0,
+                    start_new_session=True,
+                )
+
+                # ensure we are connected to stdin/stdout
+                assert self.proc.stdin is not None
+                assert self.proc.stdout is not None
+
+            # ensure the program is terminated at exit
+            atexit.register(self.kill_at_exit)
+        except Exception as e:
+            self.exited = True
+            self.ingest(["error: failed to start process: " + str(e)])
+            return False
+        if self.command.ready is None:
+            self.ready = True
+
+        data = b""
+        if self.command.input is not None:
+            data = (self.command.input + "\n").encode()
+        if self.master is not None:
+            # end of file is signalled by the terminal's eof character
+            os.write(self.master, data + b"\x04")
+        elif self.proc.stdin is not None:
+            try:
+                self.proc.stdin.write(data)
+            except BrokenPipeError:
+                # the process exited or closed its input without reading it
+                pass
+            self.proc.stdin.close()
+        return True
+
+    def spawn_pty(self) -> "subprocess.Popen[bytes]":
+        """Start the process on a pseudo-terminal the size of the pane,
+        so that it writes its output as it would to a terminal, without
+        waiting to fill a buffer first"""
+        master, slave = pty.openpty()
         try:
-            self.proc = subprocess.Popen(
+            # the input written to the process should not be output
+            attrs = termios.tcgetattr(slave)
+            attrs[3] &= ~termios.ECHO
+            termios.tcsetattr(slave, termios.TCSANOW, attrs)
+            self.master = master
+            self.resize_pty()
+            return subprocess.Popen(
                 self.command.command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                stdin=subprocess.PIPE,
+                stdout=slave,
+                stderr=slave,
+                stdin=slave,
                 shell=self.command.shell,
-                text=True,
+                start_new_session=True,
             )
+        except Exception:
+            os.close(master)
+            self.master = None
+            raise
+        finally:
+            os.close(slave)
 
-            # ensure the program is terminated at exit
-            atexit.register(self.proc.kill)
+    def resize_pty(self):
+        """Set the size of the process's terminal to the size of the pane,
+        which the process is told of with SIGWINCH. The terminal is not
+        the controlling terminal of the process, as that can only be set
+        by the child before it runs the command, which is not safe once
+        there are threads, so the signal is sent here instead of by the
+        terminal"""
+        rows = self.buf.maxrows if self.buf.maxrows > 0 else 24
+        cols = self.buf.maxcols if self.buf.maxcols > 0 else 80
+        with self.master_lock:
+            if self.master is None or self.pty_size == (rows, cols):
+                return
+            size = struct.pack("HHHH", rows, cols, 0, 0)
+            fcntl.ioctl(self.master, termios.TIOCSWINSZ, size)
+            self.pty_size = (rows, cols)
+        self.send_signal(signal.SIGWINCH)
 
-            # ensure we are connected to stdin/stdout
-            assert self.proc.stdin is not None
-            assert self.proc.stdout is not None
-        except Exception as e:
-            self.buf.push("error: failed to start process: " + str(e))
-            self.flush()
-            return
+    def fileno(self) -> int:
+        """The file descriptor to read the process output from"""
+        if self.master is not None:
+            return self.master
+        assert self.proc is not None and self.proc.stdout is not None
+        return self.proc.stdout.fileno()
 
-        if self.command.input is not None:
-            self.proc.stdin.write(self.command.input + "\n")
-            self.proc.stdin.flush()
-        self.proc.stdin.close()
+    def read(self) -> bytes:
+        """Read a chunk of the process output, returning an empty chunk
+        at the end of it"""
+        try:
+            return os.read(self.fileno(), CHUNK_SIZE)
+        except OSError as e:
+            # a pseudo-terminal fails to read once the process has
+            # exited, rather than reporting end of file
+            if e.errno == errno.EIO and self.master is not None:
+                return b""
+            raise
+
+    def feed(self, data: bytes):
+        """Handle a chunk of output read from the process, pushing every
+        line it completes in a single batch"""
+        self.stats.add("bytes", len(data))
+        self.ingest(self.reader.feed(data))
 
-        while self.proc.poll() is None:
-            stdout = self.proc.stdout.readline().rstrip()
-            self.buf.push(stdout)
-            self.flush()
+    def finish(self):
+        """Handle the end of the process output"""
+        with self.master_lock:
+            if self.master is not None:
+                os.close(self.master)
+                self.master = None
+        self.ingest(self.reader.close())
 
-        for line in self.proc.stdout.readlines():
-            self.buf.push(line.rstrip())
+    def ingest(self, lines: list[str]):
+        """Handle lines read from the process, queueing them until the
+        next frame if the runner has a queue"""
+        self.stats.add("lines", len(lines))
+        self.match_ready(lines)
+        if self.queue is None:
+            self.emit(lines)
+        elif lines:
+            self.queue.put(lines)
+            self.notify()
 
-        self.buf.push(f"** Process exited with status code {self.proc.poll()} **")
-        self.flush()
+    def drain(self):
+        """Handle any lines waiting in the queue"""
+        if self.queue is not None and (lines := self.queue.take()):
+            self.emit(lines)
 
-    def terminate(self) -> Callable[[], Any]:
+    def emit(self, lines: list[str]):
+        """Handle complete lines of output"""
+        with self.stats.timed("rule_time"):
+            lines, escapes = self.decode(lines)
+            attrs = self.buf.highlight_lines(lines, escapes)
+        self.buf.extend(lines, attrs)
+        self.notify()
+
+    def decode(self, lines: list[str]) -> tuple[list[str], list[RowAttr] | None]:
+        """Remove escape sequences from lines, returning the attributes
+        they selected if any were selected"""
+        if self.sgr is None:
+            return lines, None
+        return self.sgr.parse_lines(lines)
+
+    def match_ready(self, lines: list[str]):
+        """Mark the runner as ready once a line of output matches its
+        command's ready pattern. Lines are checked as they are read, as
+        the line showing the command is ready may be dropped from the
+        queue"""
+        pattern = self.command.ready
+        if self.ready or pattern is None:
+            return
+        if self.sgr is not None:
+            # the pattern matches lines as they are shown
+            lines = [ESCAPE.sub("", line) if "\x1b" in line else line for line in lines]
+        self.ready = any(pattern.search(line) for line in lines)
+
+    def reap(self) -> bool:
+        """Report the exit status of the process once it has exited,
+        returning whether it has"""
+        assert self.proc is not None
+        code = self.proc.poll()
+        if code is None:
+            return False
+        self.ingest([f"** Process exited with status code {code} **"])
+        self.exited = True
+        return True
+
+    def terminate(self):
+        """Stop drawing the runner and ask the process to exit"""
         with self.lock:
             self.win = None
-        if self.proc != None:
-            self.proc.kill()
-            return self.proc.wait
-        return lambda: None
+            self.title_win = None
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def kill_at_exit(self):
+        """Kill the process if it is still running as minimux exits. Once
+        it has been reaped its process group id may belong to something
+        else, so nothing is killed"""
+        if self.proc is not None and self.proc.poll() is None:
+            self.kill()
+
+    def send_signal(self, sig: int):
+        """Send a signal to the process and everything it started. Each
+        process is started in a session of its own, so its process group
+        includes any children left running after it has exited"""
+        if self.proc is None:
+            return
+        try:
+            os.killpg(self.proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            # the group has gone, or everything left in it has changed
+            # its user
+            pass
+
+    def group_alive(self) -> bool:
+        """Whether anything in the process group is still running, which
+        may be the case after the process itself has exited"""
+        if self.proc is None:
+            return False
+        self.proc.poll()
+        try:
+            os.killpg(self.proc.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # the group is still there, but has changed its user
+            return True
+        return True
+
+    def close(self):
+        """Release the files kept open for the output, once the process
+        has been stopped"""
+        self.buf.close()
+
+    def describe_exit(self) -> str:
+        """How far the process has got with exiting"""
+        if self.proc is None:
+            return "not started"
+        code = self.proc.returncode
+        if code is None:
+            return "stopping"
+        if code == -signal.SIGKILL:
+            return "killed"
+        return f"exited with status {code}"
+
+    def notify(self):
+        """Mark the runner as needing to be redrawn on the next frame"""
+        self.dirty = True
+
+    def focus(self, focused: bool):
+        """Set whether the runner has keyboard focus"""
+        self.focused = focused
+        self.notify()
+
+    def search(self, older: bool = True):
+        """Jump to the next match for the last search query"""
+        if not self.buf.search(self.query, older):
+            self.message = "not found"
+        self.notify()
 
     def flush(self):
-        with self.lock:
-            if self.win is None:
-                return
-            self.win.clear()
-            for i, (line, attr) in enumerate(self.buf):
-                self.win.move(
-                    i + self.command.padding[0],
-                    self.command.padding[3],
-                )
-                self.win.addstr(line, attr)
-            self.win.refresh()
-            curses.doupdate()
+        """Draw the buffer to the virtual screen. Must be called with the
+        lock held, and followed by a call to the screen's doupdate"""
+        with self.stats.timed("flush_time"):
+            self._flush()
+        self.stats.add("flushes")
+
+    def snapshot(self) -> dict[str, Any]:
+        """The counters of the runner, for writing to a stats file"""
+        return {
+            "title": self.command.label,
+            "rules": len(self.command.rules),
+            "dropped": self.queue.dropped if self.queue is not None else 0,
+            **self.stats.snapshot(),
+        }
+
+    def _flush(self):
+        self.dirty = False
+        if self.win is None:
+            return
+        self.flush_title()
+
+        rows, appended = self.buf.take_frame()
+        if self.redraw or appended >= self.buf.maxrows:
+            # nothing on screen can be reused
+            self.win.erase()
+            self.redraw = False
+            self.drawn_rows = []
+            self.drawn_tag = None
+        elif appended > 0:
+            # shift the rows still visible up by the number which were
+            # evicted so only the new ones underneath need drawing
+            evicted = len(self.drawn_rows) + appended - len(rows)
+            if evicted > 0:
+                self.win.scrollok(True)
+                self.win.scroll(evicted)
+                self.win.scrollok(False)
+                self.drawn_rows = self.drawn_rows[evicted:]
+
+        tag = self.tag()
+        if self.drawn_tag is not None and tag != self.drawn_tag:
+            # uncover the rows underneath the old tag
+            self.win.move(0, 0)
+            self.win.clrtoeol()
+            self.drawn_rows = []
+            self.drawn_tag = None
+
+        pt, _, _, pl = self.command.padding
+        for i, row in enumerate(rows):
+            if i < len(self.drawn_rows) and self.drawn_rows[i] == row:
+                continue
+            self.win.move(i + pt, pl)
+            self.win.clrtoeol()
+            line, attr = row
+            try:
+                if isinstance(attr, Runs):
+                    for start, end, a in attr.runs(len(line)):
+                        self.win.addstr(line[start:end], a)
+                else:
+                    self.win.addstr(line, attr)
+            except curses.error:
+                # writing the bottom right cell fails to move the cursor
+                # on, but the text is still written
+                pass
+        for i in range(len(rows), len(self.drawn_rows)):
+            self.win.move(i + pt, pl)
+            self.win.clrtoeol()
+        self.drawn_rows = rows
+        if tag is not None:
+            # drawn every time, as rows drawn or scrolled under it cover it
+            text = f" {tag} "
+            cols = self.win.getmaxyx()[1]
+            x = max(0, cols - width.width(text))
+            attr = self.title_attr
+            if self.focused:
+                attr |= curses.A_REVERSE
+            self.win.insstr(0, x, width.truncate(text, cols), attr)
+            self.drawn_tag = tag
+        self.win.noutrefresh()
+
+    def tag(self) -> str | None:
+        """For a pane without a title, the text drawn in its top right
+        corner in place of one while it has focus or there is something
+        to note, such as lines having been dropped"""
+        if self.command.title is not None:
+            return None
+        tag = self.title_text(self.command.label)
+        if not self.focused and tag == self.command.label:
+            return None
+        return tag
+
+    def title_text(self, title: str) -> str:
+        """The title with notes on how far back the pane is scrolled and
+        how many lines have been dropped, or the search prompt in place
+        of it"""
+        if self.prompt is not None:
+            return "/" + self.prompt
+        notes: list[str] = []
+        if self.message is not None:
+            notes.append(self.message)
+        elif below := self.buf.rows_below():
+            notes.append(f"+{below}")
+        if self.queue is not None and (dropped := self.queue.describe()):
+            notes.append(dropped)
+        if notes:
+            return f"{title} ({', '.join(notes)})"
+        return title
+
+    def flush_title(self):
+        """Draw the title, highlighted when the runner has focus and
+        showing how far back the pane is scrolled, how many lines have
+        been dropped or the search prompt"""
+        if self.title_win is None or self.command.title is None:
+            return
+        title = self.title_text(self.command.title)
+        if self.drawn_title == (title, self.focused):
+            return
+        self.drawn_title = (title, self.focused)
+
+        cols = self.title_win.getmaxyx()[1]
+        attr = self.title_attr
+        if self.focused:
+            attr |= curses.A_REVERSE
+        self.title_win.erase()
+        x = max(0, (cols - width.width(title)) // 2)
+        self.title_win.insstr(0, x, width.truncate(title, cols), attr)
+        self.title_win.noutrefresh()
+
+
+def stop_all(
+    runners: Sequence[Runner],
+    timeout: float,
+    progress: Callable[[], Any] | None = None,
+):
+    """Send SIGTERM to every runner at once and wait for everything they
+    started to exit, sending SIGKILL to any process group still running
+    once timeout seconds have passed, so that stopping takes at most one
+    timeout however many runners there are. progress is called each
+    time the processes are checked on"""
+    for runner in runners:
+        runner.terminate()
+    deadline = time.monotonic() + timeout
+    while True:
+        running = [r for r in runners if r.group_alive()]
+        if progress is not None:
+            progress()
+        remaining = deadline - time.monotonic()
+        if not running or remaining <= 0:
+            break
+        # children left in a group cannot be waited on, so are polled
+        time.sleep(min(remaining, STOP_POLL_INTERVAL))
+
+    for runner in runners:
+        runner.kill()
+    for runner in runners:
+        if runner.proc is not None:
+            runner.proc.wait()
+        # the processes are gone, so there is nothing left to kill
+        atexit.unregister(runner.kill_at_exit)
+    if progress is not None:
+        progress()
+
+
+def _interrupt(signum: int, frame: Any):
+    raise KeyboardInterrupt
+
+
+@contextlib.contextmanager
+def stop_signals() -> Generator[None, None, None]:
+    """Raise KeyboardInterrupt when minimux is asked to stop by a signal,
+    such as when its terminal is closed, so that the processes it
+    started are stopped before it exits. The processes each have a
+    session of their own, so would not be sent the signal themselves.
+    Handlers can only be installed on the main thread, so nothing is
+    done on any other"""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = {sig: signal.signal(sig, _interrupt) for sig in STOP_SIGNALS}
+    try:
+        yield
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,43 @@
+from typing import Generic, TypeVar
+
+from minimux.runner import Runner
+
+R = TypeVar("R", bound=Runner)
+
+
+class Scheduler(Generic[R]):
+    """Decides when each runner is started: as soon as every runner its
+    command depends on is ready, so that commands which do not depend on
+    each other start in parallel and the whole config is up as soon as
+    its slowest chain of dependencies is. A runner is ready once it has
+    started if its command has no ready pattern, and otherwise once a
+    line of its output matches the pattern"""
+
+    def __init__(self, runners: dict[str, R]):
+        self.runners = runners
+        # the runners which have not been started yet
+        self.pending = dict(runners)
+        for runner in runners.values():
+            if deps := runner.command.depends_on:
+                labels = ", ".join(runners[d].command.label for d in deps)
+                runner.ingest([f"** Waiting for {labels} **"])
+
+    def due(self) -> list[R]:
+        """The runners which can be started now, which are no longer
+        pending once returned. A runner which can never be started, as a
+        command it depends on exited without becoming ready, is dropped
+        and counts as having exited itself"""
+        due: list[R] = []
+        for name, runner in list(self.pending.items()):
+            deps = [self.runners[d] for d in runner.command.depends_on]
+            if failed := [d for d in deps if d.exited and not d.ready]:
+                del self.pending[name]
+                runner.exited = True
+                label = failed[0].command.label
+                runner.ingest(
+                    [f"** Not started: {label} exited before it was ready **"]
+                )
+            elif all(d.ready for d in deps):
+                del self.pending[name]
+                due.append(runner)
+        return due
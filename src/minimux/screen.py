@@ -0,0 +1,632 @@
+import abc
+import curses
+import os
+import select
+import signal
+import termios
+import tty
+from collections import deque
+from typing import Any, Callable, Iterable, Protocol
+
+from minimux.colour import AnsiColourManager, ColourManager
+from minimux.width import char_width
+
+
+class Window(Protocol):
+    """The parts of a curses window which minimux draws with"""
+
+    def subwin(self, nlines: int, ncols: int, y: int, x: int) -> "Window": ...
+    def getmaxyx(self) -> tuple[int, int]: ...
+    def bkgdset(self, ch: str, attr: int = ...) -> Any: ...
+    def idlok(self, flag: bool) -> Any: ...
+    def setscrreg(self, top: int, bottom: int) -> Any: ...
+    def scrollok(self, flag: bool) -> Any: ...
+    def scroll(self, lines: int = ...) -> Any: ...
+    def erase(self) -> Any: ...
+    def clear(self) -> Any: ...
+    def move(self, y: int, x: int) -> Any: ...
+    def clrtoeol(self) -> Any: ...
+    def addstr(self, *args: Any) -> Any: ...
+    def addch(self, *args: Any) -> Any: ...
+    def insstr(self, *args: Any) -> Any: ...
+    def inch(self, y: int, x: int) -> int: ...
+    def noutrefresh(self) -> Any: ...
+    def refresh(self) -> Any: ...
+    def nodelay(self, flag: bool) -> Any: ...
+    def getch(self) -> int: ...
+
+
+class Screen(abc.ABC):
+    """A terminal for minimux to draw to. The windows it creates follow
+    curses' model, where drawing to a window changes a virtual screen
+    and doupdate makes the terminal match it"""
+
+    @abc.abstractmethod
+    def wrapper(self, fn: Callable[[Window], None]):
+        """Set up the terminal, call fn with the window covering all of
+        it and restore the terminal afterwards"""
+
+    @abc.abstractmethod
+    def doupdate(self):
+        """Update the terminal to match the virtual screen"""
+
+    @abc.abstractmethod
+    def acs(self, name: str) -> int:
+        """The line drawing character with curses' name without the ACS_
+        prefix, such as SBSB for a vertical line"""
+
+    @abc.abstractmethod
+    def colour_manager(self) -> ColourManager:
+        """A colour manager making attributes which can be drawn"""
+
+    def fit(self):
+        """Resize the virtual screen to match the terminal after
+        KEY_RESIZE. Must not be called while drawing"""
+
+
+class CursesScreen(Screen):
+    """The terminal minimux is running in, drawn to with curses"""
+
+    def wrapper(self, fn: Callable[[Window], None]):
+        def setup(stdscr: Window):
+            curses.curs_set(False)
+            curses.use_default_colors()
+            curses.set_escdelay(25)
+            fn(stdscr)
+
+        curses.wrapper(setup)
+
+    def doupdate(self):
+        curses.doupdate()
+
+    def acs(self, name: str) -> int:
+        return getattr(curses, "ACS_" + name)
+
+    def colour_manager(self) -> ColourManager:
+        return ColourManager()
+
+
+# line drawing characters are stored as the VT100 characters which
+# select them with A_ALTCHARSET set, as curses does
+_ACS = {
+    "BSBS": "q",
+    "SBSB": "x",
+    "SSSS": "n",
+    "SSSB": "t",
+    "SBSS": "u",
+    "BSSS": "w",
+    "SSBS": "v",
+    "BSSB": "l",
+    "BBSS": "k",
+    "SSBB": "m",
+    "SBBS": "j",
+}
+
+_ACS_GLYPHS = str.maketrans("qxntuwvlkmj", "─│┼├┤┬┴┌┐└┘")
+
+
+class Frame:
+    """What changed on the terminal in one call to doupdate"""
+
+    __slots__ = ("cells", "runs", "bytes", "writes")
+
+    def __init__(self, cells: int, runs: int, bytes: int, writes: int):
+        # the number of cells which changed, the number of runs of
+        # adjacent changed cells, which each need the cursor moving to
+        # them, the number of bytes of text in the changed cells and the
+        # number of cells drawn to since the last frame, changed or not
+        self.cells = cells
+        self.runs = runs
+        self.bytes = bytes
+        self.writes = writes
+
+    def __repr__(self) -> str:
+        return (
+            f"Frame(cells={self.cells}, runs={self.runs}, "
+            f"bytes={self.bytes}, writes={self.writes})"
+        )
+
+
+class MemoryScreen(Screen):
+    """A screen held in memory, for testing and measuring drawing without
+    a terminal. Each doupdate compares the virtual screen with what was
+    last displayed, recording a Frame of what a terminal would have had
+    to redraw. Keys to return from getch can be queued, and once they
+    run out a blocking getch raises KeyboardInterrupt to end the run"""
+
+    def __init__(self, rows: int = 24, cols: int = 80, keys: Iterable[int] = ()):
+        self.keys = deque(keys)
+        self.cm = AnsiColourManager()
+        self.frames: list[Frame] = []
+        self.writes = 0
+        self.stdscr: MemoryWindow | None = None
+        self._resize(rows, cols)
+
+    def wrapper(self, fn: Callable[[Window], None]):
+        fn(self.window())
+
+    def window(self) -> "MemoryWindow":
+        """The window covering the whole screen"""
+        assert self.stdscr is not None
+        return self.stdscr
+
+    def resize(self, rows: int, cols: int):
+        """Change the size of the screen, queueing KEY_RESIZE as curses
+        does. Everything drawn is lost"""
+        self._resize(rows, cols)
+        self.keys.append(curses.KEY_RESIZE)
+
+    def _resize(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.chars = [[" "] * cols for _ in range(rows)]
+        self.attrs = [[0] * cols for _ in range(rows)]
+        # the contents of the terminal as of the last doupdate, or None
+        # if it must be redrawn in full
+        self.shown: list[tuple[list[str], list[int]]] | None = None
+        if self.stdscr is None:
+            self.stdscr = MemoryWindow(self, rows, cols, 0, 0)
+        else:
+            self.stdscr.rows, self.stdscr.cols = rows, cols
+            self.stdscr.top, self.stdscr.bottom = 0, rows - 1
+
+    def doupdate(self):
+        changes = self.changes()
+        cells = sum(end - start for _, start, end in changes)
+        size = sum(
+            len("".join(self.chars[y][start:end]).encode("utf-8", "replace"))
+            for y, start, end in changes
+        )
+        self.frames.append(Frame(cells, len(changes), size, self.writes))
+        self.writes = 0
+
+    def changes(self) -> list[tuple[int, int, int]]:
+        """The runs of cells on each row which differ from what was last
+        displayed, as the row and the start and end columns, marking the
+        virtual screen as displayed"""
+        changes: list[tuple[int, int, int]] = []
+        shown = self.shown
+        if shown is None:
+            changes = [(y, 0, self.cols) for y in range(self.rows) if self.cols]
+            self.shown = [(list(c), list(a)) for c, a in zip(self.chars, self.attrs)]
+            return changes
+
+        for y in range(self.rows):
+            chars, attrs = self.chars[y], self.attrs[y]
+            old_chars, old_attrs = shown[y]
+            if old_chars == chars and old_attrs == attrs:
+                continue
+            first = len(changes)
+            start = -1
+            for x in range(self.cols):
+                if old_chars[x] == chars[x] and old_attrs[x] == attrs[x]:
+                    if start >= 0:
+                        changes.append((y, start, x))
+                        start = -1
+                elif start < 0:
+                    start = x
+            if start >= 0:
+                changes.append((y, start, self.cols))
+            # a run must cover both cells of a wide character
+            for i in range(first, len(changes)):
+                _, start, end = changes[i]
+                if start > 0 and chars[start] == "":
+                    start -= 1
+                if end < self.cols and chars[end] == "":
+                    end += 1
+                changes[i] = (y, start, end)
+            shown[y] = (list(chars), list(attrs))
+        return changes
+
+    def getch(self, blocking: bool) -> int:
+        if self.keys:
+            return self.keys.popleft()
+        if blocking:
+            raise KeyboardInterrupt
+        return -1
+
+    def acs(self, name: str) -> int:
+        return curses.A_ALTCHARSET | ord(_ACS[name])
+
+    def colour_manager(self) -> ColourManager:
+        return self.cm
+
+    def lines(self) -> list[str]:
+        """The text displayed on each row of the terminal, with line
+        drawing characters as their unicode equivalents"""
+        lines = []
+        for y in range(self.rows):
+            if self.shown is None:
+                chars, attrs = [" "] * self.cols, [0] * self.cols
+            else:
+                chars, attrs = self.shown[y]
+            line = "".join(
+                ch.translate(_ACS_GLYPHS) if attr & curses.A_ALTCHARSET else ch
+                for ch, attr in zip(chars, attrs)
+            )
+            lines.append(line)
+        return lines
+
+    def attr(self, y: int, x: int) -> int:
+        """The attribute displayed at a cell of the terminal"""
+        assert self.shown is not None
+        return self.shown[y][1][x]
+
+
+class MemoryWindow:
+    """A window of a memory screen. As with curses subwindows, every
+    window draws directly to the screen's cells, so noutrefresh does
+    nothing and the screen changes as soon as it is drawn to"""
+
+    def __init__(self, screen: MemoryScreen, rows: int, cols: int, y: int, x: int):
+        self.screen = screen
+        self.rows = rows
+        self.cols = cols
+        self.y = y
+        self.x = x
+        self.cy = 0
+        self.cx = 0
+        self.bkgd = 0
+        self.top = 0
+        self.bottom = rows - 1
+        self.scrolling = False
+        self.blocking = True
+
+    def subwin(self, nlines: int, ncols: int, y: int, x: int) -> "MemoryWindow":
+        screen = self.screen
+        if (
+            nlines <= 0
+            or ncols <= 0
+            or y + nlines > screen.rows
+            or x + ncols > screen.cols
+        ):
+            raise curses.error("window does not fit on the screen")
+        return MemoryWindow(self.screen, nlines, ncols, y, x)
+
+    def getmaxyx(self) -> tuple[int, int]:
+        return self.rows, self.cols
+
+    def bkgdset(self, ch: str, attr: int = 0):
+        self.bkgd = attr
+
+    def idlok(self, flag: bool):
+        pass
+
+    def setscrreg(self, top: int, bottom: int):
+        if not 0 <= top <= bottom < self.rows:
+            raise curses.error("invalid scrolling region")
+        self.top = top
+        self.bottom = bottom
+
+    def scrollok(self, flag: bool):
+        self.scrolling = flag
+
+    def scroll(self, lines: int = 1):
+        if not self.scrolling:
+            raise curses.error("scrolling is not enabled")
+        chars, attrs = self.screen.chars, self.screen.attrs
+        x, end = self.x, self.x + self.cols
+        region = range(self.y + self.top, self.y + self.bottom + 1)
+        rows = [(chars[y][x:end], attrs[y][x:end]) for y in region]
+        blank = ([" "] * self.cols, [self.bkgd] * self.cols)
+        rows = (rows + [blank] * len(rows))[lines : lines + len(rows)]
+        for y, (c, a) in zip(region, rows):
+            chars[y][x:end] = c
+            attrs[y][x:end] = a
+
+    def erase(self):
+        for y in range(self.rows):
+            self._fill(y, 0)
+        self.cy = self.cx = 0
+
+    def clear(self):
+        self.erase()
+        # the next update redraws the whole terminal
+        self.screen.shown = None
+
+    def move(self, y: int, x: int):
+        if not (0 <= y < self.rows and 0 <= x < self.cols):
+            raise curses.error("cursor position outside the window")
+        self.cy = y
+        self.cx = x
+
+    def clrtoeol(self):
+        self._fill(self.cy, self.cx)
+
+    def addstr(self, *args: Any):
+        """Write text at the cursor, wrapping onto the next row. Raises
+        curses.error if the text reaches the bottom right corner, after
+        writing all of it that fits"""
+        if len(args) >= 3 and isinstance(args[0], int):
+            self.move(args[0], args[1])
+            args = args[2:]
+        text: str = args[0]
+        attr = self._attr(args[1] if len(args) > 1 else 0)
+        for ch in text:
+            self._put(ch, attr)
+
+    def addch(self, *args: Any):
+        if len(args) >= 3 and isinstance(args[0], int) and isinstance(args[1], int):
+            self.move(args[0], args[1])
+            args = args[2:]
+        ch = args[0]
+        attr = args[1] if len(args) > 1 else 0
+        if isinstance(ch, int):
+            attr |= ch & curses.A_ATTRIBUTES
+            ch = chr(ch & curses.A_CHARTEXT)
+        self._put(ch, self._attr(attr))
+
+    def insstr(self, *args: Any):
+        """Insert text before the cursor, shifting the rest of the row
+        right and losing whatever falls off its end. The cursor does not
+        move"""
+        if len(args) >= 3 and isinstance(args[0], int):
+            self.move(args[0], args[1])
+            args = args[2:]
+        cells = _cells(args[0])
+        text = cells[: self.cols - self.cx]
+        if len(cells) > len(text) and cells[len(text)] == "":
+            # the last character is wide and only half of it fits
+            text[-1] = " "
+        attr = self._attr(args[1] if len(args) > 1 else 0)
+        y, start, end = self.y + self.cy, self.x + self.cx, self.x + self.cols
+        chars, attrs = self.screen.chars[y], self.screen.attrs[y]
+        _clear_wide(chars, start, end)
+        chars[start:end] = (text + chars[start:end])[: end - start]
+        attrs[start:end] = ([attr] * len(text) + attrs[start:end])[: end - start]
+        if chars[end - 1] and char_width(chars[end - 1][0]) == 2:
+            # half of a wide character was shifted off the end
+            chars[end - 1] = " "
+        self.screen.writes += len(text)
+
+    def inch(self, y: int, x: int) -> int:
+        self.move(y, x)
+        ch = self.screen.chars[self.y + y][self.x + x]
+        return (ord(ch) & curses.A_CHARTEXT) | self.screen.attrs[self.y + y][self.x + x]
+
+    def noutrefresh(self):
+        pass
+
+    def refresh(self):
+        self.screen.doupdate()
+
+    def nodelay(self, flag: bool):
+        self.blocking = not flag
+
+    def getch(self) -> int:
+        return self.screen.getch(self.blocking)
+
+    def _attr(self, attr: int) -> int:
+        """Combine an attribute with the background, whose colour is used
+        when the attribute has none, as curses does"""
+        if attr & curses.A_COLOR:
+            return attr | (self.bkgd & ~curses.A_COLOR)
+        return attr | self.bkgd
+
+    def _put(self, ch: str, attr: int):
+        """Write a character at the cursor. A wide character fills two
+        cells, the second of which is left empty, and a combining
+        character is added to the character before the cursor"""
+        w = 1 if ch.isascii() else char_width(ch)
+        if w == 0:
+            self._combine(ch)
+            return
+        if w == 2 and self.cx + 1 >= self.cols:
+            # a wide character which does not fit starts the next row
+            self._put(" ", self.bkgd)
+        y, x = self.y + self.cy, self.x + self.cx
+        chars, attrs = self.screen.chars[y], self.screen.attrs[y]
+        _clear_wide(chars, x, x + w)
+        chars[x : x + w] = [ch, ""][:w]
+        attrs[x : x + w] = [attr] * w
+        self.screen.writes += w
+        if self.cx + w < self.cols:
+            self.cx += w
+        elif self.cy + 1 < self.rows:
+            self.cy += 1
+            self.cx = 0
+        else:
+            raise curses.error("wrote to the bottom right corner")
+
+    def _combine(self, ch: str):
+        y, x = self.cy, self.cx - 1
+        if x < 0:
+            if y == 0:
+                return
+            y, x = y - 1, self.cols - 1
+        chars = self.screen.chars[self.y + y]
+        x += self.x
+        if chars[x] == "" and x > 0:
+            x -= 1
+        chars[x] += ch
+
+    def _fill(self, y: int, x: int):
+        """Clear a row of the window from a column to its end"""
+        y, start, end = self.y + y, self.x + x, self.x + self.cols
+        _clear_wide(self.screen.chars[y], start, end)
+        self.screen.chars[y][start:end] = [" "] * (end - start)
+        self.screen.attrs[y][start:end] = [self.bkgd] * (end - start)
+
+
+def _cells(text: str) -> list[str]:
+    """The characters of text as they fill cells, with an empty cell after
+    each wide character and combining characters joined to the character
+    before them"""
+    cells: list[str] = []
+    for ch in text:
+        w = char_width(ch)
+        if w == 0:
+            if cells:
+                cells[-2 if cells[-1] == "" else -1] += ch
+        elif w == 2:
+            cells += [ch, ""]
+        else:
+            cells.append(ch)
+    return cells
+
+
+def _clear_wide(chars: list[str], start: int, end: int):
+    """Blank the rest of any wide character which is partly overwritten by
+    writing to the cells from start to end"""
+    if 0 < start < len(chars) and chars[start] == "":
+        chars[start - 1] = " "
+    if end < len(chars) and chars[end] == "":
+        chars[end] = " "
+
+
+# escape sequences sent by common terminals for the keys minimux uses,
+# and the curses key codes they are returned as
+_KEYS = {
+    "\x1b[A": curses.KEY_UP,
+    "\x1b[B": curses.KEY_DOWN,
+    "\x1b[C": curses.KEY_RIGHT,
+    "\x1b[D": curses.KEY_LEFT,
+    "\x1bOA": curses.KEY_UP,
+    "\x1bOB": curses.KEY_DOWN,
+    "\x1bOC": curses.KEY_RIGHT,
+    "\x1bOD": curses.KEY_LEFT,
+    "\x1b[H": curses.KEY_HOME,
+    "\x1b[F": curses.KEY_END,
+    "\x1bOH": curses.KEY_HOME,
+    "\x1bOF": curses.KEY_END,
+    "\x1b[1~": curses.KEY_HOME,
+    "\x1b[4~": curses.KEY_END,
+    "\x1b[7~": curses.KEY_HOME,
+    "\x1b[8~": curses.KEY_END,
+    "\x1b[5~": curses.KEY_PPAGE,
+    "\x1b[6~": curses.KEY_NPAGE,
+    "\x1b[Z": curses.KEY_BTAB,
+}
+
+# the longest gap between changed cells on a row which is rewritten
+# rather than moved over
+_GAP = 4
+
+_ENTER = "\x1b[?1049h\x1b[?25l\x1b[0m\x1b[2J"
+_EXIT = "\x1b[0m\x1b[?25h\x1b[?1049l"
+
+
+class AnsiScreen(MemoryScreen):
+    """Draws to the terminal by writing ANSI escape sequences directly,
+    instead of through curses. The virtual screen is kept as a back
+    buffer of cells, and each doupdate sends only the runs of cells which
+    differ from the front buffer, moving the cursor only between runs and
+    changing attributes only where they change, in a single write. Hex
+    and rgb colours are sent as 24-bit colour, so are not limited by the
+    number of colours curses can define"""
+
+    def __init__(self, fd_in: int = 0, fd_out: int = 1):
+        self.fd_in = fd_in
+        self.fd_out = fd_out
+        self.sequences: dict[int, str] = {}
+        super().__init__(0, 0)
+
+    def wrapper(self, fn: Callable[[Window], None]):
+        self.fit()
+        saved = termios.tcgetattr(self.fd_in)
+        handler = signal.signal(
+            signal.SIGWINCH, lambda *_: self.keys.append(curses.KEY_RESIZE)
+        )
+        try:
+            # cbreak mode still turns ctrl-c into KeyboardInterrupt
+            tty.setcbreak(self.fd_in)
+            self.write(_ENTER)
+            fn(self.window())
+        finally:
+            self.write(_EXIT)
+            signal.signal(signal.SIGWINCH, handler)
+            termios.tcsetattr(self.fd_in, termios.TCSADRAIN, saved)
+
+    def doupdate(self):
+        chars, attrs, sequences = self.chars, self.attrs, self.sequences
+        out: list[str] = []
+        cursor = (-1, -1)
+        current = -1
+        runs: list[tuple[int, int, int]] = []
+        for y, start, end in self.changes():
+            # rewriting a few unchanged cells is shorter than moving the
+            # cursor over them
+            if runs and runs[-1][0] == y and start - runs[-1][2] <= _GAP:
+                runs[-1] = (y, runs[-1][1], end)
+            else:
+                runs.append((y, start, end))
+        for y, start, end in runs:
+            if cursor != (y, start):
+                out.append(f"\x1b[{y + 1};{start + 1}H")
+            row, row_attrs = chars[y], attrs[y]
+            x = start
+            while x < end:
+                # the longest run of cells with the same attribute
+                attr = row_attrs[x]
+                run = x + 1
+                while run < end and row_attrs[run] == attr:
+                    run += 1
+                if attr != current:
+                    if attr not in sequences:
+                        sequences[attr] = self._sgr(attr)
+                    out.append(sequences[attr])
+                    current = attr
+                text = "".join(row[x:run])
+                if attr & curses.A_ALTCHARSET:
+                    text = text.translate(_ACS_GLYPHS)
+                out.append(text)
+                x = run
+            # writing to the last column leaves the cursor in a state
+            # which differs between terminals
+            cursor = (y, end) if end < self.cols else (-1, -1)
+        if out:
+            self.write("".join(out))
+
+    def _sgr(self, attr: int) -> str:
+        """The escape sequence which resets the attributes and selects
+        a curses attribute"""
+        seq = self.cm.sgr(attr & ~curses.A_ALTCHARSET)
+        return "\x1b[0;" + seq[2:] if seq else "\x1b[0m"
+
+    def write(self, text: str):
+        data = text.encode("utf-8", "replace")
+        while data:
+            n = os.write(self.fd_out, data)
+            data = data[n:]
+
+    def getch(self, blocking: bool) -> int:
+        """The next key pressed, waiting for one if blocking"""
+        while not self.keys:
+            ready, _, _ = select.select([self.fd_in], [], [], 0.1 if blocking else 0)
+            if ready:
+                self.keys.extend(parse_keys(os.read(self.fd_in, 1024)))
+            elif not blocking:
+                return -1
+        return self.keys.popleft()
+
+    def fit(self):
+        cols, rows = os.get_terminal_size(self.fd_out)
+        self._resize(rows, cols)
+
+
+def parse_keys(data: bytes) -> list[int]:
+    """The curses key codes of the keys in input read from a terminal"""
+    text = data.decode("utf-8", "replace")
+    keys: list[int] = []
+    i = 0
+    while i < len(text):
+        if text[i] == "\x1b" and i + 1 < len(text):
+            for seq, key in _KEYS.items():
+                if text.startswith(seq, i):
+                    keys.append(key)
+                    i += len(seq)
+                    break
+            else:
+                if text[i + 1] == "[":
+                    # skip any other control sequence up to its final byte
+                    j = i + 2
+                    while j < len(text) and not "@" <= text[j] <= "~":
+                        j += 1
+                    i = j + 1
+                else:
+                    keys.append(27)
+                    i += 1
+            continue
+        keys.append(ord(text[i]))
+        i += 1
+    return keys
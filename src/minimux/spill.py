@@ -0,0 +1,220 @@
+import bisect
+import mmap
+import os
+import re
+from array import array
+from typing import BinaryIO, Generator
+
+# the number of lines between each entry of a segment's sparse index
+INDEX_STRIDE = 1024
+
+# the size at which the segment being written is closed and a new one
+# started
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+SEGMENT_PATTERN = re.compile(r"\d{8}\.log")
+
+
+class _Segment:
+    """One file of the log, holding consecutive lines separated by
+    newlines. The offset of every INDEX_STRIDE-th line is kept in memory
+    so any line can be found by scanning a few from the nearest one"""
+
+    __slots__ = ("path", "first", "count", "size", "offsets", "ascii")
+
+    def __init__(self, path: str, first: int):
+        self.path = path
+        self.first = first
+        self.count = 0
+        self.size = 0
+        self.offsets = array("q")
+        # whether every line is ascii, so can be searched undecoded
+        self.ascii = True
+
+
+class SpillLog:
+    """An append-only log of lines stored on disk in segment files, so
+    that output can be kept for far longer than fits in memory. Lines
+    are numbered from 0 in the order they were appended, and the
+    segments are read back with mmap when older lines are needed"""
+
+    def __init__(self, directory: str, segment_size: int = SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segments: list[_Segment] = []
+        self.firsts: list[int] = []
+        self.file: BinaryIO | None = None
+        self.closed = False
+        self.length = 0
+        # only the most recently read segment is kept mapped
+        self.mapped: tuple[_Segment, mmap.mmap] | None = None
+
+        # segments left by a previous run would be overwritten anyway
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if SEGMENT_PATTERN.fullmatch(name):
+                os.remove(os.path.join(directory, name))
+
+    def append(self, line: str):
+        if self.closed:
+            # lines still arriving as minimux exits are not logged
+            return
+        data = line.encode("utf-8", "surrogatepass") + b"\n"
+        if self.file is None or self.segments[-1].size >= self.segment_size:
+            self._rotate()
+        assert self.file is not None
+        segment = self.segments[-1]
+        if segment.count % INDEX_STRIDE == 0:
+            segment.offsets.append(segment.size)
+        self.file.write(data)
+        if segment.ascii and not data.isascii():
+            segment.ascii = False
+        segment.size += len(data)
+        segment.count += 1
+        self.length += 1
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.directory, f"{len(self.segments):08d}.log")
+        self.segments.append(_Segment(path, self.length))
+        self.firsts.append(self.length)
+        self.file = open(path, "wb")
+
+    def _map(self, segment: _Segment) -> mmap.mmap:
+        """Map a segment into memory, remapping the segment being
+        written if it has grown since it was last mapped"""
+        if self.mapped is not None:
+            mapped, mm = self.mapped
+            if mapped is segment and len(mm) == segment.size:
+                return mm
+            mm.close()
+            self.mapped = None
+        if segment is self.segments[-1]:
+            assert self.file is not None
+            self.file.flush()
+        with open(segment.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), segment.size, access=mmap.ACCESS_READ)
+        self.mapped = (segment, mm)
+        return mm
+
+    def _segment(self, seq: int) -> _Segment:
+        if not 0 <= seq < self.length:
+            raise IndexError("log index out of range")
+        return self.segments[bisect.bisect_right(self.firsts, seq) - 1]
+
+    def lines(self, seq: int) -> Generator[str, None, None]:
+        """The lines from seq onwards"""
+        while seq < self.length:
+            segment = self._segment(seq)
+            mm = self._map(segment)
+            i = seq - segment.first
+            pos = self._offset(segment, mm, i)
+            for _ in range(segment.count - i):
+                end = mm.find(b"\n", pos)
+                yield mm[pos:end].decode("utf-8", "surrogatepass")
+                pos = end + 1
+                seq += 1
+                # the segment may have been unmapped while suspended
+                if self.mapped is None or self.mapped[1] is not mm:
+                    break
+
+    def text(self, seq: int) -> str:
+        return next(self.lines(seq))
+
+    def find(self, needle: str, start: int, reverse: bool = False) -> int | None:
+        """Find the first line from start, or the last line up to and
+        including start if reverse is true, whose casefolded text
+        contains the casefolded needle, as for lines in memory. Segments
+        of ascii text are searched without decoding them"""
+        if not 0 <= start < self.length:
+            return None
+        folded = needle.casefold()
+        # ascii text only casefolds to ascii, the same way as ignoring
+        # the case of ascii letters does
+        pattern = None
+        if folded.isascii():
+            pattern = re.compile(re.escape(folded.encode()), re.IGNORECASE)
+        i = bisect.bisect_right(self.firsts, start) - 1
+        while 0 <= i < len(self.segments):
+            segment = self.segments[i]
+            # the lines of the segment to search
+            lo, hi = 0, segment.count
+            if reverse:
+                hi = min(hi, start + 1 - segment.first)
+            else:
+                lo = max(lo, start - segment.first)
+            seq = None
+            if not segment.ascii:
+                seq = self._find_decoded(segment, folded, lo, hi, reverse)
+            elif pattern is not None:
+                seq = self._find_ascii(segment, pattern, lo, hi, reverse)
+            if seq is not None:
+                return seq
+            i += -1 if reverse else 1
+        return None
+
+    def _find_ascii(
+        self,
+        segment: _Segment,
+        pattern: re.Pattern[bytes],
+        lo: int,
+        hi: int,
+        reverse: bool,
+    ) -> int | None:
+        """Search lines lo to hi of a segment of ascii text all at once"""
+        mm = self._map(segment)
+        pos = self._offset(segment, mm, lo)
+        end = segment.size
+        if hi < segment.count:
+            end = self._offset(segment, mm, hi)
+        if not reverse:
+            m = pattern.search(mm, pos, end)
+            return self._seq(segment, mm, m.start()) if m else None
+        last = None
+        for last in pattern.finditer(mm, pos, end):
+            pass
+        return self._seq(segment, mm, last.start()) if last else None
+
+    def _find_decoded(
+        self, segment: _Segment, folded: str, lo: int, hi: int, reverse: bool
+    ) -> int | None:
+        """Search lines lo to hi of a segment by decoding and casefolding
+        each of them"""
+        mm = self._map(segment)
+        pos = self._offset(segment, mm, lo)
+        found = None
+        for k in range(lo, hi):
+            end = mm.find(b"\n", pos)
+            if folded in mm[pos:end].decode("utf-8", "surrogatepass").casefold():
+                found = segment.first + k
+                if not reverse:
+                    break
+            pos = end + 1
+        return found
+
+    def _offset(self, segment: _Segment, mm: mmap.mmap, i: int) -> int:
+        """The offset of the ith line of a segment"""
+        pos = segment.offsets[i // INDEX_STRIDE]
+        for _ in range(i % INDEX_STRIDE):
+            pos = mm.find(b"\n", pos) + 1
+        return pos
+
+    def _seq(self, segment: _Segment, mm: mmap.mmap, pos: int) -> int:
+        """The number of the line containing an offset in a segment"""
+        k = bisect.bisect_right(segment.offsets, pos) - 1
+        start = segment.offsets[k]
+        return segment.first + k * INDEX_STRIDE + mm[start:pos].count(b"\n")
+
+    def close(self):
+        """Close the segments, after which nothing more is logged"""
+        self.closed = True
+        if self.mapped is not None:
+            self.mapped[1].close()
+            self.mapped = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self) -> int:
+        return self.length
@@ -0,0 +1,104 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Generator
+
+# the number of seconds between each sample of the counters
+SAMPLE_INTERVAL = 1.0
+
+
+class Stats:
+    """Counters of the work done by some part of minimux. The totals
+    only ever increase, and the rate at which each one is increasing is
+    recomputed each time the counters are sampled"""
+
+    def __init__(self, *names: str):
+        self.totals: dict[str, float] = {name: 0 for name in names}
+        self.rates: dict[str, float] = {name: 0.0 for name in names}
+        self.last: tuple[float, dict[str, float]] | None = None
+
+    def add(self, name: str, value: float = 1):
+        self.totals[name] += value
+
+    @contextlib.contextmanager
+    def timed(self, name: str) -> Generator[None, None, None]:
+        """Add the time spent in the block to a counter"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def locked(
+        self, lock: threading.RLock, name: str = "lock_wait"
+    ) -> Generator[None, None, None]:
+        """Hold a lock for the block, adding the time spent waiting for
+        it to a counter"""
+        start = time.perf_counter()
+        with lock:
+            self.totals[name] += time.perf_counter() - start
+            yield
+
+    def sample(self, now: float):
+        """Update the rates from the change in the totals since the last
+        sample"""
+        totals = dict(self.totals)
+        if self.last is not None and now > self.last[0]:
+            elapsed = now - self.last[0]
+            prev = self.last[1]
+            self.rates = {k: (v - prev[k]) / elapsed for k, v in totals.items()}
+        self.last = (now, totals)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"totals": dict(self.totals), "rates": dict(self.rates)}
+
+
+def runner_stats() -> Stats:
+    """The counters kept for each runner"""
+    return Stats("lines", "bytes", "rule_time", "flushes", "flush_time")
+
+
+def describe(name: str, stats: Stats) -> str:
+    """A one line summary of the rates of a runner's counters"""
+    rates = stats.rates
+    flushes = stats.totals["flushes"]
+    avg_flush = stats.totals["flush_time"] / flushes if flushes else 0.0
+    return (
+        f"{name}: {_si(rates['lines'])} lines/s {_si(rates['bytes'])}B/s"
+        f"  rules {rates['rule_time'] * 1000:.1f}ms/s"
+        f"  flush {rates['flushes']:.0f}/s {avg_flush * 1000:.2f}ms"
+    )
+
+
+def _si(value: float) -> str:
+    if value < 1000:
+        return f"{value:.0f}"
+    for unit in ("k", "M"):
+        value /= 1000
+        if value < 1000:
+            return f"{value:.1f}{unit}"
+    return f"{value / 1000:.1f}G"
+
+
+class StatsFile:
+    """A file which is replaced with a JSON snapshot of the counters
+    each time they are sampled, so that it can be read at any time
+    without seeing a partial write"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.time()
+
+    def write(self, stats: dict[str, Any]):
+        snapshot = {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            **stats,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(tmp, self.path)
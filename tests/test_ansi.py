@@ -0,0 +1,90 @@
+import curses
+
+from minimux.ansi import SgrParser
+from minimux.buffer import Buffer, Runs
+from minimux.colour import AnsiColourManager
+from minimux.config import Attr
+from minimux.rules import LiteralRule
+
+
+def test_plain():
+    parser = SgrParser(AnsiColourManager())
+    lines = ["hello", "world"]
+    assert parser.parse_lines(lines) == (lines, None)
+
+
+def test_runs():
+    cm = AnsiColourManager()
+    parser = SgrParser(cm)
+    text, attrs = parser.parse_lines(["a \x1b[1;31mred\x1b[0m b", "c"])
+    assert text == ["a red b", "c"]
+    assert attrs is not None
+    assert isinstance(attrs[0], Runs)
+    bold_red = cm.make_pair(1, None) | curses.A_BOLD
+    assert list(attrs[0].runs(7)) == [(0, 2, 0), (2, 5, bold_red), (5, 7, 0)]
+    assert attrs[1] == 0
+
+
+def test_carry_over():
+    cm = AnsiColourManager()
+    parser = SgrParser(cm)
+    text, attrs = parser.parse_lines(["\x1b[4mon", "still"])
+    assert text == ["on", "still"]
+    assert attrs == [curses.A_UNDERLINE, curses.A_UNDERLINE]
+    # a batch without escapes keeps the attributes selected before it
+    assert parser.parse_lines(["more"]) == (["more"], [curses.A_UNDERLINE])
+    text, attrs = parser.parse_lines(["\x1b[24moff"])
+    assert attrs == [0]
+    assert parser.parse_lines(["plain"]) == (["plain"], None)
+
+
+def test_extended_colours():
+    cm = AnsiColourManager()
+    parser = SgrParser(cm)
+    _, attrs = parser.parse_lines(["\x1b[38;5;208;48;2;0;128;255mx"])
+    assert attrs == [cm.make_pair(208, cm.make_colour(0, 128, 255))]
+    _, attrs = parser.parse_lines(["\x1b[0;94mx"])
+    assert attrs == [cm.make_pair(12, None)]
+    assert cm.sgr(attrs[0]) == "\x1b[38;5;12m"
+
+
+def test_other_escapes():
+    parser = SgrParser(AnsiColourManager())
+    text, attrs = parser.parse_lines(
+        ["\x1b[2K\x1b[1Gprogress\x1b]0;title\x07 done\x1b(B", "\x1b[?25l"]
+    )
+    assert text == ["progress done", ""]
+    assert attrs == [0, 0]
+
+
+def test_rules_over_escapes():
+    cm = AnsiColourManager()
+    parser = SgrParser(cm)
+    bold = Attr(bold=True)(cm)
+    line_rule = LiteralRule("error", False, False)
+    span_rule = LiteralRule("x", False, True)
+    buf = Buffer(80, 10, {line_rule: bold, span_rule: curses.A_DIM})
+    text, escapes = parser.parse_lines(["\x1b[31merror", "\x1b[32mok x"])
+    attrs = buf.highlight_lines(text, escapes)
+    assert attrs[0] == bold
+    green = cm.make_pair(2, None)
+    assert isinstance(attrs[1], Runs)
+    assert list(attrs[1].runs(4)) == [(0, 3, green), (3, 4, curses.A_DIM)]
+
+
+def test_many_colours():
+    cm = AnsiColourManager()
+    parser = SgrParser(cm)
+    lines = [f"\x1b[38;2;{i};0;0mx\x1b[0m" for i in range(256)]
+    lines += [f"\x1b[38;2;0;{i};{i}mx\x1b[0m" for i in range(256)]
+    lines += ["\x1b[38;2;200;0;1mx", "\x1b[0;48;5;1mx"]
+    text, attrs = parser.parse_lines(lines)
+    assert attrs is not None
+    # pairs never overflow into the other attributes
+    assert all(attr & ~curses.A_COLOR == 0 for attr in attrs)
+    assert len(cm.colour_pairs) == 255
+    assert all("\x1b[7m" not in cm.sgr(attr) for attr in attrs)
+    # once there is no room, the nearest pair is used, or the default
+    # pair if no pair uses the default colours in the same places
+    assert cm.sgr(attrs[-2]) == "\x1b[38;2;200;0;0m"
+    assert attrs[-1] == 0
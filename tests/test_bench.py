@@ -0,0 +1,54 @@
+import json
+
+from click.testing import CliRunner
+
+from minimux.bench import FakeWindow, compare, corpus, main, run_benchmarks
+
+
+def test_corpus():
+    assert corpus(100) == corpus(100)
+    assert corpus(100, seed=1) != corpus(100)
+    assert len(corpus(100)) == 100
+
+
+def test_fake_window():
+    win = FakeWindow(10, 20).subwin(5, 8, 0, 0)
+    assert win.getmaxyx() == (5, 8)
+    win.addstr("hello", 0)
+    win.insstr(4, 7, "!", 0)
+    assert win.written == 6
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(["literal_rule_match", "end_to_end_render"], repeat=1)
+    assert results["literal_rule_match"]["items"] == 50000
+    # only the lines which were rendered are counted
+    assert 100000 < results["end_to_end_render"]["items"] <= 150000
+    assert results["end_to_end_render"]["per_second"] > 0
+
+
+def test_compare():
+    baseline = {"a": {"per_second": 100.0}, "b": {"per_second": 100.0}}
+    results = {
+        "a": {"per_second": 85.0},
+        "b": {"per_second": 75.0},
+        "c": {"per_second": 1.0},
+    }
+    assert compare(results, baseline, 0.2) == ["b"]
+
+
+def test_main(tmp_path):
+    output = tmp_path / "bench.json"
+    args = ["-k", "^literal_rule_match$", "--repeat", "1", "-o", str(output)]
+    result = CliRunner().invoke(main, args)
+    assert result.exit_code == 0
+    report = json.loads(output.read_text())
+    assert list(report["results"]) == ["literal_rule_match"]
+
+    # an impossibly fast baseline is a regression
+    report["results"]["literal_rule_match"]["per_second"] = 1e15
+    output.write_text(json.dumps(report))
+    result = CliRunner().invoke(
+        main, ["-k", "^literal_rule_match$", "--compare", str(output)]
+    )
+    assert result.exit_code != 0
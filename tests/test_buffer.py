@@ -1,4 +1,4 @@
-from minimux.buffer import Buffer
+from minimux.buffer import Buffer, Runs
 from minimux.rules import LiteralRule, RegexRule, Rule
 
 
@@ -12,20 +12,247 @@ def test_buffer():
     buf.push("line 1")
     buf.push("this line is longer than the twenty character limit")
 
-    assert len(buf.buf) == 4
-    assert buf.buf[0] == ("line 1", 0)
-    assert buf.buf[1] == ("this line is longer ", 0)
-    assert buf.buf[2] == ("than the twenty char", 0)
-    assert buf.buf[3] == ("acter limit", 0)
+    rows = buf.rows()
+    assert len(rows) == 4
+    assert rows[0] == ("line 1", 0)
+    assert rows[1] == ("this line is longer ", 0)
+    assert rows[2] == ("than the twenty char", 0)
+    assert rows[3] == ("acter limit", 0)
 
     buf.push("this matches the literal rule xyz")
-    assert len(buf.buf) == 5
-    assert buf.buf[0] == ("this line is longer ", 0)
-    assert buf.buf[1] == ("than the twenty char", 0)
-    assert buf.buf[2] == ("acter limit", 0)
-    assert buf.buf[3] == ("this matches the lit", 1)
-    assert buf.buf[4] == ("eral rule xyz", 1)
+    rows = buf.rows()
+    assert len(rows) == 5
+    assert rows[0] == ("this line is longer ", 0)
+    assert rows[1] == ("than the twenty char", 0)
+    assert rows[2] == ("acter limit", 0)
+    assert rows[3] == ("this matches the lit", 1)
+    assert rows[4] == ("eral rule xyz", 1)
 
     buf.push("regex rule hello")
-    assert len(buf.buf) == 5
-    assert buf.buf[-1] == ("regex rule hello", 2)
+    rows = buf.rows()
+    assert len(rows) == 5
+    assert rows[-1] == ("regex rule hello", 2)
+    assert len(buf) == 4
+
+
+def test_buffer_resize():
+    buf = Buffer(10, 2, scrollback=3)
+    buf.push("a line which wraps")
+    buf.push("short")
+
+    buf.resize(maxcols=5)
+    assert buf.rows() == [("aps", 0), ("short", 0)]
+
+    # widening the pane again restores the full line
+    buf.resize(maxcols=20, maxrows=3)
+    assert buf.rows() == [("a line which wraps", 0), ("short", 0)]
+
+    buf.extend(["one", "two"])
+    assert len(buf) == 3
+    assert buf.rows() == [("short", 0), ("one", 0), ("two", 0)]
+
+
+def test_buffer_appended():
+    buf = Buffer(10, 3)
+    assert buf.take_frame() == ([], 0)
+
+    buf.push("short")
+    buf.push("this wraps onto two rows")
+    rows, appended = buf.take_frame()
+    assert appended == 4
+    assert rows == [("this wraps", 0), (" onto two ", 0), ("rows", 0)]
+    assert buf.take_frame()[1] == 0
+
+    buf.push("again")
+    assert buf.take_frame()[1] == 1
+
+
+def test_buffer_extend():
+    rules: dict[Rule, int] = {LiteralRule("error", False): 1}
+    buf = Buffer(20, 5, rules)
+
+    buf.extend(["ok", "an error", "fine"])
+    assert list(buf) == [("ok", 0), ("an error", 1), ("fine", 0)]
+
+
+def test_buffer_spans():
+    rules: dict[Rule, int] = {
+        LiteralRule("error", True, span=True): 1,
+        RegexRule(r"\d{3}", 0, span=True): 2,
+        LiteralRule("warn", False): 3,
+    }
+    buf = Buffer(10, 5, rules)
+
+    buf.push("plain")
+    buf.push("ERROR 404 oops")
+    buf.push("warn 200")
+
+    rows = list(buf)
+    assert rows[0] == ("plain", 0)
+    assert rows[1] == ("ERROR 404 ", Runs([0, 5, 6, 9], [1, 0, 2, 0]))
+    assert rows[2] == ("oops", 0)
+    assert rows[3] == ("warn 200", Runs([0, 5], [3, 2]))
+
+    buf.resize(maxcols=3, maxrows=10)
+    assert buf.rows()[2:6] == [
+        ("ERR", 1),
+        ("OR ", Runs([0, 2], [1, 0])),
+        ("404", 2),
+        (" oo", 0),
+    ]
+
+
+def test_runs():
+    runs = Runs.from_attrs([1, 1, 2, 2, 2, 1])
+    assert runs == Runs([0, 2, 5], [1, 2, 1])
+    assert list(runs.runs(6)) == [(0, 2, 1), (2, 5, 2), (5, 6, 1)]
+    assert runs.slice(3, 6) == Runs([0, 2], [2, 1])
+    assert runs.slice(2, 4) == 2
+    assert Runs.from_attrs([3, 3]) == 3
+
+
+def test_buffer_scroll():
+    buf = Buffer(4, 3, scrollback=6)
+    buf.extend(["0", "1111", "2222222", "3", "4", "5"])
+    assert buf.rows() == [("3", 0), ("4", 0), ("5", 0)]
+    assert buf.following
+
+    buf.scroll(-1)
+    assert buf.rows() == [("222", 0), ("3", 0), ("4", 0)]
+    assert buf.rows_below() == 1
+
+    buf.scroll(-1)
+    assert buf.rows() == [("2222", 0), ("222", 0), ("3", 0)]
+
+    # new output does not move the view when scrolled back
+    buf.extend(["6"])
+    assert buf.rows() == [("2222", 0), ("222", 0), ("3", 0)]
+    assert buf.rows_below() == 3
+
+    buf.seek(0)
+    assert buf.rows() == [("1111", 0), ("2222", 0), ("222", 0)]
+
+    # the top line is evicted, so the view moves to the oldest line
+    buf.extend(["7"])
+    assert buf.rows() == [("2222", 0), ("222", 0), ("3", 0)]
+
+    buf.scroll(100)
+    assert buf.following
+    assert buf.rows() == [("5", 0), ("6", 0), ("7", 0)]
+
+    buf.scroll(-2)
+    buf.follow()
+    assert buf.following
+
+
+def test_buffer_seek_wrapped_ring():
+    buf = Buffer(10, 2, scrollback=5)
+    buf.extend([f"line {i}" for i in range(12)])
+    buf.seek(0)
+    assert buf.rows() == [("line 7", 0), ("line 8", 0)]
+    buf.scroll(2)
+    assert buf.rows() == [("line 9", 0), ("line 10", 0)]
+    assert buf.rows_below() == 1
+
+
+def test_buffer_search():
+    buf = Buffer(20, 2)
+    buf.extend(["ok", "Traceback 1", "ok", "ok", "traceback 2", "ok", "ok"])
+
+    assert buf.search("TRACEBACK")
+    assert buf.rows() == [("traceback 2", 0), ("ok", 0)]
+    assert buf.search("traceback")
+    assert buf.rows() == [("Traceback 1", 0), ("ok", 0)]
+    assert not buf.search("traceback")
+
+    assert buf.search("traceback", older=False)
+    assert buf.rows() == [("traceback 2", 0), ("ok", 0)]
+    assert not buf.search("missing")
+
+
+def test_buffer_spill(tmp_path):
+    rules: dict[Rule, int] = {LiteralRule("error", False): 1}
+    buf = Buffer(4, 2, rules, scrollback=3, spill=str(tmp_path))
+    buf.extend(["0", "error", "2", "333333", "4", "5"])
+    assert buf.rows() == [("4", 0), ("5", 0)]
+
+    # scroll back past the lines in memory into those on disk, which
+    # have their rules applied again
+    buf.scroll(-2)
+    assert buf.rows() == [("3333", 0), ("33", 0)]
+    buf.scroll(-1)
+    assert buf.rows() == [("2", 0), ("3333", 0)]
+    assert buf.rows_below() == 3
+    buf.scroll(-2)
+    assert buf.rows() == [("erro", 1), ("r", 1)]
+
+    buf.home()
+    assert buf.rows() == [("0", 0), ("erro", 1)]
+    buf.scroll(3)
+    assert buf.rows() == [("2", 0), ("3333", 0)]
+    buf.scroll(100)
+    assert buf.following
+
+    assert buf.search("ERROR")
+    assert buf.rows() == [("erro", 1), ("r", 1)]
+    assert not buf.search("error")
+    assert buf.search("5", older=False)
+    assert buf.rows() == [("4", 0), ("5", 0)]
+
+    assert buf.log is not None
+    buf.close()
+    assert buf.log.file is None and buf.log.mapped is None
+
+
+def test_runs_from_spans():
+    assert Runs.from_spans(6, 0, []) == 0
+    assert Runs.from_spans(6, 0, [(1, 3, 1)]) == Runs([0, 1, 3], [0, 1, 0])
+    assert Runs.from_spans(6, 0, [(0, 6, 1)]) == 1
+    assert Runs.from_spans(6, 0, [(0, 4, 1), (2, 6, 2)]) == Runs([0, 2], [1, 2])
+    assert Runs.from_spans(6, 0, [(0, 4, 1), (1, 2, 0)]) == Runs(
+        [0, 1, 2, 4], [1, 0, 1, 0]
+    )
+
+
+def test_buffer_highlight_lines():
+    rules: dict[Rule, int] = {
+        LiteralRule("error", True): 1,
+        RegexRule(r"\d+", 0, span=True): 2,
+        LiteralRule("!", False, span=True): 3,
+    }
+    buf = Buffer(20, 5, rules)
+    lines = ["ok", "ERROR 1", "2 and 34!", "none"]
+    assert buf.highlight_lines(lines) == [buf.highlight(line) for line in lines]
+    assert buf.highlight_lines(["ok", "none"]) == [0, 0]
+
+
+def test_buffer_wide():
+    buf = Buffer(4, 3)
+    buf.extend(["ab中文", "x", "字\u0301字字"])
+    buf.extend(["中文字"], [Runs([0, 2], [1, 2])])
+    assert buf.rows() == [("字", 0), ("中文", 1), ("字", 2)]
+
+    buf.seek(0)
+    assert buf.rows() == [("ab中", 0), ("文", 0), ("x", 0)]
+    buf.scroll(3)
+    assert buf.rows() == [("字\u0301字", 0), ("字", 0), ("中文", 1)]
+    assert buf.rows_below() == 1
+
+
+def test_buffer_extend_cached():
+    rules: dict[Rule, int] = {
+        LiteralRule("cached failure", True): 1,
+        RegexRule(r"cached \d+", 0): 2,
+    }
+    buf = Buffer(20, 5, rules, match_cache=16)
+    match = buf.ruleset.match
+    assert hasattr(match, "cache_info")
+    before = match.cache_info()
+
+    lines = ["CACHED FAILURE", "cached 12", "other"] * 10
+    buf.extend(lines)
+    # lines seen before are looked up rather than matched again
+    info = match.cache_info()
+    assert info.misses - before.misses == 2
+    assert info.hits - before.hits == 18
+    assert buf.highlight_lines(lines) == [buf.highlight(line) for line in lines]
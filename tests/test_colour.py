@@ -1,6 +1,10 @@
-from minimux.colour import ColourManager
+from minimux.colour import AnsiColourManager, ColourManager
+import curses
+import threading
 import unittest.mock
 
+from minimux.config import Attr
+
 
 @unittest.mock.patch("curses.init_color", lambda *args, **kwargs: 0)
 @unittest.mock.patch("curses.init_pair", lambda *args, **kwargs: 0)
@@ -11,3 +15,95 @@ def test_colour():
     cm.make_pair("rgb(100, 20, 12)", "#aadb2d")
     cm.parse_hex("#ffffff")
     cm.parse_rgb("rgb(100, 240, 128)")
+
+
+def test_ansi_colour():
+    cm = AnsiColourManager()
+    assert cm.make_pair(None, None) == 0
+    assert cm.sgr(0) == ""
+
+    red = cm.make_pair("red", None)
+    assert cm.make_pair("red", None) == red
+    assert cm.sgr(red) == "\x1b[31m"
+    assert cm.sgr(red | curses.A_BOLD) == "\x1b[1;31m"
+    assert cm.sgr(cm.make_pair("#ff8000", "blue")) == "\x1b[38;2;255;128;0;44m"
+    assert cm.sgr(cm.make_pair(None, 100)) == "\x1b[48;5;100m"
+    assert cm.sgr(curses.A_REVERSE | curses.A_STANDOUT) == "\x1b[7m"
+
+
+def test_colour_cache():
+    init_color = unittest.mock.Mock()
+    with (
+        unittest.mock.patch("curses.init_color", init_color),
+        unittest.mock.patch("curses.init_pair") as init_pair,
+        unittest.mock.patch("curses.color_pair", lambda n: n << 8),
+    ):
+        cm = ColourManager()
+        a = cm.make_pair("#102030", "black")
+        assert cm.make_pair("rgb(16, 32, 48)", "black") == a
+        assert cm.make_pair("#102030", None) != a
+        assert init_color.call_count == 1
+        assert init_pair.call_count == 2
+
+        # once there is no room, the nearest colour is used
+        cm.next_colour = 256
+        assert cm.make_colour(250, 0, 0) == 196
+        assert cm.make_colour(16, 32, 50) == cm.make_colour(16, 32, 48)
+
+        # terminals which cannot change colours use the default palette
+        cm = ColourManager()
+        init_color.side_effect = curses.error
+        assert cm.make_colour(0, 0, 250) == 21
+        assert cm.make_colour(100, 100, 100) == 241
+        assert cm.next_colour == 256
+
+
+def test_attr_cache():
+    cm = AnsiColourManager()
+    attr = Attr(fg="red", bold=True)
+    assert attr(cm) == cm.make_pair("red", None) | curses.A_BOLD
+    with unittest.mock.patch.object(cm, "make_pair") as make_pair:
+        attr(cm)
+        assert make_pair.call_count == 0
+    assert attr(AnsiColourManager()) == attr(cm)
+
+
+def test_pair_limit():
+    with (
+        unittest.mock.patch("curses.init_color"),
+        unittest.mock.patch("curses.init_pair") as init_pair,
+        unittest.mock.patch("curses.color_pair", lambda n: n << 8),
+        unittest.mock.patch("curses.COLOR_PAIRS", 3, create=True),
+    ):
+        cm = ColourManager()
+        red = cm.make_pair("red", None)
+        blue = cm.make_pair("blue", "black")
+        # there is no room left, so the nearest pair is used instead
+        assert cm.make_pair("#f00000", None) == red
+        assert cm.make_pair("cyan", "black") == blue
+        assert cm.make_pair(None, "red") == 0
+        assert init_pair.call_count == 2
+
+
+def test_colour_lock():
+    cm = AnsiColourManager()
+    made: list[int] = []
+    with cm.lock:
+        t = threading.Thread(target=lambda: made.append(cm.make_pair("#123456", 1)))
+        t.start()
+        t.join(0.1)
+        # nothing is defined while the lock is held to draw the screen
+        assert made == []
+    t.join()
+    assert made == [cm.make_pair("#123456", 1)]
+
+    # pairs made at the same time on different threads are all distinct
+    def make(i: int):
+        made.extend(cm.make_pair(f"#{i:02x}{j:02x}00", None) for j in range(50))
+
+    threads = [threading.Thread(target=make, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(made)) == len(made) == 201
@@ -2,6 +2,8 @@ from io import StringIO
 import curses
 import re
 
+import pytest
+
 from minimux.config import Attr, Config, Panel, Command
 from minimux.rules import LiteralRule, RegexRule
 
@@ -91,3 +93,87 @@ def test_config():
     assert len(api.rules) == 2
     assert api.rules[error_rule] == error_attr
     assert api.rules[warn_rule] == warn_attr
+
+
+def test_config_fps():
+    ini = """
+        [main]
+        fps = 60
+        command = echo hello
+    """
+    config = Config.from_file(StringIO(ini))
+    assert config.fps == 60
+    assert config.engine == "threads"
+
+    config = Config.from_file(StringIO("[main]\ncommand = echo hello\n"))
+    assert config.fps == 30
+
+
+def test_config_engine():
+    ini = """
+        [main]
+        engine = selectors
+        command = echo hello
+    """
+    config = Config.from_file(StringIO(ini))
+    assert config.engine == "selectors"
+
+    with pytest.raises(ValueError):
+        Config.from_file(StringIO("[main]\nengine = fibers\ncommand = echo\n"))
+
+
+def test_config_overflow():
+    ini = """
+        [main]
+        command = echo hello
+        overflow = sample
+        queue_size = 100
+    """
+    config = Config.from_file(StringIO(ini))
+    assert isinstance(config.content, Command)
+    assert config.content.overflow == "sample"
+    assert config.content.queue_size == 100
+
+    with pytest.raises(ValueError):
+        Config.from_file(StringIO("[main]\noverflow = lose\ncommand = echo\n"))
+
+
+def test_config_stop_timeout():
+    config = Config.from_file(StringIO("[main]\nstop_timeout = 0.5\ncommand = echo\n"))
+    assert config.stop_timeout == 0.5
+
+    config = Config.from_file(StringIO("[main]\ncommand = echo hello\n"))
+    assert config.stop_timeout == 5
+
+    with pytest.raises(ValueError):
+        Config.from_file(StringIO("[main]\nstop_timeout = -1\ncommand = echo\n"))
+
+
+def test_config_depends_on():
+    ini = """
+        [main]
+        panels = db, api, web
+
+        [db]
+        command = echo db
+        ready = listening on \\d+
+
+        [api]
+        command = echo api
+        depends_on = db
+
+        [web]
+        command = echo web
+        depends_on = api, db
+    """
+    config = Config.from_file(StringIO(ini))
+    db, api, web = config.commands()
+    assert db.ready is not None and db.ready.search("listening on 5432")
+    assert db.depends_on == []
+    assert api.depends_on == [db.name]
+    assert web.depends_on == [api.name, db.name]
+
+    with pytest.raises(ValueError):
+        Config.from_file(StringIO(ini.replace("= api, db", "= cache")))
+    with pytest.raises(ValueError):
+        Config.from_file(StringIO(ini + "        depends_on = web\n"))
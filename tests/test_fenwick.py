@@ -0,0 +1,31 @@
+import random
+from array import array
+
+from minimux.fenwick import Fenwick
+
+
+def test_fenwick():
+    counts = [random.randint(0, 4) for _ in range(100)]
+    fenwick = Fenwick(array("q", counts))
+    assert fenwick.total == sum(counts)
+    for i in range(len(counts) + 1):
+        assert fenwick.prefix(i) == sum(counts[:i])
+
+    fenwick.set(10, 7)
+    counts[10] = 7
+    fenwick.set(99, 0)
+    counts[99] = 0
+    assert fenwick.total == sum(counts)
+
+    for k in range(sum(counts)):
+        i = fenwick.find(k)
+        assert sum(counts[:i]) <= k < sum(counts[: i + 1])
+
+
+def test_fenwick_zeros():
+    fenwick = Fenwick.zeros(8)
+    assert fenwick.total == 0
+    fenwick.set(3, 2)
+    assert fenwick.find(0) == 3
+    assert fenwick.find(1) == 3
+    assert fenwick.prefix(4) == 2
@@ -0,0 +1,192 @@
+import io
+import os
+import signal
+import threading
+import time
+from io import StringIO
+
+from minimux.colour import AnsiColourManager
+from minimux.config import Config
+from minimux.headless import Headless, HeadlessRunner, Writer
+
+
+def make_config(ini: str) -> Config:
+    return Config.from_file(StringIO(ini))
+
+
+CONFIG = """
+    [main]
+    panels = one, two
+
+    [one]
+    title = One
+    command = printf 'a\\nerror b\\n'
+    rules = error
+
+    [two]
+    command = sh -c "echo c; exit 2"
+
+    [error]
+    literal = error
+    fg = red
+"""
+
+
+def test_writer():
+    stream = io.BytesIO()
+    writer = Writer(stream, limit=8)  # type: ignore[arg-type]
+    writer.write("abc")
+    assert stream.getvalue() == b""
+    writer.write("défghi")
+    assert stream.getvalue() == "abcdéfghi".encode()
+    writer.write("j")
+    writer.flush()
+    assert stream.getvalue() == "abcdéfghij".encode()
+
+
+def test_headless_runner():
+    config = make_config(CONFIG)
+    command = config.content.children[0]  # type: ignore[attr-defined]
+    stream = io.BytesIO()
+    writer = Writer(stream)  # type: ignore[arg-type]
+
+    runner = HeadlessRunner(command, AnsiColourManager(), writer, "One | ")
+    runner.emit(["a", "error b"])
+    runner = HeadlessRunner(command, AnsiColourManager(), writer, "x ", True)
+    runner.emit(["a", "error b"])
+    writer.flush()
+    assert stream.getvalue().decode().splitlines() == [
+        "One | a",
+        "One | error b",
+        "x a",
+        "x \x1b[31merror b\x1b[0m",
+    ]
+
+
+def test_headless_output(tmp_path):
+    headless = Headless(make_config(CONFIG), tmp_path)
+    assert headless.run() == 1
+    assert (tmp_path / "main-one.log").read_text().splitlines() == [
+        "a",
+        "error b",
+        "** Process exited with status code 0 **",
+    ]
+    assert (tmp_path / "main-two.log").read_text().splitlines() == [
+        "c",
+        "** Process exited with status code 2 **",
+    ]
+
+
+def test_headless_stdout(capfdbinary):
+    assert Headless(make_config(CONFIG.replace("exit 2", "exit 0"))).run() == 0
+    lines = capfdbinary.readouterr().out.decode().splitlines()
+    assert [line for line in lines if line.startswith("One ")] == [
+        "One | a",
+        "One | error b",
+        "One | ** Process exited with status code 0 **",
+    ]
+    assert "two | c" in lines
+
+
+def test_headless_overflow():
+    config = make_config(CONFIG.replace("rules = error", "overflow = drop-oldest"))
+    command = config.content.children[0]  # type: ignore[attr-defined]
+    stream = io.BytesIO()
+    writer = Writer(stream)  # type: ignore[arg-type]
+    runner = HeadlessRunner(command, AnsiColourManager(), writer)
+    assert runner.queue is not None
+
+    runner.queue.capacity = 2
+    runner.ingest(["a", "b", "c"])
+    assert stream.getvalue() == b""
+    runner.drain()
+    runner.drain()
+    writer.flush()
+    assert stream.getvalue().decode().splitlines() == [
+        "** 1 line dropped **",
+        "b",
+        "c",
+    ]
+
+
+def test_headless_depends_on(tmp_path):
+    flag = tmp_path / "flag"
+    script = tmp_path / "db.sh"
+    script.write_text(
+        "echo starting\n"
+        "echo ready\n"
+        "for i in $(seq 100); do\n"
+        f"  [ -e {flag} ] && echo api started && exit\n"
+        "  sleep 0.05\n"
+        "done\n"
+    )
+    ini = f"""
+        [main]
+        panels = db, api
+
+        [db]
+        command = sh {script}
+        ready = ^ready
+
+        [api]
+        command = touch {flag}
+        depends_on = db
+    """
+    assert Headless(make_config(ini), tmp_path).run() == 0
+    # the dependant started once the database was ready, while it ran
+    assert (tmp_path / "main-db.log").read_text().splitlines() == [
+        "starting",
+        "ready",
+        "api started",
+        "** Process exited with status code 0 **",
+    ]
+    assert (tmp_path / "main-api.log").read_text().splitlines() == [
+        "** Waiting for db **",
+        "** Process exited with status code 0 **",
+    ]
+
+
+def test_headless_sigterm(tmp_path):
+    ini = """
+        [main]
+        command = sleep 30
+    """
+    headless = Headless(make_config(ini), tmp_path)
+    threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM)).start()
+    start = time.monotonic()
+    # the signal stops the commands, rather than minimux alone
+    assert headless.run() == 1
+    assert time.monotonic() - start < 5
+    assert not headless.runners[0].group_alive()
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+
+
+def test_headless_background(tmp_path):
+    ini = """
+        [main]
+        command = 'sleep 30 > /dev/null 2>&1 & echo started'
+        shell = true
+    """
+    headless = Headless(make_config(ini), tmp_path)
+    assert headless.run() == 0
+    # the command exited, but what it left running is stopped as well
+    deadline = time.monotonic() + 5
+    while headless.runners[0].group_alive():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_headless_no_spill(tmp_path):
+    spill = tmp_path / "spill" / "main"
+    spill.mkdir(parents=True)
+    (spill / "00000000.log").write_text("from an interactive session\n")
+    ini = f"""
+        [main]
+        command = echo hello
+        spill = {tmp_path / "spill"}
+    """
+    headless = Headless(make_config(ini), tmp_path / "out")
+    assert headless.run() == 0
+    # the log of an interactive session running the same config is kept
+    assert headless.runners[0].buf.log is None
+    assert (spill / "00000000.log").read_text() == "from an interactive session\n"
@@ -0,0 +1,30 @@
+import pytest
+
+from minimux.ingest import LineQueue
+
+
+def test_line_queue_drop_oldest():
+    queue = LineQueue(4, "drop-oldest")
+    queue.put(["0", "1", "2"])
+    assert queue.describe() is None
+    queue.put(["3", "4", "5"])
+    assert len(queue) == 4
+    assert queue.dropped == 2
+    assert queue.describe() == "2 lines dropped"
+    assert queue.describe(1) == "1 line dropped"
+    assert queue.take() == ["2", "3", "4", "5"]
+    assert queue.take() == []
+
+
+def test_line_queue_sample():
+    queue = LineQueue(4, "sample")
+    queue.put([str(i) for i in range(10)])
+    assert queue.take() == ["0", "4", "8"]
+    assert queue.describe() == "7 lines skipped"
+    assert queue.describe(3) == "3 lines skipped"
+    assert queue.describe(1) == "1 line skipped"
+
+
+def test_line_queue_policy():
+    with pytest.raises(ValueError):
+        LineQueue(4, "block")
@@ -0,0 +1,82 @@
+from io import StringIO
+
+from minimux.config import Config
+from minimux.layout import Layout
+
+CONFIG = """
+    [main]
+    title = Demo
+    vertical = true
+    panels = top, bottom
+
+    [top]
+    panels = a, b
+
+    [bottom]
+    weight = 2
+    panels = c, d
+
+    [d]
+    vertical = true
+    panels = e, f
+
+    [a]
+    command = true
+
+    [b]
+    command = true
+
+    [c]
+    command = true
+
+    [e]
+    command = true
+
+    [f]
+    command = true
+"""
+
+
+def draw(layout: Layout) -> list[str]:
+    glyphs = {
+        "BSBS": "─",
+        "SBSB": "│",
+        "SSSS": "┼",
+        "SSSB": "├",
+        "SBSS": "┤",
+        "BSSS": "┬",
+        "SSBS": "┴",
+    }
+    rows = [[" "] * layout.cols for _ in range(layout.rows)]
+    for (y, x), name in layout.separators.items():
+        rows[y][x] = glyphs[name]
+    for command, (h, w, y, x) in layout.panes:
+        for i in range(h):
+            rows[y + i][x : x + w] = command.name[-1] * w
+    return ["".join(row) for row in rows]
+
+
+def test_layout():
+    config = Config.from_file(StringIO(CONFIG))
+    layout = Layout.solve(config, 12, 11)
+    assert [bounds for _, bounds in layout.panes] == [
+        (3, 5, 2, 0),
+        (3, 5, 2, 6),
+        (6, 5, 6, 0),
+        (3, 5, 6, 6),
+        (2, 5, 10, 6),
+    ]
+    assert draw(layout) == [
+        "           ",
+        "─────┬─────",
+        "aaaaa│bbbbb",
+        "aaaaa│bbbbb",
+        "aaaaa│bbbbb",
+        "─────┼─────",
+        "ccccc│eeeee",
+        "ccccc│eeeee",
+        "ccccc│eeeee",
+        "ccccc├─────",
+        "ccccc│fffff",
+        "ccccc│fffff",
+    ]
@@ -0,0 +1,25 @@
+from minimux.reader import LineReader
+
+
+def test_line_reader():
+    reader = LineReader("utf-8")
+    assert reader.feed(b"line 1\nline 2\npart") == ["line 1", "line 2"]
+    assert reader.feed(b"ial line  \n") == ["partial line"]
+    assert reader.feed(b"") == []
+    assert reader.feed(b"unterminated") == []
+    assert reader.close() == ["unterminated"]
+
+
+def test_line_reader_newlines():
+    reader = LineReader("utf-8")
+    assert reader.feed(b"a\r\nb\rc\r") == ["a", "b", "c"]
+    assert reader.feed(b"\nd\n") == ["d"]
+    assert reader.close() == []
+
+
+def test_line_reader_multibyte():
+    reader = LineReader("utf-8")
+    data = "héllo wörld\n".encode()
+    assert reader.feed(data[:2]) == []
+    assert reader.feed(data[2:]) == ["héllo wörld"]
+    assert reader.feed(b"\xff\n") == ["�"]
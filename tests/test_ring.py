@@ -0,0 +1,51 @@
+from minimux.ring import Ring
+
+
+def test_ring():
+    ring: Ring[object] = Ring(5, block_size=2)
+    for i in range(4):
+        ring.append(f"line {i}", i)
+
+    assert len(ring) == 4
+    assert ring[0] == ("line 0", 0)
+    assert ring[-1] == ("line 3", 3)
+
+    ring.append("line 4", 4)
+    ring.append("line 5", 5)
+    ring.append("line 6", 6)
+    assert len(ring) == 5
+    assert ring.first == 2
+    assert len(ring.blocks) == 3
+    assert list(ring) == [(f"line {i}", i) for i in range(2, 7)]
+
+
+def test_ring_extra_attrs():
+    marker = object()
+    ring: Ring[object] = Ring(3)
+    ring.append("plain", 1)
+    ring.append("ünïcode", marker)
+    assert ring[0] == ("plain", 1)
+    assert ring[1] == ("ünïcode", marker)
+    assert ring.text(1) == "ünïcode"
+    assert ring.attr(1) is marker
+
+
+def test_ring_find():
+    ring: Ring[object] = Ring(10, block_size=3)
+    for i in range(12):
+        ring.append("Traceback" if i in (4, 9) else f"line {i}", 0)
+
+    # entries 0 and 1 have been evicted
+    assert ring.find("traceback", 9, reverse=True) == 7
+    assert ring.find("TRACEBACK", 6, reverse=True) == 2
+    assert ring.find("traceback", 1, reverse=True) is None
+    assert ring.find("traceback", 0) == 2
+    assert ring.find("traceback", 3) == 7
+    assert ring.find("no", 0) is None
+    assert ring.find("11", 0) == 9
+
+    # blocks which cannot contain the needle have been skipped using
+    # their bloom filters
+    assert ring.blocks[2].bloom is not None
+    assert not ring.blocks[2].may_contain({tuple(b"tra")})
+    assert ring.blocks[1].may_contain({tuple(b"tra")})
@@ -1,5 +1,5 @@
 import re
-from minimux.rules import LiteralRule, RegexRule
+from minimux.rules import LiteralRule, MatchContext, RegexRule, RuleSet
 
 
 def test_regex_rule():
@@ -22,3 +22,109 @@ def test_literal_rule():
     assert r.matches("I hAvE sOmE iNfO fOr YoU")
     assert r.matches("INFO")
     assert not r.matches("iinnnnfooooo!!!")
+
+
+def test_rule_literals():
+    assert LiteralRule("Warn", True).literals() == (("warn",), True)
+    assert RegexRule("GET /\\S+ 5\\d\\d", 0).literals() == (("GET /",), False)
+    assert RegexRule("error|FATAL", re.IGNORECASE).literals() == (
+        ("error", "fatal"),
+        True,
+    )
+    assert RegexRule("(?i)timeout", 0).literals() == (("timeout",), True)
+    assert RegexRule("\\d+|error", 0).literals() is None
+
+
+def test_rule_set():
+    rules = RuleSet(
+        [
+            LiteralRule("fatal", True),
+            RegexRule("err(or)?", 0),
+            LiteralRule("warn", False),
+        ]
+    )
+    assert rules.match("nothing to see here") is None
+    assert rules.match("warn: an error") == 1
+    assert rules.match("error: FATAL") == 0
+    assert rules.match("warn") == 2
+    assert rules.match("warn: ERR") == 2
+
+
+def test_rule_set_unicode():
+    rules = RuleSet(
+        [
+            RegexRule("stra(ss|ß)e", re.IGNORECASE),
+            LiteralRule("ß", True),
+            RegexRule("[0-9]+", 0),
+        ]
+    )
+    assert rules.match("STRASSE") == 0
+    assert rules.match("straẞe") == 0
+    assert rules.match("größe") == 1
+    assert rules.match("GROSSE") == 1
+    assert rules.match("1234") == 2
+    assert rules.match("nothing") is None
+
+
+def test_rule_set_shared():
+    rules = [LiteralRule("warn", True), RegexRule("error", 0)]
+    shared = RuleSet.shared(rules, 16)
+    assert (
+        RuleSet.shared([LiteralRule("warn", True), RegexRule("error", 0)], 16) is shared
+    )
+    assert RuleSet.shared(rules[::-1], 16) is not shared
+
+    for _ in range(2):
+        assert shared.match("WARN: something") == 0
+        assert shared.match("error") == 1
+        assert shared.match("info") is None
+
+
+def test_match_context():
+    ctx = MatchContext("Hello World")
+    assert ctx.folded == "hello world"
+    assert ctx.ascii
+    assert LiteralRule("WORLD", True).matches_context(ctx)
+    assert not LiteralRule("WORLD", False).matches_context(ctx)
+    assert RegexRule("W.rld", 0).matches_context(ctx)
+
+
+def test_rule_spans():
+    assert LiteralRule("ab", False).spans("xabab ab") == [(1, 3), (3, 5), (6, 8)]
+    assert LiteralRule("AB", True).spans("xAbz") == [(1, 3)]
+    assert LiteralRule("ss", True).spans("ẞ SS") == [(2, 4)]
+    assert RegexRule(r"\d+", 0).spans("a 12 b 3") == [(2, 4), (7, 8)]
+
+
+def test_rule_set_match_lines():
+    rules = RuleSet(
+        [
+            LiteralRule("fatal", True),
+            RegexRule("err(or)?", 0),
+            RegexRule("^warn", 0),
+        ]
+    )
+    lines = ["nothing", "warn: an error", "error: FATAL", "warn", "a warning", ""]
+    assert rules.match_lines(lines) == [rules.match(line) for line in lines]
+    assert rules.match_lines(lines) == [None, 1, 0, 2, None, None]
+    assert rules.match_lines(["größe", "FATAL ẞ"]) == [None, 0]
+
+
+def test_rule_spans_lines():
+    lines = ["a 12", "3 b", "", "45"]
+    for rule in [
+        RegexRule(r"\d+", 0),
+        RegexRule(r"\d\s\w", 0),
+        RegexRule(r"\d+$", 0),
+        RegexRule(r"\b\d", 0),
+        LiteralRule("B", True),
+        LiteralRule("2", False),
+    ]:
+        assert rule.spans_lines(lines) == [rule.spans(line) for line in lines]
+
+    # matches which run over the end of a line are found again in each
+    # line on its own
+    assert RegexRule(r"\d\s\w", 0).spans_lines(lines) == [[], [(0, 3)], [], []]
+    assert RegexRule(r"\d+", 0).line_local
+    assert not RegexRule(r"\d+$", 0).line_local
+    assert not RegexRule(r"(?<=a)b", 0).line_local
@@ -0,0 +1,235 @@
+import subprocess
+import sys
+import threading
+import time
+import unittest.mock
+from io import StringIO
+from typing import Any, Callable
+
+from minimux.colour import AnsiColourManager
+from minimux.config import Command, Config
+from minimux.ingest import LineQueue
+from minimux.runner import Runner, stop_all
+from minimux.screen import MemoryScreen
+
+SCRIPT = """
+import os, signal, sys
+signal.signal(signal.SIGWINCH, lambda *_: print("size", *os.get_terminal_size()))
+print("tty", sys.stdout.isatty())
+print("size", *os.get_terminal_size())
+print("input", sys.stdin.read().strip())
+signal.pause()
+"""
+
+
+def make_command(path: str) -> Command:
+    ini = f"""
+        [main]
+        command = {sys.executable} {path}
+        pty = true
+        input = hello
+        padding = 0, 0
+    """
+    content = Config.from_file(StringIO(ini)).content
+    assert isinstance(content, Command)
+    return content
+
+
+def read_lines(runner: Runner, n: int) -> list[str]:
+    lines = []
+    while len(lines) < n:
+        data = runner.read()
+        assert data
+        lines += runner.reader.feed(data)
+    return lines
+
+
+def test_pty(tmp_path):
+    script = tmp_path / "script.py"
+    script.write_text(SCRIPT)
+    command = make_command(str(script))
+    runner = Runner(command, threading.RLock(), AnsiColourManager())
+    screen = MemoryScreen(24, 80)
+    runner.init(screen.window(), (10, 40, 0, 0))
+    assert runner.spawn()
+    assert read_lines(runner, 3) == ["tty True", "size 40 10", "input hello"]
+
+    # resizing the pane resizes the terminal
+    runner.init(screen.window(), (6, 30, 0, 0))
+    assert read_lines(runner, 1) == ["size 30 6"]
+
+    stop_all([runner], 5)
+    assert runner.read() == b""
+    runner.finish()
+    assert runner.master is None
+    # resizing once the terminal is closed does nothing
+    runner.init(screen.window(), (8, 30, 0, 0))
+
+
+STUBBORN = """
+import os, signal, sys, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+print("ready", os.getpid(), flush=True)
+time.sleep(30)
+"""
+
+GRACEFUL = """
+import os, signal, sys, time
+def stop(*_):
+    time.sleep(0.3)
+    open(sys.argv[1], "w").close()
+    sys.exit(0)
+signal.signal(signal.SIGTERM, stop)
+print("ready", os.getpid(), flush=True)
+time.sleep(30)
+"""
+
+
+def make_runner(command: str, shell: bool = False) -> Runner:
+    ini = f"""
+        [main]
+        command = {command}
+        shell = {shell}
+    """
+    content = Config.from_file(StringIO(ini)).content
+    assert isinstance(content, Command)
+    return Runner(content, threading.RLock(), AnsiColourManager())
+
+
+def alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # killed processes may be left as zombies
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_stop_all(tmp_path):
+    script = tmp_path / "stubborn.py"
+    script.write_text(STUBBORN)
+    stubborn = [make_runner(f"{sys.executable} {script}") for _ in range(2)]
+    # the shell exits when asked, leaving a child which ignores SIGTERM
+    shell = make_runner(f"'{sys.executable} {script} & wait'", shell=True)
+    quick = make_runner("sleep 30")
+    runners = stubborn + [shell, quick]
+    for runner in runners:
+        assert runner.spawn()
+    pids = [int(read_lines(r, 1)[0].split()[1]) for r in stubborn + [shell]]
+
+    progress: list[list[str]] = []
+    start = time.monotonic()
+    stop_all(
+        runners, 0.5, lambda: progress.append([r.describe_exit() for r in runners])
+    )
+    # every runner shares the one grace period
+    assert time.monotonic() - start < 1
+    assert progress[0] == ["stopping"] * 4
+    assert progress[-1] == ["killed", "killed"] + ["exited with status -15"] * 2
+    # the shell's child is killed along with it
+    deadline = time.monotonic() + 5
+    while any(alive(pid) for pid in pids):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stop_all_waits_for_group(tmp_path):
+    script = tmp_path / "graceful.py"
+    script.write_text(GRACEFUL)
+    done = tmp_path / "done"
+    # the shell exits at once, while its child takes a while to clean up
+    shell = make_runner(f"'{sys.executable} {script} {done} & wait'", shell=True)
+    assert shell.spawn()
+    read_lines(shell, 1)
+
+    start = time.monotonic()
+    stop_all([shell], 5)
+    # the child is left to finish rather than killed once the shell exits
+    assert done.exists()
+    assert time.monotonic() - start < 5
+    assert not shell.group_alive()
+
+
+def untitled(screen: MemoryScreen) -> tuple[Runner, Callable[[], list[str]]]:
+    """A runner without a title filling the screen, and a function which
+    draws it and returns the displayed lines"""
+    runner = make_runner("true")
+    runner.init(screen.window(), (screen.rows, screen.cols, 0, 0))
+    runner.ingest([f"line {i}" for i in range(6)])
+
+    def draw() -> list[str]:
+        runner.flush()
+        screen.doupdate()
+        return [line.rstrip() for line in screen.lines()]
+
+    return runner, draw
+
+
+def test_untitled_focus():
+    runner, draw = untitled(MemoryScreen(4, 30))
+
+    # a pane without a title shows its label in the corner while focused
+    runner.focus(True)
+    assert draw() == [f"{'line 2':24} main", "line 3", "line 4", "line 5"]
+    runner.buf.scroll(-1)
+    assert draw()[0] == f"{'line 1':19} main (+1)"
+    runner.buf.follow()
+    runner.focus(False)
+    assert draw() == ["line 2", "line 3", "line 4", "line 5"]
+
+
+def test_untitled_prompt():
+    runner, draw = untitled(MemoryScreen(4, 30))
+    runner.focus(True)
+    # the search prompt and its result are shown in place of the title
+    runner.prompt = "line 9"
+    assert draw()[0] == f"{'line 2':21} /line 9"
+    runner.query, runner.prompt = runner.prompt, None
+    runner.search()
+    assert draw()[0] == f"{'line 2':12} main (not found)"
+    runner.message = None
+    assert draw()[0] == f"{'line 2':24} main"
+
+
+def test_untitled_dropped():
+    runner, draw = untitled(MemoryScreen(4, 30))
+    runner.queue = LineQueue(2, "drop-oldest")
+    runner.ingest([f"more {i}" for i in range(5)])
+    runner.drain()
+    # dropped lines are noted even while the pane does not have focus
+    assert draw() == [
+        f"{'line 4':6} main (3 lines dropped)",
+        "line 5",
+        "more 3",
+        "more 4",
+    ]
+
+
+def test_kill_at_exit():
+    runner = make_runner("true")
+    assert runner.spawn()
+    assert runner.proc is not None
+    runner.proc.wait()
+    with unittest.mock.patch("os.killpg") as killpg:
+        # the process group id may have been reused once it was reaped
+        runner.kill_at_exit()
+        assert killpg.call_count == 0
+        killpg.side_effect = PermissionError
+        runner.kill()
+        assert killpg.call_count == 1
+
+
+def test_input_not_read():
+    runner = make_runner("true")
+    runner.command.input = "hello"
+    popen = subprocess.Popen
+
+    def exited(*args: Any, **kwargs: Any) -> subprocess.Popen:
+        proc = popen(*args, **kwargs)
+        proc.wait()
+        return proc
+
+    # the process exits before its input is written
+    with unittest.mock.patch("subprocess.Popen", exited):
+        assert runner.spawn()
+    assert runner.read() == b""
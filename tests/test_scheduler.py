@@ -0,0 +1,82 @@
+import threading
+from io import StringIO
+
+from minimux.colour import AnsiColourManager
+from minimux.config import Command, Config
+from minimux.runner import Runner
+from minimux.scheduler import Scheduler
+
+CONFIG = """
+    [main]
+    panels = db, cache, api, web
+
+    [db]
+    command = true
+    ready = ready
+
+    [cache]
+    command = true
+
+    [api]
+    command = true
+    depends_on = db, cache
+
+    [web]
+    command = true
+    depends_on = api
+"""
+
+
+def make_runners() -> dict[str, Runner]:
+    config = Config.from_file(StringIO(CONFIG))
+    lock = threading.RLock()
+    runners: dict[str, Runner] = {}
+    for command in config.commands():
+        runner = Runner(command, lock, AnsiColourManager())
+        runner.buf.resize(maxcols=80, maxrows=5)
+        runners[command.label] = runner
+    return runners
+
+
+def test_scheduler():
+    runners = make_runners()
+    scheduler = Scheduler({r.command.name: r for r in runners.values()})
+    assert runners["web"].buf.rows() == [("** Waiting for api **", 0)]
+
+    # commands without dependencies start together
+    assert scheduler.due() == [runners["db"], runners["cache"]]
+    assert scheduler.due() == []
+
+    runners["cache"].ready = True
+    runners["db"].match_ready(["starting"])
+    assert scheduler.due() == []
+    runners["db"].match_ready(["starting", "ready to accept connections"])
+    assert scheduler.due() == [runners["api"]]
+
+    # a command whose dependency exits before it is ready never starts
+    runners["api"].exited = True
+    assert scheduler.due() == []
+    assert runners["web"].exited
+    assert runners["web"].buf.rows()[-1] == (
+        "** Not started: api exited before it was ready **",
+        0,
+    )
+    assert not scheduler.pending
+
+
+def test_ready_dropped():
+    ini = """
+        [main]
+        command = true
+        ready = ^ready
+        ansi = true
+        overflow = drop-oldest
+        queue_size = 2
+    """
+    command = Config.from_file(StringIO(ini)).content
+    assert isinstance(command, Command)
+    runner = Runner(command, threading.RLock(), AnsiColourManager())
+    runner.ingest(["starting", "\x1b[32mready\x1b[0m", "a", "b", "c"])
+    # the ready line is dropped from the queue, but was seen as it was read
+    assert runner.queue is not None and runner.queue.dropped == 3
+    assert runner.ready
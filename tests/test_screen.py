@@ -0,0 +1,216 @@
+import curses
+import os
+import signal
+import sys
+import threading
+from io import StringIO
+
+import pytest
+
+from minimux import MiniMux
+from minimux.config import Config
+from minimux.screen import AnsiScreen, MemoryScreen, parse_keys
+
+CONFIG = """
+    [main]
+    title = Demo
+    panels = left, right
+
+    [left]
+    title = Left
+    command = true
+
+    [right]
+    vertical = true
+    panels = top, bottom
+
+    [top]
+    command = true
+
+    [bottom]
+    title = Bottom
+    command = true
+"""
+
+
+def test_memory_window():
+    screen = MemoryScreen(4, 6)
+    win = screen.window()
+    sub = win.subwin(2, 4, 1, 1)
+    sub.bkgdset(" ", 1 << 8)
+    sub.erase()
+    sub.move(0, 2)
+    sub.addstr("abc", curses.A_BOLD)
+    sub.insstr(1, 1, "xy")
+    screen.doupdate()
+    assert screen.lines() == ["      ", "   ab ", " cxy  ", "      "]
+    assert screen.attr(1, 3) == curses.A_BOLD | 1 << 8
+    assert screen.attr(0, 0) == 0
+    assert win.inch(1, 3) == ord("a") | curses.A_BOLD | 1 << 8
+    # the first update draws every cell
+    assert screen.frames[-1].cells == 24
+    assert screen.frames[-1].runs == 4
+    assert screen.frames[-1].writes == 5
+
+    # writing to the bottom right corner writes it and then fails
+    sub.move(1, 3)
+    with pytest.raises(curses.error):
+        sub.addstr("z")
+    with pytest.raises(curses.error):
+        sub.move(2, 0)
+
+    sub.setscrreg(0, 1)
+    with pytest.raises(curses.error):
+        sub.scroll(1)
+    sub.scrollok(True)
+    sub.scroll(1)
+    screen.doupdate()
+    assert screen.lines() == ["      ", " cxyz ", "      ", "      "]
+    assert screen.frames[-1].cells == 7
+
+
+def test_memory_getch():
+    screen = MemoryScreen(keys=[ord("a")])
+    win = screen.window()
+    win.nodelay(True)
+    assert win.getch() == ord("a")
+    assert win.getch() == -1
+    win.nodelay(False)
+    with pytest.raises(KeyboardInterrupt):
+        win.getch()
+
+
+def test_minimux_draw():
+    config = Config.from_file(StringIO(CONFIG))
+    screen = MemoryScreen(8, 24)
+    mm = MiniMux(config, screen=screen)
+    mm.runners = mm.get_runners(config.content)
+    mm.init(screen.window())
+    assert screen.lines() == [
+        "          Demo          ",
+        "────────────┬───────────",
+        "    Left    │           ",
+        "            │           ",
+        "            │           ",
+        "            ├───────────",
+        "            │  Bottom   ",
+        "            │           ",
+    ]
+    assert screen.frames[-1].cells == 8 * 24
+
+    left = mm.runners[":main:left"]
+    left.ingest(["one", "two", "three", "four", "five", "six"])
+    mm.paint()
+    assert [line[:12] for line in screen.lines()[2:]] == [
+        "    Left    ",
+        "two         ",
+        "three       ",
+        "four        ",
+        "five        ",
+        "six         ",
+    ]
+
+    # a line of output redraws only that line and the ones it scrolls
+    left.ingest(["7"])
+    mm.paint()
+    assert screen.frames[-1].writes == 1
+    assert screen.lines()[3][:12] == "three       "
+    assert screen.lines()[7][:12] == "7           "
+    assert screen.frames[-1].cells == 18
+
+    # nothing is drawn when nothing has changed
+    frames = len(screen.frames)
+    mm.paint()
+    assert len(screen.frames) == frames
+
+    # resizes are redrawn once they stop
+    screen.resize(8, 30)
+    mm.handle_input(screen.window(), screen.window().getch())
+    screen.resize(8, 20)
+    mm.handle_input(screen.window(), screen.window().getch())
+    mm.paint()
+    assert len(screen.frames) == frames
+    assert mm.resize_at is not None
+    mm.resize_at = 0
+    mm.paint()
+    assert len(screen.frames) == frames + 1
+    assert screen.lines()[1] == "──────────┬─────────"
+
+
+def test_ansi_screen():
+    r, w = os.pipe()
+    screen = AnsiScreen(fd_out=w)
+    screen._resize(2, 8)
+    win = screen.window()
+    red = screen.colour_manager().make_pair("#ff0000", None)
+    win.addstr(0, 0, "ab")
+    win.addstr(0, 4, "cd", red)
+    win.addch(1, 0, screen.acs("BSBS"))
+    screen.doupdate()
+    assert os.read(r, 1024).decode() == (
+        "\x1b[1;1H\x1b[0mab  \x1b[0;38;2;255;0;0mcd\x1b[0m  "
+        "\x1b[2;1H\x1b[0m─\x1b[0m       "
+    )
+
+    # only changed cells are sent, without repeating the attribute
+    win.addstr(0, 1, "x", red)
+    win.addstr(0, 7, "y", red)
+    screen.doupdate()
+    assert os.read(r, 1024).decode() == "\x1b[1;2H\x1b[0;38;2;255;0;0mx\x1b[1;8Hy"
+
+    # a short gap is rewritten instead of moved over
+    win.addstr(0, 0, "z")
+    win.addstr(0, 3, "z")
+    screen.doupdate()
+    assert os.read(r, 1024).decode() == (
+        "\x1b[1;1H\x1b[0mz\x1b[0;38;2;255;0;0mx\x1b[0m z"
+    )
+    os.close(r)
+    os.close(w)
+
+
+def test_memory_window_wide():
+    screen = MemoryScreen(2, 5)
+    win = screen.window()
+    win.addstr(0, 0, "a中e\u0301")
+    screen.doupdate()
+    assert screen.lines() == ["a中e\u0301 ", "     "]
+    assert screen.frames[-1].writes == 4
+
+    # a wide character which does not fit starts the next row
+    win.addstr(0, 3, "b文")
+    # overwriting half of a wide character blanks the other half
+    win.addstr(0, 2, "c")
+    screen.doupdate()
+    assert screen.lines() == ["a cb ", "文   "]
+    assert screen.changes() == []
+
+    # the changed runs cover both cells of a wide character
+    win.addstr(1, 0, "字")
+    assert screen.changes() == [(1, 0, 2)]
+
+    # only half of the last character inserted fits
+    win.insstr(1, 2, "中文")
+    screen.doupdate()
+    assert screen.lines() == ["a cb ", "字中 "]
+
+
+def test_parse_keys():
+    assert parse_keys(b"a\x1b[A\x1b[5~\x1b\x1b[Z\x1b[200~\r") == [
+        ord("a"),
+        curses.KEY_UP,
+        curses.KEY_PPAGE,
+        27,
+        curses.KEY_BTAB,
+        ord("\r"),
+    ]
+
+
+def test_minimux_selectors_stdin(monkeypatch):
+    config = Config.from_file(StringIO(CONFIG))
+    config.engine = "selectors"
+    # /dev/null cannot be registered with epoll
+    with open(os.devnull) as stdin:
+        monkeypatch.setattr(sys, "stdin", stdin)
+        threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        MiniMux(config, screen=MemoryScreen(8, 24)).run()
@@ -0,0 +1,78 @@
+import os
+
+from minimux.spill import SpillLog
+
+
+def test_spill_log(tmp_path):
+    log = SpillLog(str(tmp_path), segment_size=64)
+    for i in range(3000):
+        log.append(f"line {i}")
+    log.append("ünïcode")
+
+    assert len(log) == 3001
+    assert len(log.segments) > 1
+    assert log.text(0) == "line 0"
+    assert log.text(1500) == "line 1500"
+    assert log.text(3000) == "ünïcode"
+    assert list(log.lines(2998)) == ["line 2998", "line 2999", "ünïcode"]
+
+    # reading continues across segment boundaries
+    seg = log.segments[1]
+    assert list(log.lines(seg.first - 1))[:2] == [
+        f"line {seg.first - 1}",
+        f"line {seg.first}",
+    ]
+
+    # lines appended after a segment was mapped are still readable
+    log.append("appended")
+    assert log.text(3001) == "appended"
+
+
+def test_spill_log_find(tmp_path):
+    log = SpillLog(str(tmp_path), segment_size=1024)
+    for i in range(5000):
+        log.append("Traceback" if i in (10, 2500, 4000) else f"line {i}")
+
+    assert log.find("traceback", 4999, reverse=True) == 4000
+    assert log.find("traceback", 3999, reverse=True) == 2500
+    assert log.find("traceback", 10, reverse=True) == 10
+    assert log.find("traceback", 9, reverse=True) is None
+    assert log.find("TRACEBACK", 11) == 2500
+    assert log.find("traceback", 4001) is None
+    assert log.find("line 4999", 0) == 4999
+
+
+def test_spill_log_removes_old_segments(tmp_path):
+    log = SpillLog(str(tmp_path))
+    log.append("old")
+    log.close()
+    (tmp_path / "notes.txt").write_text("kept")
+
+    log = SpillLog(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["notes.txt"]
+    log.append("new")
+    assert log.text(0) == "new"
+
+
+def test_spill_log_find_unicode(tmp_path):
+    log = SpillLog(str(tmp_path), segment_size=8)
+    for line in ["plain ascii", "STRASSE", "École", "straße", "more ascii"]:
+        log.append(line)
+    assert [segment.ascii for segment in log.segments] == [True, True, False, True]
+
+    # case is folded the same way as for lines in memory
+    assert log.find("école", 0) == 2
+    assert log.find("ÉCOLE", 4, reverse=True) == 2
+    assert log.find("straße", 0) == 1
+    assert log.find("ß", 2) == 3
+    assert log.find("SS", 4, reverse=True) == 3
+    assert log.find("é", 3) is None
+
+
+def test_spill_log_close(tmp_path):
+    log = SpillLog(str(tmp_path))
+    log.append("kept")
+    log.close()
+    # lines arriving after the log is closed are not logged
+    log.append("ignored")
+    assert len(log) == 1
@@ -0,0 +1,46 @@
+import json
+import threading
+
+from minimux.stats import Stats, StatsFile, describe, runner_stats
+
+
+def test_stats():
+    stats = Stats("lines", "wait")
+    stats.add("lines", 10)
+    stats.sample(1.0)
+    assert stats.rates == {"lines": 0.0, "wait": 0.0}
+
+    stats.add("lines", 30)
+    with stats.timed("wait"):
+        pass
+    with stats.locked(threading.RLock(), "wait"):
+        pass
+    stats.sample(3.0)
+    assert stats.totals["lines"] == 40
+    assert stats.rates["lines"] == 15
+    assert stats.totals["wait"] > 0
+    assert stats.snapshot()["rates"]["lines"] == 15
+
+
+def test_describe():
+    stats = runner_stats()
+    stats.sample(0.0)
+    stats.add("lines", 2500)
+    stats.add("bytes", 3_000_000)
+    stats.add("rule_time", 0.002)
+    stats.add("flushes", 4)
+    stats.add("flush_time", 0.004)
+    stats.sample(1.0)
+    assert describe("api", stats) == (
+        "api: 2.5k lines/s 3.0MB/s  rules 2.0ms/s  flush 4/s 1.00ms"
+    )
+
+
+def test_stats_file(tmp_path):
+    path = tmp_path / "stats.json"
+    stats_file = StatsFile(str(path))
+    stats_file.write({"runners": {"api": {"lines": 1}}})
+    snapshot = json.loads(path.read_text())
+    assert snapshot["runners"] == {"api": {"lines": 1}}
+    assert snapshot["uptime"] >= 0
+    assert [p.name for p in tmp_path.iterdir()] == ["stats.json"]
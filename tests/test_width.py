@@ -0,0 +1,32 @@
+from minimux.width import center, char_width, split, truncate, width
+
+
+def test_char_width():
+    assert char_width("a") == 1
+    assert char_width("é") == 1
+    assert char_width("\u0301") == 0
+    assert char_width("\u200b") == 0
+    assert char_width("中") == 2
+    assert char_width("ｱ") == 1
+    assert char_width("Ａ") == 2
+    assert char_width("😀") == 2
+    assert width("a中\u0301b") == 4
+
+
+def test_split():
+    assert split("abcdefg", 3) == [(0, 3), (3, 6), (6, 9)]
+    assert split("", 3) == [(0, 0)]
+    assert split("中文字", 4) == [(0, 2), (2, 3)]
+    # a wide character which does not fit starts the next row
+    assert split("ab中", 3) == [(0, 2), (2, 3)]
+    # combining characters stay on the row of the character before them
+    assert split("abce\u0301d", 4) == [(0, 5), (5, 6)]
+    # a wide character is still shown in a single column
+    assert split("中文", 1) == [(0, 1), (1, 2)]
+
+
+def test_truncate():
+    assert truncate("hello", 3) == "hel"
+    assert truncate("中文字", 5) == "中文"
+    assert center("中", 5) == " 中  "
+    assert center("中文字", 5) == "中文 "